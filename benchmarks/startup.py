@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+    startup.py
+    ~~~~~~~~~~
+
+    Cold-start benchmark for todo.
+
+Measures how long importing todo takes and the wall time of common headless
+commands, each in a fresh interpreter against a scratch todo file. Times are
+reported as the median overhead on top of a bare `python -c pass`, so they
+mostly don't depend on how fast the machine starts Python.
+
+The results are compared against the budgets in startup_budget.json. If any
+measurement exceeds its budget by more than the file's tolerance, the
+benchmark exits with status 1.
+
+usage: python benchmarks/startup.py [--runs N] [--update]
+
+    --runs N    Amount of runs per measurement (default: 15).
+    --update    Write the measured times to startup_budget.json as the new
+                  budgets instead of checking them.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BUDGET_FILE = os.path.join(BENCH_DIR, 'startup_budget.json')
+
+# Commands are run as `python -m todo ...`, which uses todo's cached bytecode
+#   instead of recompiling the script on every run. {n} is replaced by the
+#   run number (starting at 1) so every run works on a different task or
+#   creates something new.
+COMMANDS = {
+    'add':     ['bench', '-a', 'added {n}'],
+    'check':   ['bench', '-c', '{n}'],
+    'uncheck': ['bench', '-u', '{n}'],
+    'insert':  ['bench', '-i', '1', 'inserted {n}'],
+    'delete':  ['bench', '-d', '2'],
+    'create':  ['create', 'bench{n}'],
+}
+
+
+def run(args, env):
+    """Return the wall time, in ms, of running Python with 'args'."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], env=env, check=True,
+                   stdout=subprocess.DEVNULL, stdin=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+
+def import_time(env):
+    """Return the cumulative import time of todo, in ms."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import todo'],
+                            env=env, check=True, capture_output=True, text=True)
+    last = result.stderr.strip().splitlines()[-1]
+    return int(last.split('|')[1]) / 1000
+
+
+def measure(runs):
+    """Return the median time of every measurement, in ms."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        todo_file = os.path.join(tmp_dir, '.todo')
+        tasks = {str(i): f'task {i}' for i in range(1, 1001)}
+        with open(todo_file, 'w') as f:
+            json.dump({'bench': {'sections': {}, 'tasks': tasks, 'check': []}}, f)
+
+        env = dict(os.environ, TODO_FILE=todo_file, PYTHONPATH=REPO_DIR)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+        # warm up the bytecode and OS caches
+        import_time(env)
+        run(['-m', 'todo', 'bench', '-a', 'warm up'], env)
+
+        baseline = statistics.median(run(['-c', 'pass'], env) for _ in range(runs))
+        results = {'import': statistics.median(import_time(env) for _ in range(runs))}
+        for name, args in COMMANDS.items():
+            times = [run(['-m', 'todo', *(arg.format(n=n) for arg in args)], env)
+                     for n in range(1, runs + 1)]
+            results[name] = max(statistics.median(times) - baseline, 0)
+        return results
+
+
+def main():
+    """Run the benchmark, used when ran as a script."""
+    parser = argparse.ArgumentParser(description='Cold-start benchmark for todo.')
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--update', action='store_true')
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+
+    if args.update:
+        budget['budgets_ms'] = {name: round(ms, 1) for name, ms in results.items()}
+        with open(BUDGET_FILE, 'w') as f:
+            json.dump(budget, f, indent=4)
+            f.write('\n')
+
+    failed = []
+    limit = 1 + budget['tolerance']
+    for name, ms in results.items():
+        allowed = budget['budgets_ms'][name] * limit
+        status = 'ok' if ms <= allowed else 'OVER BUDGET'
+        print(f'{name:<10} {ms:8.1f} ms   (budget {budget["budgets_ms"][name]:.1f} ms)   {status}')
+        if ms > allowed:
+            failed.append(name)
+
+    if failed:
+        sys.exit(f'error: startup regression in {", ".join(failed)}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,10 @@
+import argparse
+import curses
+import json
+import os
 import pytest
 import sys
+import textwrap
 import todo
 from todo import Todo
 
@@ -223,3 +228,893 @@ class TestTodo(object):
         updated_file = self.update_file()
         assert updated_file == ['{"test": {"sections": [{"name": "sect1", "tasks": [1]}], "tasks": {"1": "task1", "2": "task2"}, "check": [2]}}']
 
+
+
+def make_args(project=None, section=None, **flags):
+    """Return a Namespace like the one create_parser() builds for normal mode."""
+    args = dict(project=project, section=section, create=False, delete=False,
+                archive=False, add=None, rename=None, insert=None,
+                task_delete=None, check=None, uncheck=None, move_to_proj=None,
+                move_to_sect=None, section_add=None, section_delete=None,
+                unsect=None)
+    args.update(flags)
+    return argparse.Namespace(**args)
+
+
+@pytest.fixture
+def todo_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['todo.py', 'test'])
+    path = tmp_path / '.todo'
+    path.write_text('{"test": {"sections": {"sect1": [1]}, "tasks": {"1": "task1"}, "check": []}}')
+    return str(path)
+
+
+class TestJournalStorage(object):
+    def test_save_appends_changes(self, todo_file):
+        storage = todo.JournalStorage(todo_file)
+        test_todo = Todo(None, make_args('test'), todo_file, storage)
+        test_todo.add('task2', 'test', 'sect1')
+        test_todo.args.check = [2]
+        test_todo.check_uncheck(True)
+
+        # snapshot is untouched, journal holds the changes
+        with open(todo_file) as f:
+            assert json.load(f)['test']['tasks'] == {'1': 'task1'}
+        with open(storage.journal_file) as f:
+            assert len(f.readlines()) == 6
+
+        data = todo.JournalStorage(todo_file).load()
+        assert data['test'] == {'sections': {'sect1': [1, 2]},
+                                'tasks': {'1': 'task1', '2': 'task2'},
+                                'check': [2], 'order': [1, 2], 'next': 3}
+
+    def test_compact(self, todo_file):
+        storage = todo.JournalStorage(todo_file, compact_size=0)
+        test_todo = Todo(None, make_args('test'), todo_file, storage)
+        for i in range(2, 6):
+            test_todo.add(f'task{i}', 'test')
+
+        with open(todo_file) as f:
+            snapshot = json.load(f)
+        assert len(snapshot['test']['tasks']) > 1
+        assert todo.JournalStorage(todo_file).load() == test_todo.data
+
+    def test_stale_journal_ignored(self, todo_file):
+        storage = todo.JournalStorage(todo_file)
+        test_todo = Todo(None, make_args('test'), todo_file, storage)
+        test_todo.add('task2', 'test')
+
+        # the snapshot is replaced without the journal being reset
+        todo.Storage(todo_file).save({'other': {'sections': {}, 'tasks': {}, 'check': [],
+                                                'order': [], 'next': 1}}, [])
+        assert list(storage.load()) == ['other']
+
+    def test_save_after_stale_journal(self, todo_file):
+        storage = todo.JournalStorage(todo_file)
+        Todo(None, make_args('test'), todo_file, storage).add('task2', 'test')
+        todo.Storage(todo_file).save({'other': {'sections': {}, 'tasks': {}, 'check': [],
+                                                'order': [], 'next': 1}}, [])
+
+        storage = todo.JournalStorage(todo_file)
+        Todo(None, make_args('other'), todo_file, storage).add('task1', 'other')
+        data = todo.JournalStorage(todo_file).load()
+        assert list(data) == ['other'] and data['other']['tasks'] == {'1': 'task1'}
+
+    def test_rename_keeps_order(self):
+        data = {'a': 1, 'b': 2, 'c': 3}
+        todo.apply_change(data, ['rename', ['b'], 'd'])
+        assert list(data.items()) == [('a', 1), ('d', 2), ('c', 3)]
+        with pytest.raises(ValueError):
+            todo.apply_change(data, ['rename', ['a'], 'c'])
+
+    def test_rename_section(self, todo_file):
+        todo.main(todo_file, ['test', '--sectionadd=other'])
+        with pytest.raises(SystemExit) as e:
+            todo.main(todo_file, ['test', 'sect1', '--rename=other'])
+        assert 'already exists' in e.value.code
+
+        todo.main(todo_file, ['test', 'sect1', '--rename=first section'])
+        sections = todo.Storage(todo_file).load()['test']['sections']
+        assert sections == {'first section': [1], 'other': []}
+
+
+class TestTaskIDs(object):
+    def load(self, todo_file):
+        return Todo(None, make_args('test'), todo_file)
+
+    def test_upgrade(self, todo_file):
+        data = todo.Storage(todo_file).load()
+        assert data['test']['order'] == [1]
+        assert data['test']['next'] == 2
+
+    def test_delete_keeps_ids(self, todo_file):
+        test_todo = self.load(todo_file)
+        for i in range(2, 6):
+            test_todo.add(f'task{i}', 'test', 'sect1')
+        test_todo.args.check = [5]
+        test_todo.check_uncheck(True)
+
+        test_todo = self.load(todo_file)
+        test_todo.args.task_delete = [2, 4]
+        test_todo.task_delete()
+
+        project = todo.Storage(todo_file).load()['test']
+        assert project['tasks'] == {'1': 'task1', '3': 'task3', '5': 'task5'}
+        assert project['order'] == [1, 3, 5]
+        assert project['sections'] == {'sect1': [1, 3, 5]}
+        assert project['check'] == [5]
+
+    def test_insert(self, todo_file):
+        test_todo = self.load(todo_file)
+        test_todo.add('task2', 'test')
+        test_todo.args.insert = ['1', 'task0']
+        test_todo.insert()
+
+        project = todo.Storage(todo_file).load()['test']
+        assert [project['tasks'][str(i)] for i in project['order']] == ['task0', 'task1', 'task2']
+
+        test_todo.args.insert = ['4', 'task9']
+        with pytest.raises(SystemExit) as excinfo:
+            test_todo.insert()
+        assert str(excinfo.value) == 'error: there are only 3 task positions.'
+
+    def test_task_order(self):
+        order = todo.TaskOrder(range(2000))
+        order.insert(1500, -1)
+        assert order[1500] == -1 and order[1501] == 1500
+        assert order.pop(0) == 0
+        assert list(order)[:2] == [1, 2]
+        assert len(order) == 2000
+        assert all(len(block) <= 2 * order.load for block in order.blocks)
+
+        order.remove(1500)
+        assert 1500 not in order and order[1500] == 1501
+        with pytest.raises(ValueError):
+            order.remove(1500)
+        empty = todo.TaskOrder()
+        empty.insert(-1, 7)
+        assert list(empty) == [7]
+
+
+class TestTaskSet(object):
+    def test_check_set(self, todo_file):
+        test_todo = Todo(None, make_args('test'), todo_file)
+        for i in range(2, 5):
+            test_todo.add(f'task{i}', 'test')
+        test_todo.args.check = [3, 1]
+        test_todo.check_uncheck(True)
+
+        with open(todo_file) as f:
+            assert json.load(f)['test']['check'] == [3, 1]
+        check = todo.Storage(todo_file).load()['test']['check']
+        assert isinstance(check, todo.TaskSet)
+        assert 3 in check and 2 not in check
+
+
+class TestTaskLabels(object):
+    def test_label_index(self):
+        tasks = todo.TaskLabels({'1': 'a', '2': 'b', '3': 'a'})
+        assert tasks.find('a') == 1 and tasks.find('c') is None
+
+        tasks['2'] = 'c'
+        del tasks['1']
+        assert tasks.find('b') is None
+        assert tasks.find('c') == 2
+        assert tasks.find('a') == 3
+
+        del tasks['3']
+        assert tasks.find('a') is None and 'a' not in tasks.ids
+
+    def test_duplicate_label(self, todo_file):
+        test_todo = Todo(None, make_args('test'), todo_file)
+        test_todo.add('task2', 'test')
+        with pytest.raises(SystemExit):
+            test_todo.add('task2', 'test')
+
+        test_todo = Todo(None, make_args('test'), todo_file)
+        test_todo.args.task_delete = [2]
+        test_todo.task_delete()
+        test_todo.add('task2', 'test')
+        assert todo.Storage(todo_file).load()['test']['tasks'] == {'1': 'task1', '3': 'task2'}
+
+
+class TestSections(object):
+    def test_section_index(self, todo_file):
+        test_todo = Todo(None, make_args('test'), todo_file)
+        test_todo.add('task2', 'test', 'sect1')
+        test_todo.add('task3', 'test')
+        test_todo.args.rename = 'renamed'
+        test_todo.section = 'sect1'
+        test_todo.rename()
+
+        sections = todo.Storage(todo_file).load()['test']['sections']
+        assert sections == {'renamed': [1, 2]}
+        assert sections.section_of(2) == 'renamed'
+        assert sections.section_of(3) is None
+        sections['other'] = [3]
+        with pytest.raises(ValueError):
+            sections.rename('renamed', 'other')
+        assert sections.section_of(2) == 'renamed'
+        del sections['other']
+
+        sections['renamed'].remove(1)
+        del sections['renamed']
+        assert sections.index == {}
+
+
+class TestLoadCache(object):
+    def test_parsed_once(self, todo_file):
+        storage = todo.Storage(todo_file)
+        parser = todo.create_parser(None, todo_file, storage)
+        test_todo = Todo(None, parser, todo_file, storage)
+        assert storage.load() is test_todo.data
+
+        # changes on disk are picked up
+        todo.Storage(todo_file).save({}, [])
+        assert storage.load() == {}
+
+    def test_disk_cache(self, todo_file, monkeypatch):
+        data = todo.Storage(todo_file, cache=True).load()
+
+        def parse(self):
+            raise AssertionError('cache was not used')
+
+        monkeypatch.setattr(todo.Storage, 'parse', parse)
+        assert todo.Storage(todo_file, cache=True).load() == data
+
+        # the cache is invalidated when the file changes
+        with open(todo_file, 'w') as f:
+            f.write('{}')
+        with pytest.raises(AssertionError):
+            todo.Storage(todo_file, cache=True).load()
+
+
+class TestShardedStorage(object):
+    def test_split(self, todo_file):
+        data = todo.ShardedStorage(todo_file).load()
+        assert list(data) == ['test']
+        assert data['test']['tasks'] == {'1': 'task1'}
+
+    def test_single_project(self, todo_file, monkeypatch):
+        test_todo = Todo(None, make_args(None, create=True), todo_file, todo.ShardedStorage(todo_file))
+        test_todo.project = 'other'
+        test_todo.create()
+
+        storage = todo.ShardedStorage(todo_file)
+        loaded = []
+        load_project = storage.load_project
+        monkeypatch.setattr(storage, 'load_project',
+                            lambda name: loaded.append(name) or load_project(name))
+        test_todo = Todo(None, make_args('other'), todo_file, storage)
+        test_todo.add('task1', 'other')
+        assert loaded == ['other']
+
+        data = todo.ShardedStorage(todo_file).load()
+        assert list(data) == ['test', 'other']
+        assert data['other']['tasks'] == {'1': 'task1'}
+
+    def test_rename_delete(self, todo_file):
+        storage = todo.ShardedStorage(todo_file)
+        test_todo = Todo(None, make_args('test', rename='renamed'), todo_file, storage)
+        test_todo.rename()
+        assert list(todo.ShardedStorage(todo_file).load()) == ['renamed']
+
+        test_todo = Todo(None, make_args(None, delete=True), todo_file, storage)
+        test_todo.project = 'renamed'
+        test_todo.delete()
+        assert todo.ShardedStorage(todo_file).load() == {}
+        assert os.listdir(storage.shard_dir) == ['index.json']
+
+
+class TestSqliteStorage(object):
+    def test_import_and_mutate(self, todo_file):
+        storage = todo.SqliteStorage(todo_file)
+        test_todo = Todo(None, make_args('test', check=[1]), todo_file, storage)
+        test_todo.add('task2', 'test')
+        test_todo.args.insert = ['2', 'task3']
+        test_todo.insert()
+        test_todo.check_uncheck(True)
+        test_todo.args.task_delete = [3]
+        test_todo.task_delete()
+
+        project = todo.SqliteStorage(todo_file).load()['test']
+        assert project['order'] == [1, 3]
+        assert project['tasks'] == {'1': 'task1', '3': 'task3'}
+        assert project['check'] == [1]
+        assert project['sections'] == {'sect1': [1]}
+        assert project['next'] == 4
+
+    def test_repeated_inserts(self, todo_file):
+        storage = todo.SqliteStorage(todo_file)
+        test_todo = Todo(None, make_args('test'), todo_file, storage)
+        test_todo.add('last', 'test')
+        for i in range(100):
+            test_todo.args.insert = ['2', f'inserted{i}']
+            test_todo.insert()
+
+        project = todo.SqliteStorage(todo_file).load()['test']
+        labels = [project['tasks'][str(task_id)] for task_id in project['order']]
+        assert labels == ['task1'] + [f'inserted{i}' for i in reversed(range(100))] + ['last']
+
+    def test_unsupported_change(self, todo_file):
+        storage = todo.SqliteStorage(todo_file)
+        data = storage.load()
+        with pytest.raises(ValueError):
+            storage.save(data, [['set', ['test', 'order'], [1]]])
+        assert todo.SqliteStorage(todo_file).load()['test']['order'] == [1]
+
+class TestHeadless(object):
+    def test_mutations_skip_curses(self, todo_file, monkeypatch):
+        def initscr():
+            raise AssertionError('curses was initialized')
+
+        monkeypatch.setattr(curses, 'initscr', initscr)
+        monkeypatch.setattr(sys, 'argv', ['todo.py', 'test', '-a', 'task2'])
+        todo.main(todo_file)
+        monkeypatch.setattr(sys, 'argv', ['todo.py', 'test', '-c', '2'])
+        todo.main(todo_file)
+
+        project = todo.Storage(todo_file).load()['test']
+        assert project['tasks'] == {'1': 'task1', '2': 'task2'}
+        assert project['check'] == [2]
+
+
+class TestLayout(object):
+    def test_project_lines(self):
+        projects = todo.upgrade({'test': {'sections': {'sect1': [1]},
+                                          'tasks': {'1': 'task1', '2': 'task2'},
+                                          'check': [2], 'order': [1, 2], 'next': 3}})
+        lines = list(todo.Layout().project(projects, 'test'))
+
+        assert lines[0].text.startswith(' !!! r   "test"')
+        assert all(len(line.text) == 58 for line in lines)
+        tasks = [line for line in lines if line.task_id]
+        assert [(line.section, line.task_id) for line in tasks] == [('sect1', 1), (None, 2)]
+        assert '✓ task2' in tasks[1].text
+
+
+class TestWrapCache(object):
+    def test_lru(self):
+        cache = todo.WrapCache(size=2)
+        labels = [f'{word} ' * 20 for word in ('one', 'two', 'three')]
+
+        assert cache.wrap('short', 42) == ('short',)
+        assert cache.wrap(labels[0], 42) == tuple(textwrap.wrap(labels[0], width=42))
+        cache.wrap(labels[1], 42)
+        cache.wrap(labels[0], 42)
+        cache.wrap(labels[2], 42)
+        # 'two' was the least recently used
+        assert [label for project, label, width in cache.wraps] == [labels[0], labels[2]]
+
+    def test_padded_per_project(self):
+        cache = todo.WrapCache()
+        label = 'long ' * 20
+        lines = cache.wrap(label, 42, 'test', '  ', 50)
+        assert lines == tuple([textwrap.wrap(label, width=42)[0].ljust(50)] +
+                              ['  ' + line.ljust(50) for line in textwrap.wrap(label, width=42)[1:]])
+        assert cache.wrap(label, 42, 'test', '  ', 50) is lines
+        assert cache.wrap(label, 42, 'other') == tuple(textwrap.wrap(label, width=42))
+        assert list(cache.wraps) == [('test', label, 42), ('other', label, 42)]
+
+    def test_kept_per_project(self, todo_file, monkeypatch):
+        monkeypatch.setenv('TODO_CACHE', '1')
+        label = 'long ' * 20
+        cache = todo.get_wrap_cache(todo_file)
+        cache.wrap(label, 42, 'test')
+        cache.wrap(label, 44, 'other')
+        cache.save()
+
+        assert todo.get_wrap_cache(todo_file) is cache
+        cache = todo.WrapCache(f'{todo_file}.wrap')
+        cache.load('test')
+        assert list(cache.wraps) == [('test', label, 42)]
+        monkeypatch.setattr(textwrap, 'wrap', None)
+        assert cache.wrap(label, 42, 'test') == cache.wraps['test', label, 42][0]
+        assert not cache.dirty
+
+
+class TestStream(object):
+    def test_plain_when_not_a_tty(self, todo_file, capsys):
+        todo.main(todo_file)
+
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0] == ' !!! r   "test"'
+        assert '\x1b' not in ''.join(lines)
+        assert any(line.endswith('□ task1') for line in lines)
+
+    def test_color_flag(self, todo_file, capsys, monkeypatch):
+        monkeypatch.setattr(sys, 'argv', ['todo.py', '--color', 'test', 'sect1'])
+        todo.main(todo_file)
+
+        out = capsys.readouterr().out
+        assert '\x1b[38;5;203;48;5;167m !!! \x1b[0m' in out
+        assert 'task1' in out
+
+    def test_no_arguments(self, todo_file, capsys):
+        todo.main(todo_file, ['create', 'other'])
+        with pytest.raises(SystemExit) as e:
+            todo.main(todo_file, [])
+
+        assert not e.value.code
+        lines = capsys.readouterr().out.splitlines()
+        assert ' !!! r   "test"' in lines and ' !!! g   "other"' in lines
+
+
+class TestLineBuffer(object):
+    def lines(self, generated):
+        for project in ('a', 'b', 'c'):
+            for _ in range(10):
+                generated.append(project)
+                yield todo.Line(None, [], project)
+
+    def test_lazy_window(self):
+        generated = []
+        buffer = todo.LineBuffer(self.lines(generated))
+
+        assert len(buffer.window(5, 3)) == 3
+        assert len(generated) == 8
+        buffer.fill(None)
+        assert buffer.done and len(buffer) == 30
+
+    def test_project_rows(self):
+        buffer = todo.LineBuffer(self.lines([]))
+
+        assert buffer.project_row(0, 1) == 10
+        assert buffer.project_row(10, 1) == 20
+        assert buffer.project_row(25, 1) is None
+        assert buffer.project_row(25, -1) == 20
+        assert buffer.project_row(20, -1) == 10
+        assert buffer.project_row(0, -1) == 0
+
+    def test_item_rows(self, todo_file):
+        todo.main(todo_file, ['test', '-a', 'task2 ' * 20])
+        data = todo.Storage(todo_file).load()
+        buffer = todo.LineBuffer(todo.Layout().all(data))
+        items, rows = [], []
+        row = buffer.item_row(0, 1)
+        while row is not None:
+            line = buffer.buffer[row]
+            items.append((line.section, line.task_id))
+            rows.append(row)
+            row = buffer.item_row(row + 1, 1)
+
+        # the banner, the section's header, and each task's first line
+        assert items == [(None, None), ('sect1', None), ('sect1', 1), (None, 2)]
+        assert buffer.buffer[rows[-1] + 1].task_id == 2
+        assert buffer.item_row(len(buffer) + 5, -1) == rows[-1]
+        assert buffer.item_row(rows[-1] - 1, -1) == rows[-2]
+
+
+class TestMenu(object):
+    def test_plan(self):
+        rows = [(todo.Line(None, [(str(i), 0, False)]), False) for i in range(10)]
+
+        assert todo.Menu.plan(rows, rows) == (10, 0)
+        # a check mark flips
+        flipped = rows[:4] + [(rows[4][0], True)] + rows[5:]
+        assert todo.Menu.plan(rows, flipped) == (4, 0)
+        # a label wraps onto another line: shift the rows below it down
+        assert todo.Menu.plan(rows, rows[:3] + [rows[3], rows[0]] + rows[4:9]) == (4, 1)
+        # scrolling down a line: shift everything up
+        assert todo.Menu.plan(rows, rows[1:] + [None]) == (0, -1)
+
+
+class TestSession(object):
+    class Session(todo.Session):
+        """A session whose questions are answered in advance."""
+        def __init__(self, todo_file, answers):
+            super().__init__(todo_file, todo.Storage(todo_file))
+            self.answers = list(answers)
+            self.reload(force=True)
+
+        def ask(self, question, answer=''):
+            return self.answers.pop(0)
+
+        def confirm(self, question):
+            return self.answers.pop(0) == 'y'
+
+        def go_to(self, task_id):
+            self.select(('test', None, task_id))
+            assert self.buffer.buffer[self.row].task_id == task_id
+
+    def test_commands(self, todo_file):
+        session = self.Session(todo_file, ['task2', 'n', 'y'])
+        session.add()
+        assert session.buffer.buffer[session.row].task_id == 2
+        session.go_to(1)
+        session.toggle()
+        assert session.message == 'checked task #1.'
+
+        # nothing's written until the keyboard has been idle
+        assert todo.Storage(todo_file).load()['test']['check'] == []
+        session.storage.sync()
+        assert list(todo.Storage(todo_file).load()['test']['check']) == [1]
+
+        session.delete()
+        assert not session.storage.ops
+        session.delete()
+        session.storage.sync()
+        assert dict(todo.Storage(todo_file).load()['test']['tasks']) == {'2': 'task2'}
+
+    def test_relayout_changed_projects(self, todo_file):
+        todo.main(todo_file, ['create', 'other'])
+        todo.main(todo_file, ['other', '-a', 'task2'])
+        session = self.Session(todo_file, [])
+        session.buffer.fill(None)
+        test_lines = [line for line in session.buffer.buffer if line.project == 'test']
+        session.select(('other', None, 1))
+        session.toggle()
+
+        # the lines of 'test' are kept; those of 'other' are laid out again
+        assert session.buffer.buffer[:len(test_lines)] == test_lines
+        assert all(a is b for a, b in zip(session.buffer.buffer, test_lines))
+        assert session.buffer.buffer[session.row].segments[1][0].endswith('✓ ')
+
+    def test_move_and_errors(self, todo_file):
+        todo.main(todo_file, ['test', '-a', 'task2'])
+        session = self.Session(todo_file, ['test', 'sect1', 'nowhere', ''])
+        session.go_to(2)
+        session.move()
+        assert session.buffer.buffer[session.row].section == 'sect1'
+        session.move()
+        assert session.message == 'error: project "nowhere" does not exist.'
+
+        session.select(('test', None, None))
+        session.toggle()
+        assert session.message == 'select a task first.'
+        session.storage.sync()
+        assert list(todo.Storage(todo_file).load()['test']['sections']['sect1']) == [1, 2]
+
+
+class TestBatch(object):
+    def run(self, todo_file, tmp_path, commands):
+        path = tmp_path / 'commands'
+        path.write_text(commands)
+        todo.main(todo_file, ['batch', str(path)])
+
+    def test_one_write(self, todo_file, tmp_path, monkeypatch):
+        saves = []
+        save = todo.Storage.save
+        monkeypatch.setattr(todo.Storage, 'save',
+                            lambda self, data, changes: saves.append(changes) or save(self, data, changes))
+        self.run(todo_file, tmp_path, '# setup\n'
+                                      'create other\n'
+                                      'test -a "task 2" sect1\n'
+                                      '\n'
+                                      'test -c 1 2\n'
+                                      'test -mp 1 other\n')
+
+        assert len(saves) == 1
+        data = todo.Storage(todo_file).load()
+        assert data['test']['tasks'] == {'2': 'task 2'}
+        assert data['test']['check'] == [2]
+        assert data['other']['tasks'] == {'1': 'task1'}
+
+    def test_all_or_nothing(self, todo_file, tmp_path):
+        with open(todo_file) as f:
+            before = f.read()
+
+        with pytest.raises(SystemExit) as e:
+            self.run(todo_file, tmp_path, 'test -a task2\ntest -a task2\n')
+        assert str(e.value.code).startswith('line 2: task "task2" already exists')
+        with open(todo_file) as f:
+            assert f.read() == before
+
+
+class TestExportImport(object):
+    @pytest.mark.parametrize('fmt', todo.RECORD_FORMATS)
+    def test_round_trip(self, todo_file, tmp_path, capsys, fmt):
+        test_todo = Todo(None, make_args('test'), todo_file)
+        test_todo.add('task2', 'test')
+        test_todo.args.check = [2]
+        test_todo.check_uncheck(True)
+        test_todo.args.section_add = 'empty'
+        test_todo.section_add()
+
+        todo.main(todo_file, ['export', '-f', fmt])
+        exported = capsys.readouterr().out
+        path = tmp_path / f'tasks.{fmt}'
+        path.write_text(exported)
+
+        other_file = str(tmp_path / 'other.todo')
+        with open(other_file, 'w') as f:
+            f.write('{}')
+        todo.main(other_file, ['import', str(path)])
+        assert todo.Storage(other_file).load() == todo.Storage(todo_file).load()
+
+    def test_import_is_all_or_nothing(self, todo_file, tmp_path):
+        path = tmp_path / 'tasks.jsonl'
+        path.write_text('{"project": "new", "label": "a"}\n'
+                        '{"project": "test", "label": "task1"}\n')
+
+        with pytest.raises(SystemExit) as e:
+            todo.main(todo_file, ['import', str(path)])
+        assert str(e.value.code).startswith('line 2: error: task "task1" already exists')
+        assert list(todo.Storage(todo_file).load()) == ['test']
+
+
+class TestArchive(object):
+    def test_archive_all(self, todo_file, capsys):
+        test_todo = Todo(None, make_args('test'), todo_file)
+        test_todo.new_project('other')
+        for i in range(2, 6):
+            test_todo.add(f'task{i}', 'test', 'sect1' if i % 2 else None)
+            test_todo.add(f'task{i}', 'other')
+        test_todo.args.check = [1, 3, 4]
+        test_todo.check_uncheck(True)
+
+        test_todo = Todo(None, make_args(archive=True, jobs=2, timing=True), todo_file)
+        test_todo.archive()
+
+        assert 'test: archived 3 tasks in' in capsys.readouterr().out
+        data = todo.Storage(todo_file).load()
+        assert data['test']['order'] == [2, 5]
+        assert data['test']['tasks'] == {'2': 'task2', '5': 'task5'}
+        assert data['test']['sections'] == {'sect1': [5]}
+        assert data['test']['check'] == []
+        assert data['other']['order'] == [1, 2, 3, 4]
+
+    def test_jobs_without_shared_connection(self, todo_file, monkeypatch):
+        import sqlite3
+
+        monkeypatch.setattr(sqlite3, 'threadsafety', 1)
+        test_todo = Todo(None, make_args('test', check=[1]), todo_file, todo.SqliteStorage(todo_file))
+        test_todo.new_project('other')
+        test_todo.check_uncheck(True)
+
+        storage = todo.SqliteStorage(todo_file)
+        Todo(None, make_args(archive=True, jobs=2), todo_file, storage).archive()
+        assert not storage.threadsafe
+        assert todo.SqliteStorage(todo_file).load()['test']['order'] == []
+
+    def test_jobs_positive(self, todo_file):
+        for jobs in ('0', '-1', 'x'):
+            with pytest.raises(SystemExit) as e:
+                todo.main(todo_file, ['archive', '-j', jobs])
+            assert 'invalid positive int value' in e.value.code
+
+    def test_history(self, todo_file, capsys):
+        test_todo = Todo(None, make_args('test', check=[1]), todo_file)
+        test_todo.check_uncheck(True)
+        Todo(None, make_args('test', archive=True), todo_file).archive()
+
+        todo.main(todo_file, ['history', 'test', 'sect1', '-f', 'jsonl'])
+        record = json.loads(capsys.readouterr().out)
+        assert (record['project'], record['section'], record['label']) == ('test', 'sect1', 'task1')
+
+        store = todo.ArchiveStore(todo_file)
+        date = record['archived'][:10]
+        assert store.dates('test', 'sect1') == [date]
+        assert store.dates('test', 'other') == []
+        assert store.dates(until='2000-01-01') == []
+
+    def test_remove_all(self):
+        data = {'p': {'order': todo.TaskOrder(range(2000)), 'plain': [1, 2, 3]}}
+        todo.apply_change(data, ['remove_all', ['p', 'order'], range(0, 2000, 2)])
+        todo.apply_change(data, ['remove_all', ['p', 'plain'], [2]])
+
+        assert data['p']['order'] == list(range(1, 2000, 2))
+        assert data['p']['order'][500] == 1001
+        assert data['p']['plain'] == [1, 3]
+
+
+class TestConcurrency(object):
+    @pytest.mark.parametrize('backend', sorted(todo.STORAGES))
+    def test_parallel_adds(self, todo_file, backend):
+        import subprocess
+
+        env = dict(os.environ, TODO_FILE=todo_file, TODO_STORAGE=backend)
+        script = (f'for i in 1 2 3; do "{sys.executable}" "{todo.__file__}" test -a "$0-$i"'
+                  ' || exit 1; done')
+        writers = [subprocess.Popen(['sh', '-c', script, f'w{w}'], env=env) for w in range(4)]
+        assert [writer.wait() for writer in writers] == [0] * 4
+
+        tasks = todo.STORAGES[backend](todo_file).load()['test']['tasks']
+        assert sorted(tasks.values()) == sorted([f'w{w}-{i}' for w in range(4) for i in (1, 2, 3)]
+                                                + ['task1'])
+
+    def test_failed_write_keeps_file(self, todo_file):
+        def write(f):
+            f.write('{"partial')
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            todo.atomic_write(todo_file, write)
+        assert todo.Storage(todo_file).load()['test']['tasks'] == {'1': 'task1'}
+        assert os.listdir(os.path.dirname(todo_file)) == ['.todo']
+
+    def test_torn_journal_append(self, todo_file):
+        storage = todo.JournalStorage(todo_file)
+        Todo(None, make_args('test'), todo_file, storage).add('task2', 'test')
+        with open(storage.journal_file, 'a') as f:
+            f.write('["set", ["te')
+
+        storage = todo.JournalStorage(todo_file)
+        Todo(None, make_args('test'), todo_file, storage).add('task3', 'test')
+        tasks = todo.JournalStorage(todo_file).load()['test']['tasks']
+        assert sorted(tasks.values()) == ['task1', 'task2', 'task3']
+
+    def test_todo_file_not_a_path(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        with pytest.raises(SystemExit) as excinfo:
+            todo.main(['test'], [])
+        assert str(excinfo.value) == "error: todo file must be a path, not ['test']."
+        assert os.listdir(str(tmpdir)) == []
+
+
+class TestDaemon(object):
+    def test_forward_to_daemon(self, todo_file, capsys):
+        import socket
+        import subprocess
+        import time
+
+        assert todo.forward(todo_file, ['test', '-a', 'task2']) is None
+
+        env = dict(os.environ, TODO_FILE=todo_file)
+        daemon = subprocess.Popen([sys.executable, todo.__file__, 'daemon'], env=env)
+        try:
+            for _ in range(500):
+                if os.path.exists(todo.socket_path(todo_file)):
+                    break
+                time.sleep(0.01)
+
+            # a malformed request is answered with an error, and the daemon keeps serving
+            for request in (b'not json', b'{}', b'[]'):
+                conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                conn.connect(todo.socket_path(todo_file))
+                conn.sendall(request)
+                conn.shutdown(socket.SHUT_WR)
+                assert json.loads(todo.receive(conn))['code'] == 1
+                conn.close()
+
+            assert todo.forward(todo_file, ['test', '-a', 'task2']) == 0
+            assert todo.forward(todo_file, ['test', 'nosection']) == 1
+            assert 'does not exist' in capsys.readouterr().err
+            assert todo.forward(todo_file, ['export', 'test']) == 0
+            assert '"task2"' in capsys.readouterr().out
+
+            assert todo.forward(todo_file, ['daemon', '--stop']) == 0
+            assert daemon.wait(timeout=10) == 0
+        finally:
+            daemon.kill()
+
+        assert not os.path.exists(todo.socket_path(todo_file))
+        assert todo.Storage(todo_file).load()['test']['tasks'] == {'1': 'task1', '2': 'task2'}
+
+    def test_draws(self):
+        assert todo.draws([])
+        assert todo.draws(['test', 'sect1'])
+        assert not todo.draws(['test', '-a', 'task'])
+        assert not todo.draws(['test', '--plain'])
+        assert not todo.draws(['export'])
+        assert todo.reads_stdin(['import', '-f', 'csv'])
+        assert not todo.reads_stdin(['batch', 'commands.txt'])
+
+
+class TestApi(object):
+    def test_dispatch(self, todo_file):
+        api = todo.Api(todo_file, todo.get_storage(todo_file))
+
+        status, reply = api.dispatch('POST', '/projects/test/tasks', b'{"label": "task2"}')
+        assert status == 200
+        assert [task['label'] for task in reply['tasks']] == ['task1', 'task2']
+
+        status, reply = api.dispatch('POST', '/projects/test/check', b'{"ids": [2]}')
+        assert reply['tasks'][1] == {'id': 2, 'label': 'task2', 'section': None, 'checked': True}
+
+        status, reply = api.dispatch('GET', '/projects/test?section=sect1', b'')
+        assert [task['label'] for task in reply['tasks']] == ['task1']
+
+        assert api.dispatch('GET', '/projects/nope', b'')[0] == 404
+        assert api.dispatch('PUT', '/projects', b'')[0] == 405
+        assert api.dispatch('POST', '/projects/test/check', b'{"ids": [9]}') == \
+            (400, {'error': 'task #9 does not exist.'})
+
+        # changes are written like the command line's
+        data = todo.Storage(todo_file).load()
+        assert data['test']['check'] == [2]
+
+    def test_serve_while_locked(self, todo_file):
+        import http.client
+        import socket
+        import subprocess
+        import time
+
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = dict(os.environ, TODO_FILE=todo_file)
+        server = subprocess.Popen([sys.executable, todo.__file__, 'serve', '--port', str(port)],
+                                  env=env, stdout=subprocess.PIPE)
+        try:
+            server.stdout.readline()
+            lock = todo.FileLock(todo_file)
+            lock.acquire()
+            waiting = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            waiting.request('GET', '/projects/test')
+            time.sleep(0.2)
+
+            # the request waiting for the lock doesn't hold up other connections
+            with socket.create_connection(('127.0.0.1', port), timeout=2) as conn:
+                conn.sendall(b'\r\n')
+                assert conn.recv(1) == b''
+
+            lock.release()
+            response = waiting.getresponse()
+            assert response.status == 200
+            assert json.loads(response.read())['tasks'][0]['label'] == 'task1'
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+class TestGroupCommit(object):
+    def test_coalesces_saves(self, todo_file):
+        storage = todo.GroupCommit(todo.Storage(todo_file), 'batched', delay=60)
+        for i in range(2, 5):
+            todo.main(todo_file, ['test', '-a', f'task{i}'], storage)
+
+        # held in memory, with the lock kept for the pending write
+        assert todo.Storage(todo_file).load()['test']['tasks'] == {'1': 'task1'}
+        assert storage.storage.lock.fd is not None
+        assert not storage.due()
+
+        assert storage.sync() == 3
+        assert storage.writes == [3]
+        assert storage.storage.lock.fd is None
+        assert len(todo.Storage(todo_file).load()['test']['tasks']) == 4
+
+    def test_op_writes_every_save(self, todo_file):
+        storage = todo.GroupCommit(todo.Storage(todo_file), 'op')
+        todo.main(todo_file, ['test', '-a', 'task2'], storage)
+        assert storage.due()
+
+    def test_failed_command_keeps_held_saves(self, todo_file):
+        storage = todo.GroupCommit(todo.Storage(todo_file), 'batched', delay=60)
+        todo.main(todo_file, ['create', 'other'], storage)
+        todo.main(todo_file, ['other', '-a', 'task2'], storage)
+        storage.data['other']['tasks']['99'] = 'unsaved'
+        storage.forget()
+
+        storage.sync()
+        data = todo.Storage(todo_file).load()
+        assert dict(data['other']['tasks']) == {'1': 'task2'}
+        assert list(data['other']['order']) == [1]
+
+
+class TestSearch(object):
+    def search(self, todo_file, capsys, *terms):
+        todo.main(todo_file, ['search', *terms])
+        return capsys.readouterr().out.splitlines()
+
+    def test_incremental_updates(self, todo_file, capsys):
+        todo.main(todo_file, ['test', '-a', 'Write report'])
+        assert not todo.SearchIndex(todo_file).exists()
+
+        assert self.search(todo_file, capsys, 'rep') == ['test  2  Write report']
+        todo.main(todo_file, ['test', '-i', '1', 'Report draft'])
+        todo.main(todo_file, ['test', '-sa', 'Reports'])
+        assert self.search(todo_file, capsys, 'REP') == [
+            'test/Reports', 'test  1  Report draft', 'test  3  Write report']
+
+        todo.main(todo_file, ['test', '-r', 'work'])
+        todo.main(todo_file, ['work', '-d', '1'])
+        todo.main(todo_file, ['work', '-c', '2'])
+        todo.main(todo_file, ['archive', 'work'])
+        assert self.search(todo_file, capsys, 'rep') == ['work/Reports']
+        assert self.search(todo_file, capsys, 'task', 'sect') == []
+        assert self.search(todo_file, capsys, 'task') == ['work/sect1  1  task1']
+
+    def test_whole_field_changes(self, todo_file):
+        data = todo.Storage(todo_file).load()
+        index = todo.SearchIndex(todo_file)
+        index.rebuild(data)
+
+        changes = [['set', ['test', 'tasks'], {'1': 'renamed'}],
+                   ['set', ['test', 'sections'], {'other': [1]}]]
+        for change in changes:
+            todo.apply_change(data, change)
+        index.update(data, changes)
+        assert index.search('task') == index.search('sect1') == []
+        assert index.search('renamed') == [('test', 1, 'renamed')]
+        assert index.search('other') == [('test', None, 'other')]
@@ -54,13 +54,12 @@ NOTES:
 import os
 import sys
 import json
-import logging
+import marshal
 import argparse
-import curses
-import time
-import textwrap
-from pathlib import Path
-from curses import wrapper, newwin
+
+# Modes selected by the first argument, which can't be used as project names.
+MODES = ('archive', 'batch', 'create', 'daemon', 'delete', 'export', 'history', 'import',
+         'search', 'serve', 'tui')
 
 """
 [+++++++++++++++++++++++++++++++++++++++++++++]
@@ -79,7 +78,8 @@ class ArgumentParser(argparse.ArgumentParser):
         error_msg_right = message.split(':')[1]
 
         if error_msg_left == 'invalid choice':
-            sys.exit(f'project "{sys.argv[1]}" does not exist.')
+            argv = getattr(self, 'argv', sys.argv[1:])
+            sys.exit(f'project "{argv[0]}" does not exist.')
         elif (error_msg_left == 'the following arguments are required' or
               error_msg_right == ' expected one argument'):
             sys.exit(message) 
@@ -93,6 +93,8 @@ class ArgumentParser(argparse.ArgumentParser):
             sys.exit(f'error: unrecognized argument{suffix} {extra_args}.')
         elif error_msg_left == 'argument section':
             sys.exit('error: too many arguments.')
+        elif error_msg_right.startswith(' invalid'):
+            sys.exit(f'error: {message}.')
         else:
             sys.exit(f'UNKNOWN ERROR: {message}.')
 
@@ -106,6 +108,14 @@ Modes:
    creation    create PROJECT                Create a new project
    deletion    delete PROJECT                Delete a project
    archive     archive [PROJECT [SECTION]]   Archive completed tasks
+   batch       batch [FILE]                  Run commands from FILE or stdin
+   export      export [PROJECT] [-f FORMAT]  Write tasks as JSONL or CSV
+   import      import [FILE] [-f FORMAT]     Add tasks from JSONL or CSV
+   history     history [PROJECT [SECTION]]   List archived tasks
+   search      search TERM [TERM ...]        Find tasks and sections
+   daemon      daemon [--stop|--sync]        Serve commands from memory
+   serve       serve [--host H] [--port P]   Serve a JSON API over HTTP
+   interactive tui [PROJECT]                 Browse and edit in one session
 
 Normal mode options:
   general
@@ -123,9 +133,68 @@ Normal mode options:
     -sa LABEL                    Add a section.
     -sd LABEL                    Delete a section.
     -us ID [ID ...]              Move tasks out of sections.
+
+Archive mode options:
+    -j  JOBS                     Find completed tasks with JOBS threads.
+    -t                           Print how long each project took.
+
+History mode options:
+    --since DATE                 Only tasks archived on or after DATE.
+    --until DATE                 Only tasks archived on or before DATE.
+    -f  text|jsonl               Output format.
+
+Search mode options:
+    -f  text|jsonl               Output format.
+    --rebuild                    Index all tasks again first.
+
+Daemon mode options:
+    --stop                       Stop the running daemon.
+    --sync                       Write the changes the daemon is holding.
+
+Serve mode options:
+    --host HOST                  Address to listen on (127.0.0.1).
+    --port PORT                  Port to listen on (8765).
+
+Output options:
+  --plain                        Print the list as plain text.
+  --color                        Print the list with ANSI colors.
+
+  The list is printed as plain text when stdout isn't a terminal.
 ''')
 
-def create_parser(menu, todo_file):
+def pop_output_flag(argv):
+    """Remove the output flags from 'argv' and return the output format.
+
+    The flags may appear anywhere, so they're taken out before the mode and
+      project name are looked up by position.
+
+    Args:
+        argv: (list) Command-line arguments, without the program name.
+
+    Returns:
+        'plain' for --plain, 'ansi' for --color, or None to use curses (unless
+          stdout isn't a terminal, see Todo.show()).
+    """
+    output = None
+    for flag, fmt in (('--plain', 'plain'), ('--color', 'ansi')):
+        while flag in argv:
+            argv.remove(flag)
+            output = fmt
+    return output
+
+
+def positive_int(value):
+    """Argument type for counts that must be at least 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'invalid positive int value: {value!r}')
+    return number
+
+
+def create_parser(menu, todo_file, storage=None, argv=None):
     """Create a command-line parser.
 
     For a custom usage menu and error handling, uses an overridden
@@ -134,31 +203,40 @@ def create_parser(menu, todo_file):
     Args:
         menu: (Menu) Instance of our curses wrapped drawing class.
         todo_file: (String) Absolute path of the .todo configuration file.
+        storage: (Storage) Backend to load 'todo_file' with. Passing the one
+                             Todo uses means the file is only parsed once.
+        argv: (list) Arguments to parse, without the program name. Defaults
+                       to sys.argv[1:].
 
     Returns:
         A Namespace object containing the command-line flags and their state.
     """
+    argv = list(sys.argv[1:] if argv is None else argv)
     parser = ArgumentParser()
+    parser.argv = argv
+    parser.set_defaults(output=pop_output_flag(argv), batch=False, export=False, import_=False,
+                        history=False, search=False, daemon=False, serve=False, tui=False)
     sp = parser.add_subparsers()
+    storage = storage or get_storage(todo_file)
 
     # If in normal mode and no proj/sect is specified, display all projects
-    if len(sys.argv) == 1: 
-        parser.set_defaults(project=None, section=None, create=None)
+    if not argv:
+        import curses
+        parser.set_defaults(project=None, section=None, create=None, delete=False, archive=False)
         try:
-            Todo(menu, parser.parse_args(), todo_file)
+            Todo(menu, parser.parse_args(argv), todo_file, storage).show()
         except curses.error as e:
             sys.exit('error: terminal window is not large enough.')
         sys.exit(0)
 
-    with open(todo_file) as f:
-        existing_projects = [project for project in json.load(f).keys()]
+    existing_projects = [project for project in storage.load().keys()]
 
     # Normal Mode
     sp_normal = sp.add_parser('normal',
         aliases=[*existing_projects],
         description='View or modify projects, sections, and tasks.',
         help='View or modify existing projects, sections, and tasks')
-    sp_normal.set_defaults(project=sys.argv[1], create=False, delete=False, archive=False)
+    sp_normal.set_defaults(project=argv[0], create=False, delete=False, archive=False)
     sp_normal.add_argument('-a', '--add')
     sp_normal.add_argument('-r', '--rename')
     sp_normal.add_argument('-i', '--insert', nargs=2)
@@ -199,1016 +277,5304 @@ def create_parser(menu, todo_file):
     sp_archive.set_defaults(archive=True, create=False, delete=False, project=None, section=None)
     sp_archive.add_argument('project', nargs='?', action='store', help='Name of project')
     sp_archive.add_argument('section', nargs='?', action='store', help='Name of section')
+    sp_archive.add_argument('-j', '--jobs', type=positive_int, default=1, help='Number of threads')
+    sp_archive.add_argument('-t', '--timing', action='store_true', help='Print the time taken per project')
+
+    # Batch Mode
+    sp_batch = sp.add_parser('batch',
+        description='Runs commands from a file or stdin, one per line.',
+        help='Run commands in a batch',
+        add_help=False)
+    sp_batch.set_defaults(batch=True, create=False, delete=False, archive=False, project=None, section=None)
+    sp_batch.add_argument('file', nargs='?', default='-', help='File of commands')
+
+    # Export Mode
+    sp_export = sp.add_parser('export',
+        description='Writes projects, sections, and tasks to stdout.',
+        help='Export tasks',
+        add_help=False)
+    sp_export.set_defaults(export=True, create=False, delete=False, archive=False, section=None)
+    sp_export.add_argument('project', nargs='?', action='store', help='Name of project')
+    sp_export.add_argument('-f', '--format', choices=RECORD_FORMATS, default='jsonl')
+
+    # Import Mode
+    sp_import = sp.add_parser('import',
+        description='Adds projects, sections, and tasks from a file or stdin.',
+        help='Import tasks',
+        add_help=False)
+    sp_import.set_defaults(import_=True, create=False, delete=False, archive=False, project=None, section=None)
+    sp_import.add_argument('file', nargs='?', default='-', help='File of records')
+    sp_import.add_argument('-f', '--format', choices=RECORD_FORMATS)
+
+    # History Mode
+    sp_history = sp.add_parser('history',
+        description='Lists archived tasks.',
+        help='List archived tasks',
+        add_help=False)
+    sp_history.set_defaults(history=True, create=False, delete=False, archive=False)
+    sp_history.add_argument('project', nargs='?', action='store', help='Name of project')
+    sp_history.add_argument('section', nargs='?', action='store', help='Name of section')
+    sp_history.add_argument('--since', help='Earliest archive date (YYYY-MM-DD)')
+    sp_history.add_argument('--until', help='Latest archive date (YYYY-MM-DD)')
+    sp_history.add_argument('-f', '--format', choices=('text', 'jsonl'), default='text')
+
+    # Search Mode
+    sp_search = sp.add_parser('search',
+        description='Finds tasks and sections by the words in them.',
+        help='Search tasks',
+        add_help=False)
+    sp_search.set_defaults(search=True, create=False, delete=False, archive=False, project=None, section=None)
+    sp_search.add_argument('terms', nargs='+', help='Words (or their beginnings) to look for')
+    sp_search.add_argument('-f', '--format', choices=('text', 'jsonl'), default='text')
+    sp_search.add_argument('--rebuild', action='store_true', help='Index all tasks again first')
+
+    # Daemon Mode
+    sp_daemon = sp.add_parser('daemon',
+        description='Serves commands for the todo file from memory.',
+        help='Run the daemon',
+        add_help=False)
+    sp_daemon.set_defaults(daemon=True, create=False, delete=False, archive=False, project=None, section=None)
+    sp_daemon.add_argument('--stop', action='store_true', help='Stop the running daemon')
+    sp_daemon.add_argument('--sync', action='store_true', help='Write held changes now')
+
+    # Serve Mode
+    sp_serve = sp.add_parser('serve',
+        description='Serves a JSON API for the todo file over HTTP.',
+        help='Serve the HTTP API',
+        add_help=False)
+    sp_serve.set_defaults(serve=True, create=False, delete=False, archive=False, project=None, section=None)
+    sp_serve.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    sp_serve.add_argument('--port', type=int, default=8765, help='Port to listen on')
+
+    # Interactive Mode
+    sp_tui = sp.add_parser('tui',
+        description='Browses and edits the TODO list in one curses session.',
+        help='Browse and edit interactively',
+        add_help=False)
+    sp_tui.set_defaults(tui=True, create=False, delete=False, archive=False, section=None)
+    sp_tui.add_argument('project', nargs='?', action='store', help='Name of project')
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 """
 [+++++++++++++++++++++++++++++++++++++++++++++]
-                   Todo
+                   Storage
 [+++++++++++++++++++++++++++++++++++++++++++++]
 """
 
 
-class Todo(object):
-    """Class for managing TODO list states.
+class TaskOrder(object):
+    """Display order of a project's tasks.
+
+    Tasks are shown and referred to on the command line by their position in
+      this order, while sections and check lists refer to them by permanent
+      IDs. This way, inserting or deleting a task only changes the order
+      instead of renumbering every task after it.
+
+    The IDs are kept in blocks of at most 2 * 'load' items, so looking up,
+      inserting, or deleting a position only shifts the items of one block.
+      The block holding a position is found by bisecting the blocks' end
+      positions, and the block holding an ID through an index of the blocks
+      by ID (IDs are unique). It supports the parts of the list interface the
+      rest of todo uses and is serialized as a plain list.
 
     Args:
-        menu:      (Menu)       Instance of our curses wrapped drawing class.
-        args:      (Namespace)  Contains command-line flags and their states.
-        todo_file: (String)     Absolute path of the .todo configuration file.
+        task_ids: (iterable) Task IDs in display order.
 
     Attributes:
-
-        menu:          (Menu)      see arg: menu
-        args:          (Namespace) see arg: args
-        todo_file:     (String)    see arg: todo_file
-        project:       (String)    Name of project to view or modify.
-        section:       (String)    Name of section to create, view, or modify.
-        data:          (dict)      Contents of 'todo_file'.
-        iter_data:     (list)      List representation of 'data'. (for indexing)
-        proj_sections: (list)      Contains dicts with section names as keys and
-                                     section tasks as values.
-        proj_tasks:    (dict)      Task number as keys, task label as values.
+        blocks: (list) Lists of task IDs.
+        ends:   (list) Position after the last task ID of each block.
+        where:  (dict) Blocks (as values) by task ID (as keys).
+        length: (int)  Total amount of task IDs.
     """
-    def __init__(self, menu, args=None, todo_file=None):
-        """Constructor. See class docstring."""
-        self.menu = menu
-        self.args = args
-        self.todo_file = todo_file
-        self.project = args.project
-        self.section = args.section
+    load = 512
 
-        with open(self.todo_file) as f:
-            self.data = json.load(f)
-            self.iter_data = list(self.data.items())
-            if not self.data and not args.create:
-                sys.exit('no projects exist.')
-
-        if len(sys.argv) == 1:
-            self.show()
-        elif not args.create and not args.delete:
-            # For getting a project's sections and tasks, which modes Create
-            #   and Delete don't need.
-            if self.project:
-                self.nonexistent_check()
-                self.proj_sections = self.data[self.project]['sections']
-                self.proj_tasks = self.data[self.project]['tasks']
-                self.check_list = self.data[self.project]['check']
+    def __init__(self, task_ids=()):
+        """Constructor. See class docstring."""
+        task_ids = list(task_ids)
+        self.blocks = [task_ids[i:i + self.load]
+                       for i in range(0, len(task_ids), self.load)]
+        self.reindex()
 
     def __repr__(self):
-        """Return attributes.
+        """Return attributes."""
+        return f'TaskOrder({list(self)})'
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for block in self.blocks:
+            yield from block
+
+    def __contains__(self, task_id):
+        return task_id in self.where
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def reindex(self):
+        """Rebuild the end positions and the ID index from the blocks."""
+        self.ends = []
+        self.where = {}
+        length = 0
+        for block in self.blocks:
+            length += len(block)
+            self.ends.append(length)
+            self.where.update(dict.fromkeys(block, block))
+        self.length = length
+
+    def resize(self, i, amount):
+        """Update the end positions after block 'i' changed size by 'amount',
+          dropping the block if it's empty.
+        """
+        for j in range(i, len(self.ends)):
+            self.ends[j] += amount
+        self.length += amount
+        if not self.blocks[i]:
+            del self.blocks[i]
+            del self.ends[i]
 
-        If Todo is ran with Create or Delete mode, self.proj_sections and
-          self.proj_tasks won't exist and will therefore throw an error.
-          May want to fix that.
+    def locate(self, index):
+        """Return the index of the block holding 'index' and the offset into it.
+
+        Args:
+            index: (int) 0-based position. Negative positions count from the
+                           end, like a list's.
         """
-        return (f'Todo({self.menu}, {self.args}, {self.todo_file}, '
-                f'{self.project}, {self.section}, {self.data}, {self.iter_data}'
-                f'{self.proj_sections}, {self.proj_tasks})')
+        from bisect import bisect_right
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('task position out of range')
+        i = bisect_right(self.ends, index)
+        return i, index - (self.ends[i - 1] if i else 0)
+
+    def __getitem__(self, index):
+        i, offset = self.locate(index)
+        return self.blocks[i][offset]
+
+    def append(self, task_id):
+        """Add a task ID to the end of the order."""
+        if not self.blocks or len(self.blocks[-1]) >= 2 * self.load:
+            self.blocks.append([])
+            self.ends.append(self.length)
+        self.blocks[-1].append(task_id)
+        self.where[task_id] = self.blocks[-1]
+        self.resize(len(self.blocks) - 1, 1)
+
+    def insert(self, index, task_id):
+        """Insert a task ID before 0-based position 'index'."""
+        if index >= self.length or not self.length:
+            self.append(task_id)
+            return
+        i, offset = self.locate(max(index, -self.length))
+        block = self.blocks[i]
+        block.insert(offset, task_id)
+        self.where[task_id] = block
+        self.resize(i, 1)
+
+        # split big blocks so shifting items stays cheap
+        if len(block) > 2 * self.load:
+            head, tail = block[:self.load], block[self.load:]
+            self.blocks[i:i + 1] = [head, tail]
+            self.ends.insert(i, self.ends[i] - len(tail))
+            self.where.update(dict.fromkeys(head, head))
+            self.where.update(dict.fromkeys(tail, tail))
+
+    def pop(self, index=-1):
+        """Remove and return the task ID at 0-based position 'index'."""
+        i, offset = self.locate(index)
+        task_id = self.blocks[i].pop(offset)
+        del self.where[task_id]
+        self.resize(i, -1)
+        return task_id
+
+    def remove(self, task_id):
+        """Remove 'task_id' from the order."""
+        try:
+            block = self.where.pop(task_id)
+        except KeyError:
+            raise ValueError(f'task {task_id} is not in the order') from None
+        block.remove(task_id)
+        # blocks hold distinct IDs, so this only compares first items
+        self.resize(self.blocks.index(block), -1)
+
+    def remove_all(self, task_ids):
+        """Remove every task ID in 'task_ids', in one pass over the order."""
+        task_ids = set(task_ids)
+        kept = [task_id for task_id in self if task_id not in task_ids]
+        self.blocks = [kept[i:i + self.load] for i in range(0, len(kept), self.load)]
+        self.reindex()
+
+
+class TaskSet(object):
+    """A set of task IDs that remembers the order IDs were added in.
+
+    Used for a project's checked tasks, which are looked up for every task
+      that's drawn, checked, deleted, or archived. The IDs are the keys of a
+      dict, so those lookups take constant time, while it still supports the
+      parts of the list interface the rest of todo uses and is serialized as
+      a plain list (in the order the tasks were checked).
 
-    # Helper functions
+    Args:
+        task_ids: (iterable) Task IDs.
 
-    def nonexistent_check(self):
-        """Check for nonexistent project and section names.
+    Attributes:
+        ids: (dict) Task IDs (as keys).
+    """
+    def __init__(self, task_ids=()):
+        """Constructor. See class docstring."""
+        self.ids = dict.fromkeys(task_ids)
 
-        Nonexistent project names in Normal mode have to be handled at the
-          parser, otherwise our subparsers mess up. Note that this does NOT
-          include moving tasks (which is in Normal mode).
+    def __repr__(self):
+        """Return attributes."""
+        return f'TaskSet({list(self.ids)})'
 
-        Nonexistent project names in Delete mode are handled in todo.delete().
+    def __len__(self):
+        return len(self.ids)
 
-        Helper:
-            todo.__init__()
-        """
-        if self.project not in self.data.keys():
-            # Check project name (archive mode)
-            sys.exit(f'error: project "{self.project}" does not exist.')
-        elif self.section:
-            # Check section name (normal, archive mode)
-            if self.section not in self.data[self.project]['sections'].keys():
-                sys.exit(f'error: section "{self.section}" does not exist in project "{self.project}".')
+    def __iter__(self):
+        return iter(self.ids)
 
-    def project_name_check(self, project_name):
-        """Check for invalid project names.
+    def __contains__(self, task_id):
+        return task_id in self.ids
 
-        Helper:
-            todo.create()
-            todo.rename()
+    def __eq__(self, other):
+        return list(self) == list(other)
 
-        Args:
-            project_name: (String) Either self.project or self.args.rename.
-        """
-        blacklist = ['archive', 'create', 'delete']
-        existing_projects = [project for project in self.data.keys()]
+    def append(self, task_id):
+        """Add a task ID, if it isn't already in the set."""
+        self.ids[task_id] = None
 
-        if not project_name.isalnum():
-            sys.exit('error: invalid project name.')
-        elif project_name in blacklist:
-            sys.exit('error: restricted project name.')
-        elif project_name in existing_projects:
-            sys.exit(f'error: project "{project_name}" already exists.')
-        elif len(project_name) > 45:
-            sys.exit('error: project name is too long.')
+    def remove(self, task_id):
+        """Remove a task ID."""
+        try:
+            del self.ids[task_id]
+        except KeyError:
+            raise ValueError(f'task {task_id} is not in the set') from None
 
-    # These archive helper functions do not modify self.data, self.proj_sections, or
-    #   self.proj_tasks in any way. This is due to differences in check list
-    #   assignments, what project needs to be passed to each helper, and the extra
-    #   step of updating check list values when archiving a section archiving. So
-    #   any modification of those 3 variables are done within either in archive()
-    #   or archive_projects().
+    def remove_all(self, task_ids):
+        """Remove every task ID in 'task_ids' that's in the set."""
+        for task_id in task_ids:
+            if task_id in self:
+                self.remove(task_id)
 
-    def get_updated_check(self, project):
-        """Return an updated checked list (archive helper).
-        
-        If a section is specified, the checked list returned will only contain
-          tasks in that section. Otherwise, a list with all checked items will
-          be returned.
-        
-        Args:
-            project: (dict) Project's name, sections, tasks, and check list.
-        
-        Returns:
-            checked: (set) The completed tasks to be archived.
-        """
-        if self.section:
-            sect_tasks = self.proj_sections[self.section]
-            checked = set(project['check']) & set(sect_tasks)
-            if not checked:
-                sys.exit(f'No completed tasks in section "{self.section}" of project "{self.project}".')
-        else:
-            checked = {task_num for task_num in project.get('check')}
-            if not checked:
-                sys.exit(f'No completed tasks in project "{self.project}".')
-        return checked
 
-    @staticmethod
-    def no_checked_tasks(project, checked):
-        """Get an updated task list with no checked tasks.
-        
-        Helper:
-            archive()
+class SectionTasks(TaskSet):
+    """The IDs of a section's tasks.
 
-        Args:
-            project: (dict) Project's name, sections, tasks, and check list.
-            checked: (set)  Completed tasks to delete.
-        
-        Returns:
-            old_tasks: (list) All pre-existing tasks. (to map new tasks with
-                                old task positions)
-            new_tasks: (dict) All tasks post-archive (as value) and their
-                                position (as key).
-            """
-        old_tasks = project['tasks']
-        new_tasks = {}
-
-        for task_num, task in project.get('tasks').items():
-            if int(task_num) not in checked:
-                new_tasks[str(len(new_tasks) + 1)] = task
-        return old_tasks, new_tasks
+    Adding or removing a task also updates the section index of the project
+      (see Sections).
 
-    @staticmethod
-    def get_updated_sections(sections, old_tasks, new_tasks, checked):
-        """Get an updated section task list after completed tasks are removed.
-                
-        Helper:
-            section_delete()
-            archive()
-            archive_projects()
+    Args:
+        sections: (Sections) The project's sections.
+        name:     (String)   Name of the section.
+        task_ids: (iterable) Task IDs.
+    """
+    def __init__(self, sections, name, task_ids=()):
+        """Constructor. See class docstring."""
+        super().__init__()
+        self.sections = sections
+        self.name = name
+        for task_id in task_ids:
+            self.append(task_id)
 
-        Args:
-            sections:  (list) The current project's sections, which is either
-                                self.proj_sections if a section is specified,
-                                or project['sections'] otherwise.
-            old_tasks: (dict) Task list before task indices are updated.
-            new_tasks: (dict) Task list after task indices are updated.
-            checked:   (set)  Updated check list.
-        
-        Returns:
-            all_sections: (dict) Each section (name as key) and its unchecked
-                                   tasks (as values) after archiving.
-            new_tnames:   (list) All task names after archiving. (for updating
-                                   remaining check list values in Archive???)
-        """
-        new_tnames = list(new_tasks.values())
-        all_sections = {}
+    def __repr__(self):
+        """Return attributes."""
+        return f'SectionTasks({self.name}, {list(self.ids)})'
 
-        for sect_name, sect_tasks in sections.items():
-            unchecked_sect_tasks = list(set(sect_tasks) - checked)
-            for i, task_num in enumerate(unchecked_sect_tasks):
-                old_tname = old_tasks[str(task_num)]
-                unchecked_sect_tasks[i] = new_tnames.index(old_tname) + 1
-            all_sections[sect_name] = sorted(unchecked_sect_tasks)
+    def append(self, task_id):
+        """Add a task ID to the section."""
+        super().append(task_id)
+        self.sections.index[task_id] = self.name
 
-        return all_sections, new_tnames
+    def remove(self, task_id):
+        """Remove a task ID from the section."""
+        super().remove(task_id)
+        if self.sections.index.get(task_id) == self.name:
+            del self.sections.index[task_id]
 
-    # General functions
 
-    def write(self):
-        """Write changes to todo's configuration file..
+class Sections(dict):
+    """A project's section tasks (as values) by section name (as keys).
 
-        Normally, it will be .todo. However, when testing, it'll use the test
-          file .test_todo.
-        """
-        with open(self.todo_file, 'w') as f:
-            json.dump(self.data, f)
+    Also keeps an index of which section each task is in, so finding a task's
+      section or the tasks outside of sections doesn't scan every section.
+      The index is updated when sections are set, deleted, or renamed, and
+      when their tasks change (see SectionTasks).
 
-    def show(self):
-        """Display TODO list.
+    Args:
+        sections: (dict) Task IDs by section name.
 
-        There are 3 scenarios based on the arguments passed:
+    Attributes:
+        index: (dict) Section names (as values) by task ID (as keys).
+    """
+    def __init__(self, sections=()):
+        """Constructor. See class docstring."""
+        super().__init__()
+        self.index = {}
+        for name, task_ids in dict(sections).items():
+            self[name] = task_ids
+
+    def __setitem__(self, name, task_ids):
+        if name in self:
+            del self[name]
+        super().__setitem__(name, SectionTasks(self, name, task_ids))
+
+    def __delitem__(self, name):
+        for task_id in self[name]:
+            if self.index.get(task_id) == name:
+                del self.index[task_id]
+        super().__delitem__(name)
+
+    def rename(self, name, new_name):
+        """Rename a section, keeping its position. Raises KeyError if there is
+          no such section, and ValueError rather than replacing an existing one.
+        """
+        if name not in self:
+            raise KeyError(name)
+        if new_name in self:
+            raise ValueError(f'section "{new_name}" already exists')
+        items = list(self.items())
+        super().clear()
+        for sect_name, sect_tasks in items:
+            if sect_name == name:
+                sect_tasks.name = sect_name = new_name
+                for task_id in sect_tasks:
+                    self.index[task_id] = new_name
+            super().__setitem__(sect_name, sect_tasks)
+
+    def section_of(self, task_id):
+        """Return the name of the section a task is in, or None."""
+        return self.index.get(task_id)
+
+
+class TaskLabels(dict):
+    """A project's task labels (as values) by task ID (as keys).
+
+    Also keeps an index of the labels, so checking for an existing label or
+      finding a task by label takes constant time instead of scanning every
+      label. The index is updated by item assignment and deletion, which is
+      how tasks are added, renamed, and removed (including by apply_change()).
 
-            a)   $ todo project section
-            b)   $ todo project
-            c)   $ todo
+    Args:
+        tasks: (dict) Task labels by task ID.
 
-        a) displays the section specified and its tasks.
-        b) displays the project specified, all sections within it, and all
-             tasks.
-        c) displays all projects, their sections, and all of their tasks.
+    Attributes:
+        ids: (dict) Sets of task IDs (as values) by label (as keys). Files
+                      saved before labels had to be unique can have
+                      duplicates, which share a set.
+    """
+    def __init__(self, tasks=()):
+        """Constructor. See class docstring."""
+        super().__init__(tasks)
+        self.ids = {}
+        for task_id, label in self.items():
+            self.ids.setdefault(label, set()).add(task_id)
+
+    def __setitem__(self, task_id, label):
+        if task_id in self:
+            self.forget(task_id)
+        super().__setitem__(task_id, label)
+        self.ids.setdefault(label, set()).add(task_id)
+
+    def __delitem__(self, task_id):
+        self.forget(task_id)
+        super().__delitem__(task_id)
+
+    def forget(self, task_id):
+        """Remove a task's label from the index."""
+        label = self[task_id]
+        task_ids = self.ids[label]
+        task_ids.discard(task_id)
+        if not task_ids:
+            del self.ids[label]
+
+    def find(self, label):
+        """Return the lowest ID of the tasks labeled 'label', or None."""
+        task_ids = self.ids.get(label)
+        return None if task_ids is None else min(map(int, task_ids))
+
+
+def to_json(obj):
+    """Serialize objects json doesn't know about (json.dump's 'default')."""
+    if isinstance(obj, (TaskOrder, TaskSet)):
+        return list(obj)
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+
+def upgrade_project(project):
+    """Bring a project up to the current format.
+
+    Projects saved before tasks had permanent IDs are keyed by position, so
+      their positions simply become their IDs. Task orders are loaded as
+      TaskOrder instances, check lists as TaskSet instances, labels as
+      TaskLabels instances, and sections as Sections instances.
 
-        Tasks belonging to a section will be excluded from the general task
-          output area since they're already included in the section task area.
-        """
-        if self.project or self.section:
-            wrapper(self.menu.draw_prjsect,
-                    self.data,
-                    self.proj_sections,
-                    self.proj_tasks,
-                    self.project,
-                    self.section)
-        else:
-            wrapper(self.menu.draw_all, self.data)
-    
-    def create(self):
-        """Create a new project."""
-        self.project_name_check(self.project)
-        self.data[self.project] = {"sections": {}, "tasks": {}, "check": []}
-        self.write()
+    Args:
+        project: (dict) A project's sections, tasks, and check list.
 
-    def delete(self):
-        """Delete a project."""
-        try:
-            del self.data[self.project]
-        except KeyError as e:
-            sys.exit(f'error: project "{self.project}" does not exist.')
-        self.write()
+    Returns:
+        'project', modified in place.
+    """
+    if 'order' not in project:
+        project['order'] = [int(task_id) for task_id in project['tasks']]
+    if 'next' not in project:
+        project['next'] = max(project['order'], default=0) + 1
+    if not isinstance(project['order'], TaskOrder):
+        project['order'] = TaskOrder(project['order'])
+    if not isinstance(project['check'], TaskSet):
+        project['check'] = TaskSet(project['check'])
+    if not isinstance(project['tasks'], TaskLabels):
+        project['tasks'] = TaskLabels(project['tasks'])
+    if not isinstance(project['sections'], Sections):
+        project['sections'] = Sections(project['sections'])
+    return project
+
+
+def plain_project(project):
+    """Return a copy of a project made of plain dicts and lists.
 
-    def archive(self):
-        """Delete completed tasks.
+    Args:
+        project: (dict) A project's sections, tasks, and check list.
+    """
+    return {**project,
+            'order': list(project['order']),
+            'check': list(project['check']),
+            'tasks': dict(project['tasks']),
+            'sections': {sect_name: list(sect_tasks)
+                         for sect_name, sect_tasks in project['sections'].items()}}
 
-        project[x] assignments modify self.data, which is what is eventually
-          written to 'todo_file'.
-        """
-        # Exit if we're archiving all projects and there are no completed tasks
-        if not self.project:
-            all_checked_tasks = [task for prj in self.data.values() for task in prj['check']]
-            if not all_checked_tasks:
-                sys.exit('no completed tasks in any project.')
 
-        if self.section:
-            # Update check list
-            project = self.data[self.project]
-            checked = self.get_updated_check(project)
-            project['check'] = list(set(project['check']) - checked)
-
-            # Delete tasks
-            old_tasks, new_tasks = self.no_checked_tasks(project, checked)
-            project['tasks'] = new_tasks
-
-            # Update sections
-            all_sections, new_tnames = self.get_updated_sections(self.proj_sections, old_tasks, new_tasks, checked)
-            project['sections'] = all_sections
-
-            # Update check list values
-            for i, task in enumerate(project['check']):
-                old_tnames = old_tasks.get(str(task))
-                project['check'][i] = new_tnames.index(old_tnames) + 1
-        elif self.project:
-            self.archive_projects(self.data[self.project])
-        else:
-            for name, project in self.data.items():
-                self.archive_projects(project)
+def upgrade(data):
+    """Bring every project in 'data' up to the current format.
 
-        self.write()
+    Args:
+        data: (dict) Contents of the todo file.
 
-    def archive_projects(self, project):
-        """Delete completed tasks for projects.
+    Returns:
+        'data', modified in place.
+    """
+    for project in data.values():
+        upgrade_project(project)
+    return data
 
-        project[x] assignments modify self.data, which is what is eventually
-          written to 'todo_file'.
 
-        Args:
-            project: (dict) A project's sections, tasks, and check list.
-        """
-        # Empty check list
-        checked = self.get_updated_check(project)
-        project['check'] = []
+def apply_change(data, change):
+    """Apply a single change record to a todo data structure.
 
-        # Delete tasks
-        old_tasks, new_tasks = self.no_checked_tasks(project, checked)
-        project['tasks'] = new_tasks
+    A change record is a list of the format [op, path, *args], where 'path' is
+    a list of keys leading to the value being changed. Supported ops:
 
-        # Update sections
-        all_sections, new_tnames = self.get_updated_sections(project['sections'], old_tasks, new_tasks, checked)
-        project['sections'] = all_sections
+        ['set', path, value]         data[path] = value
+        ['del', path]                del data[path]
+        ['rename', path, new_key]    rename the last key of path in place
+        ['append', path, value]      data[path].append(value)
+        ['remove', path, value]      data[path].remove(value)
+        ['insert', path, i, value]   data[path].insert(i, value)
+        ['pop', path, i]             data[path].pop(i)
+        ['remove_all', path, values] remove every value in 'values' from
+                                       data[path] (keys, if it's a dict)
 
-    def rename(self):
-        """Rename a project or section."""
-        self.project_name_check(self.args.rename)
-
-        new_data = {}
-        for name, prj in self.data.items():
-            if self.section:
-                new_data[name] = prj  # maybe put and AND somewhere up there
-                if self.project == name:
-                    for i, section in enumerate(prj['sections']):
-                        if self.section == section['name']:
-                            new_data[name]['sections'][i]['name'] = self.args.rename 
-            else:
-                if self.project == name:
-                    new_data[self.args.rename] = prj
-                else:
-                    new_data[name] = prj
+    Args:
+        data:   (dict) Contents of the todo file.
+        change: (list) The change record to apply.
+    """
+    op, path, *args = change
+    parent = data
+    for key in path[:-1]:
+        parent = parent[key]
+    key = path[-1]
+
+    if op == 'set':
+        parent[key] = args[0]
+    elif op == 'del':
+        del parent[key]
+    elif op == 'rename' and isinstance(parent, Sections):
+        parent.rename(key, args[0])
+    elif op == 'rename':
+        if args[0] in parent:
+            raise ValueError(f'cannot rename "{key}": "{args[0]}" already exists')
+        # rebuild the dict so the renamed key keeps its position (project
+        #   colors depend on project order)
+        #   dict.items() is used so lazily loaded projects (see ShardedStorage)
+        #   are moved around without being loaded
+        items = list(dict.items(parent))
+        parent.clear()
+        for name, value in items:
+            dict.__setitem__(parent, args[0] if name == key else name, value)
+    elif op == 'append':
+        parent[key].append(args[0])
+    elif op == 'remove':
+        parent[key].remove(args[0])
+    elif op == 'insert':
+        parent[key].insert(args[0], args[1])
+    elif op == 'pop':
+        parent[key].pop(args[0])
+    elif op == 'remove_all':
+        target = parent[key]
+        if isinstance(target, dict):
+            for value in args[0]:
+                del target[value]
+        elif hasattr(target, 'remove_all'):
+            target.remove_all(args[0])
+        else:
+            values = set(args[0])
+            parent[key] = [value for value in target if value not in values]
+    else:
+        raise ValueError(f'unknown change op "{op}"')
 
-        self.data = new_data
-        self.write()
 
-    # Task functions
+def atomic_write(path, write, mode='w', fsync=True):
+    """Replace a file's contents so readers see either the old or new file.
 
-    def add(self, label, project, section=None):
-        """Add a task to a project.
+    The contents are written to a temporary file next to 'path', flushed to
+      disk, and renamed over 'path'. A process killed mid-write leaves the old
+      file in place (and at worst a stray temporary file). Without 'fsync',
+      the new file is left for the OS to flush, so it survives the process
+      but not necessarily a power loss.
 
-        Args:
-            label:   (String) Name of task to be added.
-            project: (String) Name of project to add task to.
-            section: (String) Name of section to add task to.
-        """
-        proj_tasks = self.data[project]['tasks']
+    Args:
+        path:  (String)   Path of the file to replace.
+        write: (function) Takes the open temporary file and writes to it.
+        mode:  (String)   Mode to open the temporary file with.
+        fsync: (boolean)  Indicates whether to wait for the file to be on disk.
+    """
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_file, mode) as f:
+            write(f)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        sync_dir(os.path.dirname(path))
 
-        # existing task check
-        if label in self.data[project]['tasks'].values():
-            sys.exit(f'task "{label}" already exists in project "{project}".')
 
-        # update section
-        # self.proj_section isn't used here since move_task also uses this and
-        # we may need to add to section in a different project
-        if section:
-            self.data[project]['sections'][section].append(len(proj_tasks) + 1)
+def sync_dir(path):
+    """Flush a directory's entries (e.g., a rename) to disk, where supported.
 
-        # add task
-        proj_tasks[len(proj_tasks) + 1] = label
+    Args:
+        path: (String) Path of the directory.
+    """
+    try:
+        fd = os.open(path or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
-        self.write()
 
-    def insert(self):
-        """Insert a task at a specified position."""
-        pos, label = self.args.insert
+class FileLock(object):
+    """Advisory lock that serializes invocations sharing a todo file.
 
-        # insert format check
-        if not pos.isdigit():
-            sys.exit(f'error: insert position must be a digit')
+    The lock is held on '<todo_file>.lock' from before the todo file is loaded
+      until after it's saved, so concurrent commands can't overwrite each
+      other's changes. Waiting gives up after 'timeout' seconds. Where flock()
+      isn't available (e.g., Windows), locking is skipped.
 
-        # existing task check
-        if label in self.proj_tasks.values():
-            sys.exit(f'error: task "{label}" already exists in project "{self.project}".')
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+        timeout:   (float)  Seconds to wait for the lock.
 
-        # valid position check
-        if int(pos) > int(list(self.proj_tasks.keys())[-1]):
-            sys.exit(f'error: there are only {list(self.proj_tasks.keys())[-1]} task positions.')
-
-        # update section positions
-        all_section_tasks = [tasks for tasks in self.proj_sections.values()]
-
-        for sect_tasks in all_section_tasks:
-            for i, task_num in enumerate(sect_tasks):
-                if task_num >= int(pos):
-                    sect_tasks[i] = task_num + 1
-
-        # update check list
-        for i, task_num in enumerate(self.check_list):
-            if task_num >= int(pos):
-                self.check_list[i] = task_num + 1
-
-        # update task list positions and add task
-        new_tasks = {}
-        for old_index, task in self.proj_tasks.items():
-            if int(old_index) == int(pos):
-                new_tasks[pos] = label
-                new_index = str(int(old_index) + 1)
-                new_tasks[new_index] = task
-            elif int(old_index) > int(pos):
-                new_index = str(int(old_index) + 1)
-                new_tasks[new_index] = task
-            else:
-                new_tasks[old_index] = task
-        self.data[self.project]['tasks'] = new_tasks
+    Attributes:
+        lock_file: (String) Path of the lock file.
+        fd:        (int)    Descriptor of the lock file while it's held.
+    """
+    def __init__(self, todo_file, timeout=10):
+        """Constructor. See class docstring."""
+        self.lock_file = f'{todo_file}.lock'
+        self.timeout = timeout
+        self.fd = None
 
-        if self.section:
-            for i, sect_num in enumerate(self.proj_sections[self.section]):
-                if sect_num > int(pos):
-                    self.proj_sections[self.section].insert(i, int(pos))
-                    break
+    def __repr__(self):
+        """Return attributes."""
+        return f'FileLock({self.lock_file}, {self.timeout})'
 
-        self.write()
+    def acquire(self):
+        """Take the lock, waiting for other invocations to release it."""
+        try:
+            import fcntl
+        except ImportError:
+            return
+        if self.fd is not None:
+            return
+
+        import time
+
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() > deadline:
+                    os.close(fd)
+                    sys.exit('error: the todo file is locked by another process.')
+                time.sleep(0.01)
+        self.fd = fd
+
+    def release(self):
+        """Release the lock if it's held."""
+        if self.fd is not None:
+            # closing the descriptor drops the lock
+            os.close(self.fd)
+            self.fd = None
+
+
+class Storage(object):
+    """Plain JSON storage for the todo file.
+
+    Every save serializes all of 'data' and rewrites the file.
+
+    The todo file is parsed at most once per process: load() hands out the
+      same data until one of the storage's files changes on disk. With 'cache'
+      enabled, the parsed data is also kept in '<todo_file>.cache' (in marshal
+      format) so later processes can skip parsing JSON as long as the files'
+      sizes and mtimes haven't changed.
 
-    def task_delete(self):
-        """Delete a task from a project."""
-        labels = list(sorted(self.args.task_delete))
-        
-        # checks
-        for label in labels:
-            if not label:
-                sys.exit('error: 0 is an invalid task number.')
-            elif label > len(self.proj_tasks):
-                sys.exit(f'project "{self.project}" has no task #{label}.')
-        
-        # reduce non-first task indices by 1 to ensure proper
-        # deletion after deletion of the previous task
-        for i, label in enumerate(labels):
-            if i != 0:
-                labels[i] = label - len(labels[:i])
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        cache:     (boolean) Indicates whether to use the on-disk cache.
 
-        for label in labels:
-            # delete task
-            self.proj_tasks.pop(str(label))
-
-            # update sections
-            all_section_tasks = [tasks for tasks in self.proj_sections.values()]
-
-            for sect_tasks in all_section_tasks:
-                if label in sect_tasks:
-                    sect_tasks.remove(label)
-                for i, task_num in enumerate(sect_tasks):
-                    if task_num > label:
-                        sect_tasks[i] = task_num - 1
-
-            # update check list
-            if label in self.check_list:
-                self.check_list.remove(label)
-
-            for i, task_num in enumerate(self.check_list):
-                if task_num > label:
-                    self.check_list[i] = task_num - 1
-
-            # update task list label numbers
-            new_tasks = {}
-            for old_index, task in self.proj_tasks.items():
-                if label <= int(old_index):
-                    new_index = str(int(old_index) - 1)
-                    new_tasks[new_index] = task
-                else:
-                    new_tasks[old_index] = task
-            self.data[self.project]['tasks'] = new_tasks
-            self.proj_tasks = new_tasks
+    Attributes:
+        fsync:       (boolean)  Indicates whether saves wait for the data to be
+                                  on disk (see get_durability()).
+        cache_file:  (String)   Path of the on-disk cache.
+        data:        (dict)     The last data loaded or saved.
+        data_stamp:  (tuple)    stamp() of the files 'data' corresponds to.
+        lock:        (FileLock) Lock serializing invocations on the todo file.
+        threadsafe:  (boolean)  Indicates whether projects may be loaded by
+                                  several threads at once (see Todo.archive()).
+    """
+    cache_version = 1
+    fsync = True
+    threadsafe = True
 
-        self.write()
+    def __init__(self, todo_file, cache=False):
+        """Constructor. See class docstring."""
+        self.todo_file = todo_file
+        self.cache = cache
+        self.cache_file = f'{todo_file}.cache'
+        self.data = None
+        self.data_stamp = None
+        self.lock = FileLock(todo_file)
 
-    def check_uncheck(self, check):
-        """Mark a task as checked or unchecked.
+    def __repr__(self):
+        """Return attributes."""
+        return f'{type(self).__name__}({self.todo_file}, {self.cache})'
+
+    def files(self):
+        """Return the files the data is loaded from."""
+        return [self.todo_file]
+
+    def stamp(self):
+        """Return the sizes and mtimes of the storage's files.
+
+        Missing files are stamped with None.
+        """
+        stamp = []
+        for path in self.files():
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def load(self):
+        """Return the contents of the todo file.
+
+        Parsing is skipped if the files haven't changed since the last load
+          or save, or if the on-disk cache is still valid.
+        """
+        stamp = self.stamp()
+        if self.data is not None and stamp == self.data_stamp:
+            return self.data
+
+        data = self.read_cache(stamp) if self.cache else None
+        if data is None:
+            data = self.parse()
+            if self.cache:
+                self.write_cache(stamp, data)
+
+        self.data = upgrade(data)
+        self.data_stamp = stamp
+        return self.data
+
+    def forget(self):
+        """Drop the in-memory data so that the next load() reads it again."""
+        self.data = None
+        self.data_stamp = None
+
+    def parse(self):
+        """Return the parsed contents of the storage's files."""
+        return upgrade(self.read())
+
+    def read(self):
+        """Return the raw contents of the todo file."""
+        with open(self.todo_file) as f:
+            return json.load(f)
+
+    def read_cache(self, stamp):
+        """Return the cached data if it was cached for 'stamp', else None.
 
         Args:
-            check: (boolean) Indicates whether to check (True) or uncheck
-                               (False) a task.
+            stamp: (tuple) Current stamp() of the storage's files.
+        """
+        try:
+            with open(self.cache_file, 'rb') as f:
+                version, cached_stamp, data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
 
+        if version != (self.cache_version, sys.version_info[:2]) or cached_stamp != stamp:
+            return None
+        return data
+
+    def write_cache(self, stamp, data):
+        """Cache 'data' as the parsed contents of files stamped with 'stamp'.
+
+        The cache is replaced atomically so readers never see a partial cache.
+
+        Args:
+            stamp: (tuple) stamp() of the files 'data' was parsed from.
+            data:  (dict)  Contents of the todo file.
         """
-        labels = self.args.check if check else self.args.uncheck
-        task_id_list = list(self.proj_tasks.keys())
+        plain = {name: plain_project(project) for name, project in data.items()}
+        version = (self.cache_version, sys.version_info[:2])
+        try:
+            atomic_write(self.cache_file, lambda f: marshal.dump((version, stamp, plain), f), 'wb',
+                         fsync=False)
+        except OSError:
+            # the cache is only an optimization
+            pass
 
-        for label in labels:
-            if str(label) in task_id_list:
-                if check:
-                    if label not in self.check_list:
-                        self.check_list.append(label)
-                    else:
-                        sys.exit(f'task #{label} is already checked.')
-                else:
-                    if label in check_list:
-                        self.check_list.remove(label)
-                    else:
-                        sys.exit(f'task #{label} is not checked.')
-            else:
-                sys.exit(f'task #{label} does not exist.')
+    def save(self, data, changes):
+        """Save 'data' and remember it as the current contents.
 
-        self.write()
+        Args:
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save.
+        """
+        self.dump(data, changes)
+        self.data = data
+        self.data_stamp = self.stamp()
+        if self.cache:
+            self.write_cache(self.data_stamp, data)
+        self.update_search(data, changes)
 
-    def move_task(self):
-        """Move a task to a different project or section.
+    def dump(self, data, changes):
+        """Write 'data' to the todo file.
 
-        'ttm' is short for "task to move."
+        Args:
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save (unused here).
+        """
+        atomic_write(self.todo_file, lambda f: json.dump(data, f, default=to_json), fsync=self.fsync)
 
-        If no section is specified (-mp), 'ttm' is a list of the format:
-            [id, project]
+    def update_search(self, data, changes):
+        """Update the search index with saved changes, once it's been built.
 
-        If a section is specified (-ms), 'ttm' is a list of the format:
-            [id, project, section]
+        Args:
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records of the save.
         """
-        ttm = self.args.move_to_proj if self.args.move_to_proj else self.args.move_to_sect
-        task_id = ttm[0]
-        new_prj = ttm[1]
-        new_sect = ttm[2] if self.args.move_to_sect else None
-        new_tasks = {}
+        index = SearchIndex(self.todo_file)
+        if changes and index.exists():
+            index.update(data, changes)
 
-        # Nonexistent checks
-        if task_id not in self.proj_tasks.keys():
-            sys.exit(f'error: task #{task_id} does not exist in project "{self.project}".')
+    def save_history(self, records):
+        """Add archived tasks to the archive store (see ArchiveStore).
 
-        if new_prj not in [project for project in self.data.keys()]:
-            sys.exit(f'error: project "{new_prj}" does not exist.')
+        Args:
+            records: (list) Records of the archived tasks.
+        """
+        if records:
+            ArchiveStore(self.todo_file).append(records)
 
-        if self.args.move_to_sect:
-            if new_sect not in self.data[new_prj]['sections'].keys():
-                sys.exit(f'error: section "{new_sect}" does not exist in project "{new_prj}".')
 
-        # Task exists checks
-        moved_proj_tasks = self.data[new_prj]['tasks'].values()
-        if self.args.move_to_sect:
-            moved_sect_tasks = self.data[new_prj]['sections'][new_sect]
+class JournalStorage(Storage):
+    """Append-only journal storage for the todo file.
 
-        #   if moving to a project
-        if self.args.move_to_proj and self.proj_tasks[task_id] in moved_proj_tasks:
-            sys.exit(f'error: task #{task_id} already exists in project "{new_prj}".')
+    The todo file itself holds a snapshot, and each save appends only the
+      change records made since the last save to '<todo_file>.journal', one
+      JSON record per line. Loading replays the journal on top of the snapshot.
 
-        #   if moving to a section in the same project OR
-        #   if moving to a different section in a different project
-        if self.args.move_to_sect:
-            if (
-                (new_prj == self.project and int(task_id) in moved_sect_tasks)
-                or
-                (new_prj != self.project and self.proj_tasks[task_id] in moved_proj_tasks)
-               ):
-                sys.exit(f'error: task #{task_id} already exists in section "{new_sect}" of project "{new_prj}".')
+    Once the journal grows larger than the snapshot (and at least
+      'compact_size' bytes), it is compacted: the current data is written as a
+      new snapshot and the journal starts over. This keeps the amortized cost
+      of a save proportional to the size of the change.
 
-        # Remove task
-        for pos, task in self.proj_tasks.items():
-            if task != self.proj_tasks[task_id]:
-                new_pos = int(pos) if int(pos) < int(task_id) else int(pos) - 1
-                new_tasks[new_pos] = task
-        self.data[self.project]['tasks'] = new_tasks
-
-        # Update check
-        if int(task_id) in self.check_list:
-            self.check_list.remove(int(task_id))
-        for i, task_num in enumerate(self.data[self.project]['check']):
-            self.check_list[i] = task_num if task_num < int(task_id) else task_num - 1
-
-        # Update sections
-        for sect_name, sect_tasks in self.proj_sections.items():
-            new_sects = []
-            for task_num in sect_tasks:
-                if int(task_id) > task_num:
-                    new_sects.append(task_num)
-                elif int(task_id) < task_num:
-                    new_sects.append(task_num - 1)
-            self.proj_sections[sect_name] = new_sects
+    The first line of the journal records the size and mtime of the snapshot
+      it applies to. A journal whose header doesn't match the snapshot (e.g.,
+      a compaction was interrupted right after the snapshot was replaced) is
+      stale and is ignored.
 
-        # Add (writes to file there)
-        if self.args.move_to_proj:
-            self.add(self.proj_tasks.get(task_id), new_prj)
-        else:
-            self.add(self.proj_tasks.get(task_id), new_prj, new_sect)
+    Args:
+        todo_file:    (String)  Absolute path of the .todo configuration file.
+        cache:        (boolean) Indicates whether to use the on-disk cache.
+        compact_size: (int)     Minimum journal size, in bytes, before
+                                  compacting.
+    """
+    def __init__(self, todo_file, cache=False, compact_size=64 * 1024):
+        """Constructor. See class docstring."""
+        super().__init__(todo_file, cache)
+        self.journal_file = f'{todo_file}.journal'
+        self.compact_size = compact_size
 
-    # >>> Section functions
+    def snapshot_id(self):
+        """Return the [size, mtime] pair identifying the current snapshot."""
+        stat = os.stat(self.todo_file)
+        return [stat.st_size, stat.st_mtime_ns]
 
-    def section_add(self):
-        """Add a section."""
-        label = self.args.section_add
-        if label in self.proj_sections.keys():
-            sys.exit(f'section "{label}" already exists in project "{self.project}".')
+    def files(self):
+        """Return the files the data is loaded from."""
+        return [self.todo_file, self.journal_file]
 
-        self.proj_sections[label] = []
-        self.write()
+    def is_current(self):
+        """Return whether the journal was started on top of the current snapshot."""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                return json.loads(f.readline()).get('snapshot') == self.snapshot_id()
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def parse(self):
+        """Return the snapshot with the journal replayed on top of it."""
+        data = upgrade(self.read())
+        try:
+            with open(self.journal_file) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return data
+
+        if not lines or json.loads(lines[0]).get('snapshot') != self.snapshot_id():
+            return data
+
+        for line in lines[1:]:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # an append that was cut short; nothing after it was written
+                break
+            apply_change(data, change)
+        return upgrade(data)
+
+    def dump(self, data, changes):
+        """Append 'changes' to the journal, compacting it if needed.
 
-    def section_delete(self):
-        """Delete a section."""
-        label = self.args.section_delete
-        check = self.data[self.project]['check']
+        Args:
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save.
+        """
+        try:
+            journal_size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            journal_size = 0
+
+        if journal_size > max(self.compact_size, os.path.getsize(self.todo_file)):
+            self.compact(data)
+            return
+
+        with open(self.journal_file, 'ab') as f:
+            if journal_size and not self.is_current():
+                # parse() ignores a journal whose snapshot was replaced, so the
+                # changes would be lost if they were appended under its header
+                f.truncate(0)
+                journal_size = 0
+            if journal_size:
+                journal_size = self.drop_partial_line(f)
+            if not journal_size:
+                f.write(json.dumps({'snapshot': self.snapshot_id()}).encode() + b'\n')
+            f.write(''.join(json.dumps(change, default=to_json) + '\n'
+                            for change in changes).encode())
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
 
-        if label not in self.proj_sections.keys():
-            sys.exit(f'section "{label}" does not exist in project "{self.project}".')
+    @staticmethod
+    def drop_partial_line(f):
+        """Truncate an append that was cut short, so that the changes after it
+          aren't lost when the journal is replayed.
 
-        # delete section and section tasks
-        sect_tasks = self.proj_sections.get(label)
-        del self.proj_sections[label]
-        for task in sect_tasks:
-            self.proj_tasks.pop(str(task))
-        self.data[self.project]['check'] = list(set(check) - set(sect_tasks))
-
-        # update task indices
-        new_tasks = {}
-        for i, task_num in enumerate(self.proj_tasks.keys()):
-            new_tasks[str(i+1)] = self.proj_tasks.get(task_num)
-        self.data[self.project]['tasks'] = new_tasks
-
-        # update check list
-        for i, old_task_num in enumerate(self.data[self.project]['check']):
-            for new_task_num, task in self.data[self.project]['tasks'].items():
-                if task == self.proj_tasks[str(old_task_num)]:
-                    self.data[self.project]['check'][i] = int(new_task_num)
-
-        # update sections
-        all_sections, new_tnames = self.get_updated_sections(
-                                       self.proj_sections,
-                                       self.proj_tasks,
-                                       self.data[self.project]['tasks'],
-                                       set(self.data[self.project]['check']))
-        for sect_name, sect_tasks in self.proj_sections.items():
-            self.proj_sections[sect_name] = all_sections.get(sect_name)
+        Args:
+            f: (file) The journal, opened for appending in binary mode.
 
-        self.write()
+        Returns:
+            The size of the journal.
+        """
+        with open(f.name, 'rb') as journal:
+            size = journal.seek(-1, os.SEEK_END) + 1
+            if journal.read(1) == b'\n':
+                return size
+            journal.seek(0)
+            size = journal.read().rfind(b'\n') + 1
+        f.truncate(size)
+        return size
+
+    def compact(self, data):
+        """Write 'data' as a new snapshot and empty the journal.
 
-    def unsection(self):
-        "Move tasks out of sections."
-        for task_to_unsect in self.args.unsect:
-            for sect_name, sect_tasks in self.proj_sections.items():
-                if task_to_unsect in sect_tasks:
-                    self.proj_sections[sect_name].remove(task_to_unsect)
-        
-        self.write()
+        Args:
+            data: (dict) Contents of the todo file.
+        """
+        super().dump(data, [])
+        header = json.dumps({'snapshot': self.snapshot_id()}) + '\n'
+        atomic_write(self.journal_file, lambda f: f.write(header), fsync=self.fsync)
 
 
-"""
-[+++++++++++++++++++++++++++++++++++++++++++++]
-                 Curses
-[+++++++++++++++++++++++++++++++++++++++++++++]
-"""
+UNLOADED = object()
 
 
-class Menu(object):
-    """Manager for curses drawings.
+class LazyProjects(dict):
+    """Projects that are only loaded when they're accessed.
+
+    Unloaded projects are stored as UNLOADED and are swapped for the loaded
+      project the first time they're accessed through indexing, get(),
+      values(), or items(). Iterating over the names doesn't load anything.
 
     Args:
-        stdscr: (Window) Represents the entire screen.
+        loader: (function) Takes a project name and returns the project.
+        names:  (list)     Names of all projects, in order.
+    """
+    def __init__(self, loader, names):
+        """Constructor. See class docstring."""
+        super().__init__((name, UNLOADED) for name in names)
+        self.loader = loader
+
+    def __getitem__(self, name):
+        project = super().__getitem__(name)
+        if project is UNLOADED:
+            project = upgrade_project(self.loader(name))
+            super().__setitem__(name, project)
+        return project
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+    def loaded(self):
+        """Return the names of the projects that have been loaded."""
+        return [name for name, project in dict.items(self) if project is not UNLOADED]
+
+
+class ShardedStorage(Storage):
+    """Sharded storage for the todo file, with one file per project.
+
+    Projects are kept in '<todo_file>.d/', one JSON shard per project, along
+      with 'index.json', which lists the projects' names in order (which is
+      also what their colors are based on) and the shard each one is in.
+      Shards are named by a permanent number so renaming a project only
+      changes the index.
+
+    Projects are only read when they are accessed (see LazyProjects) and only
+      the shards of projects that were changed are written, so commands for a
+      single project only touch that project's shard. The first time it's
+      used, the existing todo file is split into shards.
+
+    The on-disk parse cache isn't used since shards are read on demand.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        cache:     (boolean) Ignored.
 
     Attributes:
-        begin_x: (int) Starting x coordinate of the curses window.
-        begin_y: (int) Starting y coordinate of the curses window.
-        height: (int)  Height of curses window.
-        width: (int)   Width of curses window.
-        win: (Window)  A Window object to draw on.    
-        colors: (dict) All current project colors (as keys) and their respective
-                         color pairs initialized in init_colors().
-        hash: (String)  Prefix for unchecked tasks.
-        check: (String) Prefix for checked tasks.
-        blank: (String) A blank line with the same length as the project box.
+        shard_dir:    (String) Directory holding the index and the shards.
+        index_file:   (String) Path of the index.
+        index:        (dict)   Project names (as keys) and their shard number
+                                 (as values) under "projects", and the next
+                                 free shard number under "next".
+        shard_stamps: (dict)   Shard numbers (as keys) and stamps (as values)
+                                 of the shards that were read or written.
     """
-    def __init__(self, stdscr):
+    def __init__(self, todo_file, cache=False):
         """Constructor. See class docstring."""
-        # Window attributes
-        self.begin_x = 1
-        self.begin_y = 2
-        self.height = curses.LINES
-        self.width = curses.COLS
-        self.win = newwin(self.height, self.width, self.begin_y, self.begin_x)
+        super().__init__(todo_file, cache=False)
+        self.shard_dir = f'{todo_file}.d'
+        self.index_file = os.path.join(self.shard_dir, 'index.json')
+        self.index = None
+        self.shard_stamps = {}
 
-        # Colors
-        self.init_colors()
-        self.colors = {"r": (1, 2, 3, 4, 5, 6, 7, 8, 9),
-                       "g": (10, 11, 12, 13, 14, 15, 16, 17, 18),
-                       "b": (19, 20, 21, 22, 23, 24, 25, 26, 27),
-                       "v": (28, 29, 30, 31, 32, 33, 34, 35, 36)}
+    def shard_file(self, name):
+        """Return the path of a project's shard."""
+        return self.shard_path(self.index['projects'][name])
 
-        # Prefixes
-        self.hash   = '  # '
-        self.check  = '  ✓ '
-        self.utask  = '  □ '
-        self.blank  = '{}\n'.format(' ' * 58)
+    def shard_path(self, number):
+        """Return the path of the shard with a given shard number."""
+        return os.path.join(self.shard_dir, f'{number}.json')
 
-    def __repr__(self):
-        """Return attributes.
+    @staticmethod
+    def file_stamp(path):
+        """Return the size and mtime of a file, or None if it's missing."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def stamp(self):
+        """Return the stamps of the index and of the shards read so far."""
+        return (self.file_stamp(self.index_file),
+                {number: self.file_stamp(self.shard_path(number))
+                 for number in self.shard_stamps})
+
+    def load(self):
+        """Return the projects, without reading any shard yet."""
+        if self.data is not None and self.stamp() == self.data_stamp:
+            return self.data
+
+        if not os.path.exists(self.index_file):
+            self.split()
+        with open(self.index_file) as f:
+            self.index = json.load(f)
+
+        self.data = LazyProjects(self.load_project, list(self.index['projects']))
+        self.shard_stamps = {}
+        self.data_stamp = (self.file_stamp(self.index_file), self.shard_stamps)
+        return self.data
+
+    def load_project(self, name):
+        """Read a project's shard.
 
-        We don't really need to return the prefixes do we?
+        Args:
+            name: (String) Name of the project.
         """
-        return (f'Menu({self.begin_x}, {self.begin_y}, {self.height}, '
-                f'{self.width}, {self.win}, {self.colors})')
+        with open(self.shard_file(name)) as f:
+            project = json.load(f)
 
-    def init_colors(self):
-        """Initialize custom curses color pairs.
+        # the shard is now part of what the data is checked against
+        number = self.index['projects'][name]
+        self.shard_stamps[number] = self.file_stamp(self.shard_path(number))
+        return project
 
-        Color pair mapping:
+    def split(self):
+        """Split the todo file into shards and write the index."""
+        os.makedirs(self.shard_dir, exist_ok=True)
+        try:
+            data = self.read()
+        except FileNotFoundError:
+            data = {}
 
-            Let x = {1, 10, 19, 28},
+        self.index = {'projects': {}, 'next': 1}
+        for name, project in data.items():
+            self.write_shard(name, project)
+        self.write_index()
 
-                x:        ! and double quotes ("")
-                x + 1:    Color letter (e.g., r, g, b)
-                x + 2:    Project name
-                x + 3:    Body background
-                x + 4:    Task
-                x + 5:    Hash
-                x + 6:    Section name
-                x + 7:    Checkmark
-                x + 8:    Index
+    def write_shard(self, name, project):
+        """Write a project's shard, giving it a shard number if it's new.
+
+        Args:
+            name:    (String) Name of the project.
+            project: (dict)   The project's sections, tasks, and check list.
         """
-        curses.use_default_colors()
+        if name not in self.index['projects']:
+            self.index['projects'][name] = self.index['next']
+            self.index['next'] += 1
+        atomic_write(self.shard_file(name), lambda f: json.dump(project, f, default=to_json),
+                     fsync=self.fsync)
 
-        # Red
-        curses.init_pair(1, 203, 167)
-        curses.init_pair(2, 210, 167)
-        curses.init_pair(3, 253, 167)
-        curses.init_pair(4, -1, 131)
-        curses.init_pair(5, 253, 131)
-        curses.init_pair(6, 203, 131)
-        curses.init_pair(7, 210, 131)
-        curses.init_pair(8, 46, 131)
-        curses.init_pair(9, 180, 131)
-
-        # Green
-        curses.init_pair(10, 76, 71)
-        curses.init_pair(11, 119, 71)
-        curses.init_pair(12, 253, 71)
-        curses.init_pair(13, -1, 65)
-        curses.init_pair(14, 253, 65)
-        curses.init_pair(15, 76, 65)
-        curses.init_pair(16, 210, 65)
-        curses.init_pair(17, 46, 65)
-        curses.init_pair(18, 180, 65)
-
-        # Blue
-        curses.init_pair(19, 75, 69)
-        curses.init_pair(20, 45, 69)
-        curses.init_pair(21, 253, 69)
-        curses.init_pair(22, -1, 67)
-        curses.init_pair(23, 253, 67)
-        curses.init_pair(24, 75, 67)
-        curses.init_pair(25, 210, 67)
-        curses.init_pair(26, 46, 67)
-        curses.init_pair(27, 180, 67)
-
-        # Violet
-        curses.init_pair(28, 171, 141)
-        curses.init_pair(29, 219, 141)
-        curses.init_pair(30, 253, 141)
-        curses.init_pair(31, -1, 97)
-        curses.init_pair(32, 253, 97)
-        curses.init_pair(33, 171, 97)
-        curses.init_pair(34, 210, 97)
-        curses.init_pair(35, 46, 97)
-        curses.init_pair(36, 180, 97)
-
-    def draw_banner(self, stdscr, clrs, proj_color, proj_name, end_banner):
-        """Draw the TODO project's banner.
+    def write_index(self):
+        """Write the index."""
+        atomic_write(self.index_file, lambda f: json.dump(self.index, f), fsync=self.fsync)
 
-        The banner includes the "!!!"  prefix, the project's color label (e.g.,
-          r, g, b), and and project's name.
+    def dump(self, data, changes):
+        """Write the shards of the projects that changed.
+
+        The changed projects are the first keys of the changes' paths. The
+          index is only written when projects were created, deleted, renamed,
+          or reordered.
 
         Args:
-            stdscr:     (Window)  Represents the entire screen.
-            clrs:       (tuple)   8 sequential numbers that corresponds to the
-                                    proper curses color pair.
-            proj_color: (String)  Color of project (e.g., r, g, b).
-            proj_name:  (String)  Name of project.
-            end_banner: (String)  A line full of spaces to finish the banner.
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save.
         """
-        end_banner = '"{}\n'.format(' ' * (56 - len(proj_name) - 9))
-        self.win.addstr(' !!! ', curses.color_pair(clrs[0]))
-        self.win.addstr(f'{proj_color}   ', curses.A_BOLD | curses.color_pair(clrs[1]))
-        self.win.addstr('"', curses.color_pair(clrs[0]))
-        self.win.addstr(proj_name, curses.A_BOLD | curses.color_pair(clrs[2]))
-        self.win.addstr(end_banner, curses.color_pair(clrs[0]))
-
-    def draw_tasks(self, stdscr, task_num, tname, check_list, clrs, section=False):
-        """Draw regular and section tasks.
+        projects = self.index['projects']
+        old_index = json.dumps(self.index)
+        changed = []
+
+        for op, path, *args in changes:
+            if op == 'rename' and len(path) == 1:
+                # the project may be new too, if several commands were saved
+                #   at once (see BatchStorage)
+                if path[0] in projects:
+                    projects[args[0]] = projects.pop(path[0])
+                if path[0] in changed:
+                    changed[changed.index(path[0])] = args[0]
+            elif path[0] not in changed:
+                changed.append(path[0])
+
+        for name in changed:
+            if name in data:
+                self.write_shard(name, data[name])
+            elif name in projects:
+                os.remove(self.shard_file(name))
+                del projects[name]
+
+        if list(projects) != list(data):
+            self.index['projects'] = {name: projects[name] for name in data}
+        if json.dumps(self.index) != old_index:
+            self.write_index()
+
+    def save(self, data, changes):
+        """Write the changed shards and remember 'data' as the current contents.
 
         Args:
-            stdscr:     (Window)  Represents the entire screen.
-            task_num:   (int).    The task's index.
-            tname:      (String)  Name of task.
-            check_list: (list)    Contains task numbers that are checked.
-            clrs:       (tuple)   8 sequential numbers that correspond to the
-                                    proper curses color pair.
-            section:    (boolean) Indicates whether the current task is a
-                                    regular or section task.
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save.
         """
-        tindex = f'  {task_num}'
-        # tindex = '    '
-        length = 42 if section else 44  # amount of characters a task line can be
-        # 'prefix' is the spacing after index but before □ or ✓. For substrings
-        #   longer than 'length', we have to manually add spaces ('sub_space')
-        #   since we're not drawing the index, which gives 3 or 4 spaces.
-        prefix = ' ' * (9 - len(tindex)) if section else ' ' * (7 - len(tindex))
-        if task_num < 10:
-            suffix = f'{" " * (56 - len(tname) - (len(prefix) + 5))}\n'
-        else:
-            suffix = f'{" " * (56 - len(tname) - (len(prefix) + 6))}\n'
+        self.dump(data, changes)
+        self.data = data
+        self.shard_stamps = {}
+        for name in data.loaded():
+            number = self.index['projects'][name]
+            self.shard_stamps[number] = self.file_stamp(self.shard_path(number))
+        self.data_stamp = (self.file_stamp(self.index_file), self.shard_stamps)
+        self.update_search(data, changes)
 
-        if len(tname) > length:
-            for line, substr in enumerate(textwrap.wrap(tname, width=length)):
-                if task_num < 10:
-                    suffix = f'{" " * (56 - len(substr) - (len(prefix) + 5))}\n'
-                else:
-                    suffix = f'{" " * (56 - len(substr) - (len(prefix) + 6))}\n'
 
-                if line == 0:
-                    if task_num in check_list:
-                        self.win.addstr(f'{tindex}', curses.color_pair(clrs[8]))
-                        self.win.addstr(f'{prefix}{self.check}', curses.color_pair(clrs[7]))
-                        self.win.addstr(f'{substr}{suffix}', curses.color_pair(clrs[4]))
-                    else:
-                        self.win.addstr(f'{tindex}', curses.color_pair(clrs[8]))
-                        self.win.addstr(f'{prefix}{self.utask}{substr}{suffix}', curses.color_pair(clrs[4]))
-                else:
-                    sub_space = ' ' * 7 if task_num < 10 else ' ' * 8
-                    self.win.addstr(f'{prefix}{sub_space}{substr}{suffix}', curses.color_pair(clrs[4]))
-        else:
-            if task_num in check_list:
-                self.win.addstr(f'{tindex}', curses.color_pair(clrs[8]))
-                self.win.addstr(f'{prefix}{self.check}', curses.color_pair(clrs[7]))
-                self.win.addstr(f'{tname}{suffix}', curses.color_pair(clrs[4]))
-            else:
-                self.win.addstr(f'{tindex}', curses.color_pair(clrs[8]))
-                self.win.addstr(f'{prefix}{self.utask}{tname}{suffix}', curses.color_pair(clrs[4]))
+class TaskRanks(object):
+    """The ranks of a project's ordered tasks in the database, in order.
 
-    def draw_sections(self, stdscr, check_list, clrs, proj_tasks, sect_name,
-                      sect_tasks):
-        """Draw sections.
+    Kept next to the database by SqliteStorage, so the rank at a position is
+      looked up by bisecting a list instead of having sqlite skip over every
+      task before it.
 
-        Args:
-            stdscr:     (Window) Represents the entire screen.
-            check_list: (list)   Task indices for tasks marked as checked.
-            clrs:       (tuple)  8 sequential numbers that correspond to the
-                                   proper curses color pair.
-            proj_tasks: (dict)   All tasks and their index for the specified
-                                   project.
-            sect:       (dict)   Name and tasks for the current section.
-        """
-        end_sec = '{}\n'.format(' ' * (56 - len(sect_name) - 9))
+    Args:
+        rows: (iterable) (task ID, rank) pairs, ordered by rank.
 
-        # Section header
-        self.win.addstr(f'{" " * 6} {self.hash}', curses.color_pair(clrs[5]))
-        self.win.addstr(f'{sect_name}{end_sec}', curses.color_pair(clrs[6]))
+    Attributes:
+        ranks: (list) Ranks in order.
+        ids:   (list) The task ID of each rank.
+        where: (dict) Ranks (as values) by task ID (as keys).
+    """
+    def __init__(self, rows=()):
+        """Constructor. See class docstring."""
+        self.ranks, self.ids, self.where = [], [], {}
+        for task_id, rank in rows:
+            self.ranks.append(rank)
+            self.ids.append(task_id)
+            self.where[task_id] = rank
 
-        # Section tasks
-        for task_num in sect_tasks:
-            tname = proj_tasks.get(str(task_num))
-            wrapper(self.draw_tasks, task_num, tname, check_list, clrs,
-                    section=True)
-        self.win.addstr(self.blank, curses.color_pair(clrs[3]))
+    def __repr__(self):
+        """Return attributes."""
+        return f'TaskRanks({list(zip(self.ids, self.ranks))})'
 
-    def draw_prjsect(self, stdscr, projects, proj_sections, proj_tasks, project, section):
-        """Draw a specific project.
+    def __len__(self):
+        return len(self.ranks)
 
-        If a section is specified, draw only the project, the specified section,
-            and its tasks.
+    def add(self, task_id, rank):
+        """Place a task at 'rank'."""
+        from bisect import bisect_right
 
-        Args:
-            stdscr:        (Window) Represents the entire screen.
-            proj_sections: (dict)   All section names and their tasks.
-            proj_tasks:    (dict)   All tasks and their index for the specified
-                                      project.
-            project:       (String) Name of the specified project.
-            section:       (String) Name of the specified section.
-        """
-        check_list = projects.get(project).get('check')
-        end_banner = '"{}\n'.format(' ' * (56 - len(project) - 9))
+        self.discard(task_id)
+        i = bisect_right(self.ranks, rank)
+        self.ranks.insert(i, rank)
+        self.ids.insert(i, task_id)
+        self.where[task_id] = rank
 
-        # Colors
-        for i, prj in enumerate(projects):
-            if prj == project:
-                proj_color = list(self.colors.keys())[i % len(self.colors)]
-        clrs = self.colors.get(proj_color)
+    def discard(self, task_id):
+        """Take a task out of the order, if it's in it."""
+        from bisect import bisect_left
 
-        # Banner
-        wrapper(self.draw_banner, clrs, proj_color, project, end_banner)
+        rank = self.where.pop(task_id, None)
+        if rank is not None:
+            i = bisect_left(self.ranks, rank)
+            del self.ranks[i], self.ids[i]
 
-        # Pre-body
-        self.win.addstr(self.blank * 2, curses.color_pair(clrs[3]))
+    def discard_all(self, task_ids):
+        """Take many tasks out of the order, in one pass over it."""
+        task_ids = set(task_ids)
+        kept = [i for i, task_id in enumerate(self.ids) if task_id not in task_ids]
+        self.ranks = [self.ranks[i] for i in kept]
+        self.ids = [self.ids[i] for i in kept]
+        self.where = dict(zip(self.ids, self.ranks))
 
-        # Body
-        if section:
-            # sections and section tasks
-            wrapper(self.draw_sections, check_list, clrs, proj_tasks, section,
-                    proj_sections[section])
-
-            # end lines
-            self.win.addstr(self.blank * 2, curses.color_pair(clrs[3]))
-        elif project:
-            # sections and section tasks
-            for sect_name, sect_tasks in proj_sections.items():
-                wrapper(self.draw_sections, check_list, clrs, proj_tasks,
-                        sect_name, sect_tasks)
-            if proj_sections:
-                self.win.addstr(self.blank, curses.color_pair(clrs[3]))
-
-            # tasks
-            #   we str(task) cause proj_tasks' keys are Strings, and it'd be
-            #   very annoying if we had to convert all_sect_tasks elements later
-            all_sect_tasks = [str(task) for tasks in proj_sections.values() for task in tasks]
-
-            for task_num, tname in proj_tasks.items():
-                if task_num not in all_sect_tasks:
-                    wrapper(self.draw_tasks, int(task_num), tname, check_list,
-                            clrs, section=False)
-
-            # end lines
-            #   If there are regular tasks, we need to add 3 blank lines,
-            #   otherwise just add 1 since draw_sections() adds 2 already (one
-            #   between sections and one right before tasks).
-            body_end = 3 if set(proj_tasks.keys()) - set(all_sect_tasks) else 1
-            self.win.addstr(self.blank * body_end, curses.color_pair(clrs[3]))
-
-        # Block
-        self.win.getch()
 
-    def draw_all(self, stdscr, projects):
-        """Draw all projects, sections, and tasks.
+class SqliteStorage(Storage):
+    """SQLite storage for the todo file.
+
+    Projects, sections, and tasks are kept in indexed tables in
+      '<todo_file>.db'. Projects are loaded row by row when they're accessed
+      (see LazyProjects), and saving turns each change record into a single
+      indexed statement, all in one transaction. Change records that Todo
+      doesn't make (see Todo.record()) are rejected.
+
+    Task order is kept as a 'rank' per task, so inserting a task only has to
+      look at its neighbours' ranks. The ranks of loaded projects are also
+      kept in memory (see TaskRanks) to find the rank at a position. Each
+      task belongs to at most one section.
+
+    The first time it's used, the existing todo file is imported. The on-disk
+      parse cache isn't used.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        cache:     (boolean) Ignored.
+
+    Attributes:
+        db_file:     (String)     Path of the database.
+        db:          (Connection) Connection to the database.
+        project_ids: (dict)       Project names (as keys) and row IDs (as
+                                    values) looked up so far.
+        task_ranks:  (dict)       TaskRanks (as values) by project row ID
+                                    (as keys).
+    """
+    schema = """
+        CREATE TABLE IF NOT EXISTS projects (
+            id       INTEGER PRIMARY KEY,
+            name     TEXT NOT NULL UNIQUE,
+            position INTEGER NOT NULL,
+            next     INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sections (
+            id       INTEGER PRIMARY KEY,
+            project  INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            name     TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            UNIQUE (project, name)
+        );
+        CREATE TABLE IF NOT EXISTS tasks (
+            project  INTEGER NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+            id       INTEGER NOT NULL,
+            label    TEXT NOT NULL,
+            rank     REAL,
+            checked  INTEGER NOT NULL DEFAULT 0,
+            section  INTEGER REFERENCES sections(id) ON DELETE SET NULL,
+            PRIMARY KEY (project, id)
+        );
+        CREATE INDEX IF NOT EXISTS tasks_rank ON tasks (project, rank);
+        CREATE INDEX IF NOT EXISTS tasks_section ON tasks (project, section);
+        CREATE INDEX IF NOT EXISTS tasks_checked ON tasks (project, checked);
+    """
+
+    def __init__(self, todo_file, cache=False):
+        """Constructor. See class docstring."""
+        super().__init__(todo_file, cache=False)
+        self.db_file = f'{todo_file}.db'
+        self.db = None
+        self.project_ids = {}
+        self.task_ranks = {}
+
+    def files(self):
+        """Return the files the data is loaded from."""
+        return [self.db_file]
+
+    def connect(self):
+        """Open the database, importing the todo file if it doesn't exist."""
+        if self.db is not None:
+            return
+        import sqlite3
+
+        new = not os.path.exists(self.db_file)
+        # the connection can only be shared by threads when sqlite serializes
+        #   access to it, otherwise projects are loaded by one thread
+        self.threadsafe = sqlite3.threadsafety == 3
+        self.db = sqlite3.connect(self.db_file, check_same_thread=not self.threadsafe)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        if not self.fsync:
+            self.db.execute('PRAGMA synchronous = OFF')
+        with self.db:
+            self.db.executescript(self.schema)
+            if new:
+                try:
+                    data = upgrade(self.read())
+                except FileNotFoundError:
+                    data = {}
+                for name, project in data.items():
+                    self.write_project(name, project)
+
+    def load(self):
+        """Return the projects, without reading any of their rows yet."""
+        if self.data is not None and self.stamp() == self.data_stamp:
+            return self.data
+
+        self.connect()
+        self.project_ids = {}
+        self.task_ranks = {}
+        names = [name for name, in self.db.execute(
+            'SELECT name FROM projects ORDER BY position')]
+        self.data = LazyProjects(self.load_project, names)
+        self.data_stamp = self.stamp()
+        return self.data
+
+    def load_project(self, name):
+        """Read a project's sections and tasks.
 
         Args:
-            stdscr:        (Window) Represents the entire screen.
-            projects:      (dict)   All projects (as keys) and their sections and
-                                      tasks (as values).
+            name: (String) Name of the project.
         """
-        for i, proj_name in enumerate(projects):
-            proj_sections = projects[proj_name]['sections']
-            proj_tasks = projects[proj_name]['tasks']
-            check_list = projects[proj_name]['check']
-            proj_color = list(self.colors.keys())[i % len(self.colors)]
-            clrs = self.colors.get(proj_color)
-
-            # Banner
-            end_banner = '"{}\n'.format(' ' * (56 - len(proj_name) - 9))
-            wrapper(self.draw_banner, clrs, proj_color, proj_name, end_banner)
-
-            # Pre-body
-            self.win.addstr(self.blank * 2, curses.color_pair(clrs[3]))
-
-            # Body
-            #   section
-            for sect_name, sect_tasks in proj_sections.items():
-                wrapper(self.draw_sections, check_list, clrs, proj_tasks,
-                        sect_name, sect_tasks)
-
-            #   tasks
-            all_sect_tasks = [str(task) for tasks in proj_sections.values() for task in tasks]
-            if proj_sections:
-                self.win.addstr(self.blank, curses.color_pair(clrs[3]))
-            for task_num, tname in proj_tasks.items():
-                if task_num not in all_sect_tasks:
-                    wrapper(self.draw_tasks, int(task_num), tname, check_list,
-                    clrs, section=False)
-
-            #   end lines
-            body_end = 3 if set(proj_tasks.keys()) - set(all_sect_tasks) else 1
-            self.win.addstr(self.blank * body_end, curses.color_pair(clrs[3]))
-
-            # Project spacing
-            self.win.addstr(' ' * self.width)
-            self.win.addstr(' ' * self.width)
-
-        # Block
-        self.win.getch()
+        project_id = self.project_id(name)
+        next_id, = self.db.execute('SELECT next FROM projects WHERE id = ?',
+                                   (project_id,)).fetchone()
+
+        sections = {}
+        section_names = {}
+        for section_id, sect_name in self.db.execute(
+                'SELECT id, name FROM sections WHERE project = ? ORDER BY position',
+                (project_id,)):
+            sections[sect_name] = []
+            section_names[section_id] = sect_name
+
+        tasks, order, check, ranks = {}, [], [], []
+        for task_id, label, rank, checked, section_id in self.db.execute(
+                'SELECT id, label, rank, checked, section FROM tasks '
+                'WHERE project = ? ORDER BY rank', (project_id,)):
+            tasks[str(task_id)] = label
+            if rank is not None:
+                order.append(task_id)
+                ranks.append((task_id, rank))
+            if checked:
+                check.append(task_id)
+            if section_id is not None:
+                sections[section_names[section_id]].append(task_id)
+        self.task_ranks[project_id] = TaskRanks(ranks)
+
+        return {'sections': sections, 'tasks': tasks, 'check': check,
+                'order': order, 'next': next_id}
+
+    def project_id(self, name):
+        """Return the row ID of a project."""
+        if name not in self.project_ids:
+            row = self.db.execute('SELECT id FROM projects WHERE name = ?',
+                                  (name,)).fetchone()
+            self.project_ids[name] = row[0]
+        return self.project_ids[name]
+
+    def write_project(self, name, project):
+        """Replace all rows of a project.
 
-"""
-[+++++++++++++++++++++++++++++++++++++++++++++]
-                   Main
-[+++++++++++++++++++++++++++++++++++++++++++++]
-"""
+        Args:
+            name:    (String) Name of the project.
+            project: (dict)   The project's sections, tasks, and check list.
+        """
+        row = self.db.execute('SELECT position FROM projects WHERE name = ?',
+                              (name,)).fetchone()
+        if row:
+            position, = row
+            self.db.execute('DELETE FROM projects WHERE name = ?', (name,))
+        else:
+            position, = self.db.execute(
+                'SELECT COALESCE(MAX(position), 0) + 1 FROM projects').fetchone()
+
+        project_id = self.db.execute(
+            'INSERT INTO projects (name, position, next) VALUES (?, ?, ?)',
+            (name, position, project['next'])).lastrowid
+        self.project_ids[name] = project_id
+
+        task_sections = {}
+        for i, (sect_name, sect_tasks) in enumerate(project['sections'].items()):
+            section_id = self.db.execute(
+                'INSERT INTO sections (project, name, position) VALUES (?, ?, ?)',
+                (project_id, sect_name, i)).lastrowid
+            for task_id in sect_tasks:
+                task_sections[task_id] = section_id
+
+        check = set(project['check'])
+        self.db.executemany(
+            'INSERT INTO tasks (project, id, label, rank, checked, section) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            ((project_id, task_id, project['tasks'][str(task_id)], rank,
+              task_id in check, task_sections.get(task_id))
+             for rank, task_id in enumerate(project['order'])))
+
+    def section_id(self, project_id, sect_name):
+        """Return the row ID of a section."""
+        return self.db.execute(
+            'SELECT id FROM sections WHERE project = ? AND name = ?',
+            (project_id, sect_name)).fetchone()[0]
+
+    def ranks(self, project_id):
+        """Return the TaskRanks of a project, reading them if needed."""
+        if project_id not in self.task_ranks:
+            self.task_ranks[project_id] = TaskRanks(self.db.execute(
+                'SELECT id, rank FROM tasks WHERE project = ? AND rank IS NOT NULL '
+                'ORDER BY rank', (project_id,)))
+        return self.task_ranks[project_id]
+
+    def set_rank(self, project_id, task_id, rank):
+        """Place a task at 'rank', or take it out of the order if it's None."""
+        self.db.execute('UPDATE tasks SET rank = ? WHERE project = ? AND id = ?',
+                        (rank, project_id, task_id))
+        if rank is None:
+            self.ranks(project_id).discard(task_id)
+        else:
+            self.ranks(project_id).add(task_id, rank)
 
+    def rank_at(self, project_id, index):
+        """Return the rank of the task at 0-based position 'index', or None."""
+        ranks = self.ranks(project_id).ranks
+        return ranks[index] if 0 <= index < len(ranks) else None
 
-def main(todo_file):
-    """Main program, used when ran as a script."""
-    logging.basicConfig(level=logging.DEBUG)
-    menu = wrapper(Menu)
-    parser = create_parser(menu, todo_file)
-    todo = Todo(menu, parser, todo_file)
-
-    # Non-normal modes
-    if parser.create:
-        todo.create()
-    elif parser.delete:
-        todo.delete()
-    elif parser.archive:
-        todo.archive()
-    # Normal mode
-    else:
-        if parser.add:
-            todo.add(parser.add, parser.project, parser.section)
-        elif parser.task_delete or parser.task_delete == 0:
-            todo.task_delete()
-        elif parser.check or parser.uncheck:
-            check = True if parser.check else False
-            todo.check_uncheck(check)
-        elif parser.move_to_proj or parser.move_to_sect:
-            todo.move_task()
-        elif parser.section_add:
-            todo.section_add()
-        elif parser.section_delete:
-            todo.section_delete()
-        elif parser.rename:
-            todo.rename()
-        elif parser.unsect:
-            todo.unsection()
-        elif parser.insert:
-            todo.insert()
-        elif parser.project or (parser.project and parser.section):
-            # try:
-            todo.show()
-            # except:
-            #     sys.exit('error: terminal window is not large enough.')
+    def insert_rank(self, project_id, index=None):
+        """Return a rank that places a task at 0-based position 'index'.
+
+        If the neighbouring ranks are too close together to fit another one
+          in between, the project's ranks are spread out again first.
+
+        Args:
+            project_id: (int) Row ID of the task's project.
+            index:      (int) Position of the task, or None to append it.
+        """
+        ranks = self.ranks(project_id)
+        after = self.rank_at(project_id, index) if index is not None else None
+        if after is None:
+            return (ranks.ranks[-1] if ranks.ranks else 0) + 1
+
+        before = self.rank_at(project_id, index - 1) if index > 0 else None
+        if before is None:
+            return after - 1
+
+        rank = (before + after) / 2
+        if before < rank < after:
+            return rank
+
+        task_ids = ranks.ids
+        self.db.executemany(
+            'UPDATE tasks SET rank = ? WHERE project = ? AND id = ?',
+            ((rank, project_id, task_id) for rank, task_id in enumerate(task_ids)))
+        self.task_ranks[project_id] = TaskRanks(
+            (task_id, float(rank)) for rank, task_id in enumerate(task_ids))
+        return index - 0.5
+
+    def execute(self, change):
+        """Apply a change record to the database.
 
+        Args:
+            change: (list) The change record to apply (see apply_change()).
+        """
+        op, path, *args = change
+        name = path[0]
+
+        # projects
+        if len(path) == 1:
+            if op == 'set':
+                self.write_project(name, args[0])
+            elif op == 'del':
+                self.db.execute('DELETE FROM projects WHERE name = ?', (name,))
+            elif op == 'rename':
+                self.db.execute('UPDATE projects SET name = ? WHERE name = ?',
+                                (args[0], name))
+            else:
+                raise ValueError(f'unsupported change: {change}')
+            self.task_ranks.pop(self.project_ids.pop(name, None), None)
+            return
+
+        project_id = self.project_id(name)
+        field, key = path[1], path[2] if len(path) > 2 else None
+
+        if field == 'next' and op == 'set':
+            self.db.execute('UPDATE projects SET next = ? WHERE id = ?',
+                            (args[0], project_id))
+        elif field == 'tasks' and key and op == 'set':
+            self.db.execute(
+                'INSERT INTO tasks (project, id, label) VALUES (?, ?, ?) '
+                'ON CONFLICT (project, id) DO UPDATE SET label = excluded.label',
+                (project_id, int(key), args[0]))
+        elif field == 'tasks' and key and op == 'del':
+            self.db.execute('DELETE FROM tasks WHERE project = ? AND id = ?',
+                            (project_id, int(key)))
+            self.ranks(project_id).discard(int(key))
+        elif field == 'order' and op in ('append', 'insert'):
+            index = args[0] if op == 'insert' else None
+            task_id = args[-1]
+            self.set_rank(project_id, task_id, self.insert_rank(project_id, index))
+        elif field == 'order' and op == 'pop':
+            self.set_rank(project_id, self.ranks(project_id).ids[args[0]], None)
+        elif field == 'check' and op in ('append', 'remove'):
+            self.db.execute('UPDATE tasks SET checked = ? WHERE project = ? AND id = ?',
+                            (op == 'append', project_id, args[0]))
+        elif field == 'sections' and key and op == 'set' and not args[0]:
+            self.db.execute(
+                'INSERT INTO sections (project, name, position) '
+                'SELECT ?, ?, COALESCE(MAX(position), 0) + 1 FROM sections '
+                'WHERE project = ?', (project_id, key, project_id))
+        elif field == 'sections' and key and op == 'del':
+            self.db.execute('DELETE FROM sections WHERE project = ? AND name = ?',
+                            (project_id, key))
+        elif field == 'sections' and key and op == 'rename':
+            self.db.execute('UPDATE sections SET name = ? WHERE project = ? AND name = ?',
+                            (args[0], project_id, key))
+        elif field == 'sections' and key and op in ('append', 'remove'):
+            section_id = self.section_id(project_id, key)
+            if op == 'append':
+                self.db.execute('UPDATE tasks SET section = ? WHERE project = ? AND id = ?',
+                                (section_id, project_id, args[0]))
+            else:
+                self.db.execute(
+                    'UPDATE tasks SET section = NULL '
+                    'WHERE project = ? AND id = ? AND section = ?',
+                    (project_id, args[0], section_id))
+        elif op == 'remove_all' and (field in ('tasks', 'order', 'check') or
+                                     (field == 'sections' and key)):
+            statement = {
+                'tasks': 'DELETE FROM tasks WHERE project = ? AND id = ?',
+                'order': 'UPDATE tasks SET rank = NULL WHERE project = ? AND id = ?',
+                'check': 'UPDATE tasks SET checked = 0 WHERE project = ? AND id = ?',
+                'sections': 'UPDATE tasks SET section = NULL WHERE project = ? AND id = ?',
+            }[field]
+            self.db.executemany(statement, ((project_id, int(task_id)) for task_id in args[0]))
+            if field in ('tasks', 'order'):
+                self.ranks(project_id).discard_all(int(task_id) for task_id in args[0])
+        else:
+            raise ValueError(f'unsupported change: {change}')
+
+    def save(self, data, changes):
+        """Apply 'changes' in one transaction and remember 'data'.
+
+        Args:
+            data:    (dict) Contents of the todo file.
+            changes: (list) Change records since the last save.
+        """
+        self.connect()
+        try:
+            with self.db:
+                for change in changes:
+                    self.execute(change)
+        except Exception:
+            # the transaction was rolled back, so the ranks kept in memory
+            #   may be ahead of the database
+            self.task_ranks = {}
+            raise
+        self.data = data
+        self.data_stamp = self.stamp()
+        self.update_search(data, changes)
+
+
+class BatchStorage(object):
+    """Holds the saves made to a storage until they're committed.
+
+    Used to run several commands against one in-memory copy of the todo file
+      and write it once (see batch()). Everything but saving is passed
+      through to the wrapped storage.
+
+    Args:
+        storage: (Storage) Backend to save to on commit().
+
+    Attributes:
+        data:    (dict) Contents of the todo file as of the last save.
+        changes: (list) Change records of all saves since the last commit.
+        history: (list) Records of tasks archived since the last commit.
+    """
+    def __init__(self, storage):
+        """Constructor. See class docstring."""
+        self.storage = storage
+        self.data = None
+        self.changes = []
+        self.history = []
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'BatchStorage({self.storage}, {len(self.changes)})'
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def save(self, data, changes):
+        """Hold 'changes' until commit().
+
+        The changes are copied as they are now, since later commands can
+          still modify the values they refer to (e.g., a new project).
+        """
+        self.data = data
+        self.changes.extend(json.loads(json.dumps(changes, default=to_json)))
+
+    def save_history(self, records):
+        """Hold archived tasks until commit()."""
+        self.history.extend(records)
+
+    def commit(self):
+        """Save everything held so far in one write."""
+        self.storage.save_history(self.history)
+        if self.data is not None:
+            self.storage.save(self.data, self.changes)
+        self.changes = []
+        self.history = []
+
+
+class GroupCommit(BatchStorage):
+    """Coalesces the saves of several commands into fewer writes.
+
+    Used by the daemon and the HTTP API, which run many commands against one
+      in-memory copy of the todo file. With the 'op' durability level, each
+      save is written right away. Otherwise, saves are held (see
+      BatchStorage) and written together once no command has saved for
+      'delay' seconds, 'max_delay' seconds after the first held save, or when
+      sync() is called.
+
+    While saves are held, the storage's lock stays taken, so other processes
+      wait for them to be written instead of reading a file that's missing
+      them.
+
+    Args:
+        storage:    (Storage) Backend to write to.
+        durability: (String)  Durability level (see get_durability()).
+        log:        (file)    Where to report each write, if anywhere.
+        delay:      (float)   Seconds without saves before writing.
+        max_delay:  (float)   Longest time, in seconds, a save is held.
+
+    Attributes:
+        ops:     (int)   Saves held since the last write.
+        first:   (float) time.monotonic() of the first held save.
+        last:    (float) time.monotonic() of the last held save.
+        writes:  (list)  Number of saves covered by each write.
+    """
+    def __init__(self, storage, durability='op', log=None, delay=0.05, max_delay=1.0):
+        """Constructor. See class docstring."""
+        super().__init__(storage)
+        self.durability = durability
+        self.log = log
+        self.delay = 0 if durability == 'op' else delay
+        self.max_delay = max_delay
+        self.ops = 0
+        self.first = None
+        self.last = None
+        self.writes = []
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'GroupCommit({self.storage}, {self.durability}, {self.ops})'
+
+    @property
+    def lock(self):
+        """The lock callers take and release; see acquire() and release()."""
+        return self
+
+    def acquire(self):
+        """Take the storage's lock."""
+        self.storage.lock.acquire()
+
+    def release(self):
+        """Release the storage's lock, unless saves are still being held."""
+        if not self.ops:
+            self.storage.lock.release()
+
+    def save(self, data, changes):
+        """Hold a command's save until it's due (see deadline())."""
+        import time
+
+        super().save(data, changes)
+        self.last = time.monotonic()
+        if not self.ops:
+            self.first = self.last
+        self.ops += 1
+
+    def deadline(self):
+        """Return the time.monotonic() the held saves are due by, or None."""
+        if not self.ops:
+            return None
+        return min(self.last + self.delay, self.first + self.max_delay)
+
+    def due(self):
+        """Return whether the held saves should be written now."""
+        import time
+
+        deadline = self.deadline()
+        return deadline is not None and time.monotonic() >= deadline
+
+    def sync(self):
+        """Write the held saves, if any, and release the storage's lock.
+
+        Returns:
+            The number of saves the write covered.
+        """
+        import time
+
+        ops = self.ops
+        if not ops:
+            return 0
+        start = time.perf_counter()
+        self.commit()
+        self.ops = 0
+        self.writes.append(ops)
+        self.storage.lock.release()
+        if self.log:
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'wrote {ops} operation{"" if ops == 1 else "s"} in 1 write ({elapsed:.1f} ms)',
+                  file=self.log, flush=True)
+        return ops
+
+    def forget(self):
+        """Reload the data from the storage and replay the held saves on it.
+
+        Used after a failed command, which may have changed the in-memory
+          data without saving it.
+        """
+        self.storage.forget()
+        if not self.ops:
+            return
+        data = self.storage.load()
+        names = set()
+        for change in self.changes:
+            apply_change(data, change)
+            names.add(change[1][0])
+            if change[0] == 'rename' and len(change[1]) == 1:
+                names.add(change[2])
+        for name in names:
+            if name in data:
+                upgrade_project(data[name])
+        self.data = data
+
+
+class ArchiveStore(object):
+    """Compressed history of archived tasks.
+
+    Archived tasks are kept as records (see export_records()) with an extra
+      'archived' timestamp, one JSON object per line, in gzip-compressed
+      segments under <todo_file>.archive/. Each day's archives go into their
+      own segment; archiving again on the same day appends another gzip
+      member to it, so nothing is ever rewritten.
+
+    A small index.json lists, for each segment's date, the projects in it,
+      with their task counts and section names, so queries only decompress
+      the segments that can have matching tasks.
+
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+
+    Attributes:
+        path:       (String) Directory of the segments and index.
+        index_file: (String) Path of the index.
+    """
+    def __init__(self, todo_file):
+        """Constructor. See class docstring."""
+        self.path = f'{todo_file}.archive'
+        self.index_file = os.path.join(self.path, 'index.json')
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'ArchiveStore({self.path})'
+
+    def segment_file(self, date):
+        """Return the path of a date's segment."""
+        return os.path.join(self.path, f'{date}.jsonl.gz')
+
+    def index(self):
+        """Return the index: {date: {project: {"tasks": n, "sections": [...]}}}."""
+        try:
+            with open(self.index_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def append(self, records):
+        """Add records of archived tasks to today's segment.
+
+        The segment is written before the index, so the index never refers to
+          tasks that aren't there.
+
+        Args:
+            records: (list) Records, each with an 'archived' timestamp.
+        """
+        import gzip
+
+        date = records[0]['archived'][:10]
+        os.makedirs(self.path, exist_ok=True)
+        with gzip.open(self.segment_file(date), 'at', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+        index = self.index()
+        projects = index.setdefault(date, {})
+        for record in records:
+            entry = projects.setdefault(record['project'], {'tasks': 0, 'sections': []})
+            entry['tasks'] += 1
+            if record['section'] and record['section'] not in entry['sections']:
+                entry['sections'].append(record['section'])
+
+        atomic_write(self.index_file, lambda f: json.dump(index, f))
+
+    def dates(self, project=None, section=None, since=None, until=None):
+        """Return the dates of the segments that can hold matching tasks.
+
+        Args:
+            project: (String) Name of a project, or None for any.
+            section: (String) Name of a section, or None for any.
+            since:   (String) Earliest date (YYYY-MM-DD), or None.
+            until:   (String) Latest date (YYYY-MM-DD), or None.
+        """
+        dates = []
+        for date, projects in sorted(self.index().items()):
+            if (since and date < since) or (until and date > until):
+                continue
+            if project and project not in projects:
+                continue
+            if section and section not in projects[project]['sections']:
+                continue
+            dates.append(date)
+        return dates
+
+    def read(self, project=None, section=None, since=None, until=None):
+        """Generate the records of matching archived tasks, oldest first.
+
+        Only the segments picked by dates() are decompressed.
+
+        Args:
+            See dates().
+        """
+        import gzip
+
+        for date in self.dates(project, section, since, until):
+            with gzip.open(self.segment_file(date), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if project and record['project'] != project:
+                        continue
+                    if section and record['section'] != section:
+                        continue
+                    yield record
+
+
+class SearchIndex(object):
+    """Inverted index of task labels and section names, for `todo search`.
+
+    Kept in '<todo_file>.search.db' (SQLite). Each task and section is a
+      document, stored with its project and task ID (not its position, which
+      changes whenever a task is inserted before it), and each lowercase word
+      of its label or name has a posting pointing to it. A search looks up the
+      postings of each term by prefix, so it only reads the matching
+      documents, and only the projects with hits are loaded to show them.
+
+    The index is built by the first search. From then on, every save updates
+      it from the save's change records (see update()), so only the tasks and
+      sections that changed are indexed again.
+
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+
+    Attributes:
+        db_file: (String)     Path of the database.
+        db:      (Connection) Open connection to the database, once used.
+    """
+    schema = '''
+        CREATE TABLE IF NOT EXISTS docs (
+            id      INTEGER PRIMARY KEY,
+            project TEXT NOT NULL,
+            task    INTEGER,
+            name    TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS docs_task ON docs (project, task);
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT NOT NULL,
+            doc  INTEGER NOT NULL REFERENCES docs (id) ON DELETE CASCADE,
+            PRIMARY KEY (term, doc)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+    '''
+
+    def __init__(self, todo_file):
+        """Constructor. See class docstring."""
+        self.db_file = f'{todo_file}.search.db'
+        self.db = None
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'SearchIndex({self.db_file})'
+
+    @staticmethod
+    def terms(text):
+        """Return the distinct lowercase words of a label, name, or query."""
+        import re
+
+        return list(dict.fromkeys(re.findall(r'\w+', text.lower())))
+
+    def exists(self):
+        """Return whether the index has been built."""
+        return os.path.exists(self.db_file)
+
+    def connect(self):
+        """Open the database, creating its tables if needed."""
+        if self.db is not None:
+            return
+        import sqlite3
+
+        self.db = sqlite3.connect(self.db_file)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(self.schema)
+
+    def add(self, project, task, name):
+        """Index a task (or, with 'task' None, a section).
+
+        Args:
+            project: (String) Name of the project.
+            task:    (int)    ID of the task, or None for a section.
+            name:    (String) Label of the task or name of the section.
+        """
+        doc = self.db.execute('INSERT INTO docs (project, task, name) VALUES (?, ?, ?)',
+                              (project, task, name)).lastrowid
+        self.db.executemany('INSERT INTO postings VALUES (?, ?)',
+                            ((term, doc) for term in self.terms(name)))
+
+    def add_project(self, project, proj):
+        """Index a project's sections and tasks.
+
+        Args:
+            project: (String) Name of the project.
+            proj:    (dict)   The project's sections, tasks, and check list.
+        """
+        for sect_name in proj['sections']:
+            self.add(project, None, sect_name)
+        for task_id, label in proj['tasks'].items():
+            self.add(project, int(task_id), label)
+
+    def rebuild(self, data):
+        """Index every project in 'data' from scratch.
+
+        Args:
+            data: (dict) Contents of the todo file.
+        """
+        self.connect()
+        with self.db:
+            self.db.execute('DELETE FROM docs')
+            for project, proj in data.items():
+                self.add_project(project, proj)
+
+    def update(self, data, changes):
+        """Index again the tasks and sections that 'changes' touched.
+
+        Args:
+            data:    (dict) Contents of the todo file, after the changes.
+            changes: (list) Change records of a save.
+        """
+        projects, tasks, sections = {}, set(), set()
+        for op, path, *args in changes:
+            project = path[0]
+            if len(path) == 1:
+                if op == 'rename' and project in projects:
+                    # indexed again under its new name
+                    projects[args[0]] = args[0]
+                elif op == 'rename':
+                    projects[project] = args[0]
+                else:
+                    projects[project] = project
+            elif path[1] == 'tasks' and len(path) == 3:
+                tasks.add((project, int(path[2])))
+            elif path[1] == 'tasks' and op == 'remove_all':
+                tasks.update((project, int(task_id)) for task_id in args[0])
+            elif path[1] in ('tasks', 'sections') and len(path) == 2:
+                # a change to all of a project's tasks or sections at once
+                #   doesn't say which ones changed, so it's indexed again
+                projects.setdefault(project, project)
+            elif path[1] == 'sections' and op in ('set', 'del', 'rename'):
+                # adding tasks to a section doesn't change its name
+                sections.add((project, path[2]))
+                if op == 'rename':
+                    sections.add((project, args[0]))
+
+        self.connect()
+        with self.db:
+            for project, new_name in projects.items():
+                if new_name != project:
+                    self.db.execute('UPDATE docs SET project = ? WHERE project = ?',
+                                    (new_name, project))
+                    continue
+                self.db.execute('DELETE FROM docs WHERE project = ?', (project,))
+                if project in data:
+                    self.add_project(project, data[project])
+
+            for project, task_id in tasks:
+                self.db.execute('DELETE FROM docs WHERE project = ? AND task = ?',
+                                (project, task_id))
+                label = data[project]['tasks'].get(str(task_id)) if project in data else None
+                if label is not None:
+                    self.add(project, task_id, label)
+
+            for project, sect_name in sections:
+                self.db.execute('DELETE FROM docs WHERE project = ? AND task IS NULL AND name = ?',
+                                (project, sect_name))
+                if project in data and sect_name in data[project]['sections']:
+                    self.add(project, None, sect_name)
+
+    def search(self, query):
+        """Return the documents that have a word starting with each term.
+
+        Args:
+            query: (String) Words to look for.
+
+        Returns:
+            A list of (project, task ID or None, label or section name) tuples.
+        """
+        self.connect()
+        docs = None
+        for bounds in sorted(((term, term + '\U0010ffff') for term in self.terms(query)),
+                             key=self.estimate):
+            if docs is None or len(docs) > 1000:
+                matches = {doc for doc, in self.db.execute(
+                    'SELECT doc FROM postings WHERE term >= ? AND term < ?', bounds)}
+                docs = matches if docs is None else docs & matches
+            else:
+                # only check the few documents still matching
+                docs = {doc for chunk in self.chunks(sorted(docs)) for doc, in self.db.execute(
+                    f'SELECT DISTINCT doc FROM postings WHERE doc IN ({",".join("?" * len(chunk))})'
+                    ' AND term >= ? AND term < ?', (*chunk, *bounds))}
+            if not docs:
+                return []
+
+        return [row for chunk in self.chunks(sorted(docs or ())) for row in self.db.execute(
+            f'SELECT project, task, name FROM docs WHERE id IN ({",".join("?" * len(chunk))})',
+            chunk)]
+
+    def estimate(self, bounds, limit=1001):
+        """Return how many postings a term has, counting no further than 'limit'.
+
+        Args:
+            bounds: (tuple) The term and the first string after its prefix.
+            limit:  (int)   Number of postings to stop counting at.
+        """
+        return self.db.execute('SELECT count(*) FROM (SELECT 1 FROM postings'
+                               ' WHERE term >= ? AND term < ? LIMIT ?)', (*bounds, limit)).fetchone()[0]
+
+    @staticmethod
+    def chunks(docs, size=500):
+        """Split document IDs into lists small enough for one query."""
+        return [docs[i:i + size] for i in range(0, len(docs), size)]
+
+
+STORAGES = {
+    'json': Storage,
+    'journal': JournalStorage,
+    'sharded': ShardedStorage,
+    'sqlite': SqliteStorage,
+}
+
+
+def get_storage(todo_file):
+    """Return the storage backend selected by the TODO_STORAGE variable.
+
+    Setting TODO_CACHE to 1 enables the backend's on-disk parse cache.
+
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+    """
+    name = os.environ.get('TODO_STORAGE', 'json')
+    cache = os.environ.get('TODO_CACHE') == '1'
+    try:
+        storage = STORAGES[name](todo_file, cache)
+    except KeyError:
+        sys.exit(f'error: unknown storage "{name}" (choose from {", ".join(STORAGES)}).')
+    storage.fsync = get_durability() != 'batched'
+    return storage
+
+
+# Durability levels, from safest to fastest (see get_durability()).
+DURABILITY = ('op', 'fsync', 'batched')
+
+
+def get_durability():
+    """Return the durability level selected by the TODO_DURABILITY variable.
+
+    'op' (the default) writes every command's changes to disk before it
+      returns. 'fsync' lets the daemon and the HTTP API hold the changes of a
+      burst of commands and write them together, waiting for each of those
+      writes to be on disk. 'batched' holds changes the same way but leaves
+      flushing the written files to the OS. See GroupCommit.
+    """
+    durability = os.environ.get('TODO_DURABILITY', 'op')
+    if durability not in DURABILITY:
+        sys.exit(f'error: unknown durability "{durability}" (choose from {", ".join(DURABILITY)}).')
+    return durability
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                   Todo
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+class Todo(object):
+    """Class for managing TODO list states.
+
+    Args:
+        menu:      (Menu)       Instance of our curses wrapped drawing class.
+                                  Created by show() when not given.
+        args:      (Namespace)  Contains command-line flags and their states.
+        todo_file: (String)     Absolute path of the .todo configuration file.
+        storage:   (Storage)    Backend to load and save 'todo_file' with.
+                                  Defaults to the one chosen by get_storage().
+
+    Attributes:
+
+        menu:          (Menu)      see arg: menu
+        args:          (Namespace) see arg: args
+        todo_file:     (String)    see arg: todo_file
+        storage:       (Storage)   see arg: storage
+        changes:       (list)      Change records made since the last write.
+                                     (see apply_change())
+        untracked:     (set)       Projects whose changes aren't recorded one
+                                     by one (see import_records()).
+        project:       (String)    Name of project to view or modify.
+        section:       (String)    Name of section to create, view, or modify.
+        data:          (dict)      Contents of 'todo_file'.
+        proj_sections: (Sections)  Section names as keys, section tasks as
+                                     values.
+        proj_tasks:    (TaskLabels) Task ID as keys, task label as values.
+        check_list:    (TaskSet)   IDs of checked tasks.
+    """
+    def __init__(self, menu=None, args=None, todo_file=None, storage=None):
+        """Constructor. See class docstring."""
+        self.menu = menu
+        self.args = args
+        self.todo_file = todo_file
+        self.storage = storage or get_storage(todo_file)
+        self.changes = []
+        self.untracked = set()
+        self.project = args.project
+        self.section = args.section
+
+        self.data = self.storage.load()
+        if not self.data and not args.create and not getattr(args, 'import_', False):
+            sys.exit('no projects exist.')
+
+        if not args.create and not args.delete:
+            # For getting a project's sections and tasks, which modes Create
+            #   and Delete don't need.
+            if self.project:
+                self.nonexistent_check()
+                self.proj_sections = self.data[self.project]['sections']
+                self.proj_tasks = self.data[self.project]['tasks']
+                self.check_list = self.data[self.project]['check']
+
+    def __repr__(self):
+        """Return attributes.
+
+        If Todo is ran with Create or Delete mode, self.proj_sections and
+          self.proj_tasks won't exist and will therefore throw an error.
+          May want to fix that.
+        """
+        return (f'Todo({self.menu}, {self.args}, {self.todo_file}, '
+                f'{self.project}, {self.section}, {self.data}, '
+                f'{self.proj_sections}, {self.proj_tasks})')
+
+    # Helper functions
+
+    def nonexistent_check(self):
+        """Check for nonexistent project and section names.
+
+        Nonexistent project names in Normal mode have to be handled at the
+          parser, otherwise our subparsers mess up. Note that this does NOT
+          include moving tasks (which is in Normal mode).
+
+        Nonexistent project names in Delete mode are handled in todo.delete().
+
+        Helper:
+            todo.__init__()
+        """
+        if self.project not in self.data.keys():
+            # Check project name (archive mode)
+            sys.exit(f'error: project "{self.project}" does not exist.')
+        elif self.section:
+            # Check section name (normal, archive mode)
+            if self.section not in self.data[self.project]['sections'].keys():
+                sys.exit(f'error: section "{self.section}" does not exist in project "{self.project}".')
+
+    def project_name_check(self, project_name):
+        """Check for invalid project names.
+
+        Helper:
+            todo.create()
+            todo.rename()
+
+        Args:
+            project_name: (String) Either self.project or self.args.rename.
+        """
+        blacklist = MODES
+        existing_projects = [project for project in self.data.keys()]
+
+        if not project_name.isalnum():
+            sys.exit('error: invalid project name.')
+        elif project_name in blacklist:
+            sys.exit('error: restricted project name.')
+        elif project_name in existing_projects:
+            sys.exit(f'error: project "{project_name}" already exists.')
+        elif len(project_name) > 45:
+            sys.exit('error: project name is too long.')
+
+    def section_name_check(self, section_name, new_name):
+        """Check that a section exists and can be renamed to 'new_name'.
+
+        Unlike project names, section names may contain spaces.
+
+        Helper:
+            todo.rename()
+
+        Args:
+            section_name: (String) The section being renamed.
+            new_name:     (String) Its new name.
+        """
+        if section_name not in self.proj_sections:
+            sys.exit(f'error: section "{section_name}" does not exist in project "{self.project}".')
+        elif not new_name.strip():
+            sys.exit('error: invalid section name.')
+        elif new_name in self.proj_sections:
+            sys.exit(f'error: section "{new_name}" already exists in project "{self.project}".')
+
+    def get_updated_check(self, project):
+        """Return the completed tasks to archive.
+        
+        If a section is specified, only the section's completed tasks will be
+          returned. Otherwise, all of the project's completed tasks will be.
+        
+        Args:
+            project: (dict) Project's name, sections, tasks, and check list.
+        
+        Returns:
+            checked: (set) IDs of the completed tasks to be archived.
+        """
+        if self.section:
+            sect_tasks = self.proj_sections[self.section]
+            checked = set(project['check']) & set(sect_tasks)
+            if not checked:
+                sys.exit(f'No completed tasks in section "{self.section}" of project "{self.project}".')
+        else:
+            checked = set(project['check'])
+            if not checked and self.project:
+                sys.exit(f'No completed tasks in project "{self.project}".')
+        return checked
+
+    def task_id(self, project, position):
+        """Return the permanent ID of the task at a position.
+
+        Args:
+            project:  (String) Name of the task's project.
+            position: (int)    1-based position of the task, as shown on the
+                                 menu and passed on the command line.
+
+        Returns:
+            The task's ID, or None if the project has no such position.
+        """
+        order = self.data[project]['order']
+        if 1 <= position <= len(order):
+            return order[position - 1]
+        return None
+
+    def remove_tasks(self, project, positions):
+        """Remove tasks from a project.
+
+        Tasks are removed from the project's order, task list, check list,
+          and sections. No other task is touched.
+
+        Helper:
+            task_delete()
+            move_task()
+
+        Args:
+            project:   (String)   Name of the project to remove tasks from.
+            positions: (iterable) 0-based positions of the tasks to remove.
+
+        Returns:
+            The removed tasks' IDs.
+        """
+        proj = self.data[project]
+        task_ids = []
+
+        # pop from the back so the remaining positions stay valid (also when
+        #   the journal replays them)
+        for position in sorted(set(positions), reverse=True):
+            task_ids.append(proj['order'].pop(position))
+            self.record('pop', [project, 'order'], position)
+
+        for task_id in task_ids:
+            del proj['tasks'][str(task_id)]
+            self.record('del', [project, 'tasks', str(task_id)])
+
+            if task_id in proj['check']:
+                proj['check'].remove(task_id)
+                self.record('remove', [project, 'check'], task_id)
+
+            sect_name = proj['sections'].section_of(task_id)
+            if sect_name is not None:
+                proj['sections'][sect_name].remove(task_id)
+                self.record('remove', [project, 'sections', sect_name], task_id)
+
+        return task_ids
+
+    def discard_tasks(self, project, task_ids):
+        """Remove many tasks from a project in one pass.
+
+        Like remove_tasks(), but tasks are given by ID, and the project's
+          order, task list, check list, and sections are each changed by a
+          single 'remove_all' change, so the time taken grows with the size
+          of the project rather than with the number of tasks times its size.
+
+        Helper:
+            section_delete()
+
+        Args:
+            project:  (String) Name of the project to remove tasks from.
+            task_ids: (set)    IDs of the tasks to remove.
+        """
+        for change in self.discard_changes(project, task_ids):
+            apply_change(self.data, change)
+            self.record(*change)
+
+    def discard_changes(self, project, task_ids):
+        """Return the changes that remove tasks from a project (see
+          discard_tasks()), without applying or recording them.
+
+        Helper:
+            archive()
+            discard_tasks()
+
+        Args:
+            project:  (String) Name of the project to remove tasks from.
+            task_ids: (set)    IDs of the tasks to remove.
+        """
+        proj = self.data[project]
+        task_ids = [task_id for task_id in proj['order'] if task_id in task_ids]
+        if not task_ids:
+            return []
+
+        sections = {}
+        for task_id in task_ids:
+            sect_name = proj['sections'].section_of(task_id)
+            if sect_name is not None:
+                sections.setdefault(sect_name, []).append(task_id)
+
+        changes = [['remove_all', [project, 'order'], task_ids],
+                   ['remove_all', [project, 'tasks'], [str(task_id) for task_id in task_ids]]]
+        checked = [task_id for task_id in task_ids if task_id in proj['check']]
+        if checked:
+            changes.append(['remove_all', [project, 'check'], checked])
+        for sect_name, sect_tasks in sections.items():
+            changes.append(['remove_all', [project, 'sections', sect_name], sect_tasks])
+        return changes
+
+    def record(self, op, path, *args):
+        """Record a change made to self.data for the next write().
+
+        Every mutation must record what it changed so that journaled storage
+          only has to write the change instead of the whole file.
+
+        Args:
+            op:   (String) Change operation (see apply_change()).
+            path: (list)   Keys leading to the changed value.
+            args: (list)   Operation arguments.
+        """
+        if path and path[0] in self.untracked:
+            return
+        self.changes.append([op, path, *args])
+
+    # General functions
+
+    def write(self):
+        """Write changes to todo's configuration file..
+
+        Normally, it will be .todo. However, when testing, it'll use the test
+          file .test_todo.
+        """
+        self.storage.save(self.data, self.changes)
+        self.changes = []
+
+    def command(self):
+        """Return the method that runs the mode and option in self.args.
+
+        Normal mode without an option displays the project (see show()).
+        """
+        args = self.args
+
+        # Non-normal modes
+        if args.create:
+            return self.create
+        elif args.delete:
+            return self.delete
+        elif args.archive:
+            return self.archive
+
+        # Normal mode
+        if args.add:
+            return lambda: self.add(args.add, args.project, args.section)
+        elif args.task_delete or args.task_delete == 0:
+            return self.task_delete
+        elif args.check or args.uncheck:
+            return lambda: self.check_uncheck(bool(args.check))
+        elif args.move_to_proj or args.move_to_sect:
+            return self.move_task
+        elif args.section_add:
+            return self.section_add
+        elif args.section_delete:
+            return self.section_delete
+        elif args.rename:
+            return self.rename
+        elif args.unsect:
+            return self.unsection
+        elif args.insert:
+            return self.insert
+        return self.show
+
+    def show(self):
+        """Display TODO list.
+
+        There are 3 scenarios based on the arguments passed:
+
+            a)   $ todo project section
+            b)   $ todo project
+            c)   $ todo
+
+        a) displays the section specified and its tasks.
+        b) displays the project specified, all sections within it, and all
+             tasks.
+        c) displays all projects, their sections, and all of their tasks.
+
+        Tasks belonging to a section will be excluded from the general task
+          output area since they're already included in the section task area.
+
+        Curses is only set up here, so other commands never touch the
+          terminal. With --plain or --color, or when stdout isn't a terminal
+          (e.g., `todo | less` or `todo > report.txt`), the list is streamed
+          as text instead (see stream()).
+        """
+        # nothing is saved from here on, so other invocations needn't wait
+        self.storage.lock.release()
+
+        output = getattr(self.args, 'output', None)
+        if output or not sys.stdout.isatty():
+            self.stream(output == 'ansi')
+            return
+
+        from curses import wrapper
+        wrapper(self.draw)
+
+    def stream(self, color=False):
+        """Write the TODO list (see show()) to stdout, one line at a time.
+
+        Lines are laid out and written as they're generated, so lists of any
+          length can be printed.
+
+        Args:
+            color: (boolean) Indicates whether to use ANSI colors.
+        """
+        layout = Layout(get_wrap_cache(self.todo_file))
+        if self.project:
+            lines = layout.project(self.data, self.project, self.section)
+        else:
+            lines = layout.all(self.data)
+
+        try:
+            for text in render(lines, color):
+                sys.stdout.write(text)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # The reader (e.g., head) went away; don't complain on exit.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        layout.wraps.save()
+
+    def draw(self, stdscr):
+        """Draw the TODO list (see show()), creating the Menu if needed.
+
+        Args:
+            stdscr: (Window) Represents the entire screen.
+        """
+        if self.menu is None:
+            self.menu = Menu(stdscr, Layout(get_wrap_cache(self.todo_file)))
+
+        if self.project or self.section:
+            self.menu.draw_prjsect(stdscr,
+                                   self.data,
+                                   self.proj_sections,
+                                   self.proj_tasks,
+                                   self.project,
+                                   self.section)
+        else:
+            self.menu.draw_all(stdscr, self.data)
+        self.menu.layout.wraps.save()
+
+    def create(self):
+        """Create a new project."""
+        self.new_project(self.project)
+        self.write()
+
+    def new_project(self, project):
+        """Add an empty project, without writing it.
+
+        Args:
+            project: (String) Name of the project.
+        """
+        self.project_name_check(project)
+        self.data[project] = {"sections": Sections(), "tasks": TaskLabels(), "check": TaskSet(),
+                              "order": TaskOrder(), "next": 1}
+        # record a separate empty project, since later changes in the same
+        #   write are recorded on their own
+        self.record('set', [project], {"sections": {}, "tasks": {}, "check": [],
+                                       "order": [], "next": 1})
+
+    def delete(self):
+        """Delete a project."""
+        try:
+            del self.data[self.project]
+        except KeyError as e:
+            sys.exit(f'error: project "{self.project}" does not exist.')
+        self.record('del', [self.project])
+        self.write()
+
+    def archive(self):
+        """Delete completed tasks.
+
+        If a section is specified, only its completed tasks are deleted. Each
+          project is archived in one pass over its tasks (see discard_tasks()).
+          Deleted tasks are kept in the archive store (see ArchiveStore).
+
+        When archiving all projects, each project's work (loading it, for
+          storages that load projects lazily, finding its completed tasks, and
+          building their history records and removal) is spread over -j
+          threads (unless the storage can't load projects from several
+          threads, see Storage), and -t prints how long each project took. The
+          changes are recorded in project order once every project is done.
+        """
+        from time import perf_counter
+
+        projects = [self.project] if self.project else list(self.data)
+        jobs = (getattr(self.args, 'jobs', 1) or 1) if self.storage.threadsafe else 1
+
+        def archive_project(project):
+            # each project is only touched by one thread
+            start = perf_counter()
+            checked = self.get_updated_check(self.data[project])
+            history = self.history_records(project, checked)
+            changes = self.discard_changes(project, checked)
+            for change in changes:
+                apply_change(self.data, change)
+            return checked, history, changes, perf_counter() - start
+
+        if jobs > 1 and len(projects) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(min(jobs, len(projects))) as pool:
+                archived = list(pool.map(archive_project, projects))
+        else:
+            archived = [archive_project(project) for project in projects]
+
+        # Exit if we're archiving all projects and there are no completed tasks
+        if not any(checked for checked, *rest in archived):
+            sys.exit('no completed tasks in any project.')
+
+        history = []
+        for project, (checked, records, changes, seconds) in zip(projects, archived):
+            history.extend(records)
+            for change in changes:
+                self.record(*change)
+            if getattr(self.args, 'timing', False):
+                print(f'{project}: archived {len(checked)} tasks in {seconds * 1000:.1f} ms')
+
+        # keep the history first, so a failed write can't lose tasks
+        self.storage.save_history(history)
+        self.write()
+
+    def history_records(self, project, task_ids):
+        """Return records of tasks about to be archived, in their order.
+
+        Args:
+            project:  (String) Name of the tasks' project.
+            task_ids: (set)    IDs of the tasks.
+        """
+        import time
+
+        archived = time.strftime('%Y-%m-%dT%H:%M:%S')
+        proj = self.data[project]
+        return [{'project': project,
+                 'section': proj['sections'].section_of(task_id),
+                 'label': proj['tasks'][str(task_id)],
+                 'checked': True,
+                 'archived': archived}
+                for task_id in proj['order'] if task_id in task_ids]
+
+    def rename(self):
+        """Rename a project or section."""
+        if self.section:
+            self.section_name_check(self.section, self.args.rename)
+            change = ['rename', [self.project, 'sections', self.section], self.args.rename]
+        else:
+            self.project_name_check(self.args.rename)
+            change = ['rename', [self.project], self.args.rename]
+        apply_change(self.data, change)
+        self.record(*change)
+        self.write()
+
+    # Task functions
+
+    def add(self, label, project, section=None):
+        """Add a task to a project.
+
+        Args:
+            label:   (String) Name of task to be added.
+            project: (String) Name of project to add task to.
+            section: (String) Name of section to add task to.
+        """
+        proj = self.data[project]
+
+        # existing task check
+        if proj['tasks'].find(label) is not None:
+            sys.exit(f'task "{label}" already exists in project "{project}".')
+
+        task_id = self.new_task(project, label)
+        proj['order'].append(task_id)
+        self.record('append', [project, 'order'], task_id)
+
+        # update section
+        # self.proj_section isn't used here since move_task also uses this and
+        # we may need to add to section in a different project
+        if section:
+            proj['sections'][section].append(task_id)
+            self.record('append', [project, 'sections', section], task_id)
+
+        self.write()
+
+    def new_task(self, project, label):
+        """Give a new task a permanent ID and add it to the task list.
+
+        The task isn't placed in the project's order.
+
+        Args:
+            project: (String) Name of project to add task to.
+            label:   (String) Name of the task.
+
+        Returns:
+            The new task's ID.
+        """
+        proj = self.data[project]
+        task_id = proj['next']
+        proj['next'] += 1
+        proj['tasks'][str(task_id)] = label
+        self.record('set', [project, 'next'], proj['next'])
+        self.record('set', [project, 'tasks', str(task_id)], label)
+        return task_id
+
+    def insert(self):
+        """Insert a task at a specified position."""
+        pos, label = self.args.insert
+        order = self.data[self.project]['order']
+
+        # insert format check
+        if not pos.isdigit():
+            sys.exit(f'error: insert position must be a digit')
+
+        # existing task check
+        if self.proj_tasks.find(label) is not None:
+            sys.exit(f'error: task "{label}" already exists in project "{self.project}".')
+
+        # valid position check
+        if not 1 <= int(pos) <= len(order):
+            sys.exit(f'error: there are only {len(order)} task positions.')
+
+        task_id = self.new_task(self.project, label)
+        order.insert(int(pos) - 1, task_id)
+        self.record('insert', [self.project, 'order'], int(pos) - 1, task_id)
+
+        if self.section:
+            self.proj_sections[self.section].append(task_id)
+            self.record('append', [self.project, 'sections', self.section], task_id)
+
+        self.write()
+
+    def task_delete(self):
+        """Delete a task from a project."""
+        labels = list(sorted(self.args.task_delete))
+        
+        # checks
+        for label in labels:
+            if not label:
+                sys.exit('error: 0 is an invalid task number.')
+            elif self.task_id(self.project, label) is None:
+                sys.exit(f'project "{self.project}" has no task #{label}.')
+
+        self.remove_tasks(self.project, [label - 1 for label in labels])
+        self.write()
+
+    def check_uncheck(self, check):
+        """Mark a task as checked or unchecked.
+
+        Args:
+            check: (boolean) Indicates whether to check (True) or uncheck
+                               (False) a task.
+
+        """
+        labels = self.args.check if check else self.args.uncheck
+
+        for label in labels:
+            task_id = self.task_id(self.project, label)
+            if task_id is not None:
+                if check:
+                    if task_id not in self.check_list:
+                        self.check_list.append(task_id)
+                        self.record('append', [self.project, 'check'], task_id)
+                    else:
+                        sys.exit(f'task #{label} is already checked.')
+                else:
+                    if task_id in self.check_list:
+                        self.check_list.remove(task_id)
+                        self.record('remove', [self.project, 'check'], task_id)
+                    else:
+                        sys.exit(f'task #{label} is not checked.')
+            else:
+                sys.exit(f'task #{label} does not exist.')
+
+        self.write()
+
+    def move_task(self):
+        """Move a task to a different project or section.
+
+        'ttm' is short for "task to move."
+
+        If no section is specified (-mp), 'ttm' is a list of the format:
+            [id, project]
+
+        If a section is specified (-ms), 'ttm' is a list of the format:
+            [id, project, section]
+
+        Moving a task to a section of its own project only changes which
+          section it's in; the task keeps its position and check state.
+        """
+        ttm = self.args.move_to_proj if self.args.move_to_proj else self.args.move_to_sect
+        position = ttm[0]
+        new_prj = ttm[1]
+        new_sect = ttm[2] if self.args.move_to_sect else None
+
+        # Nonexistent checks
+        task_id = self.task_id(self.project, int(position)) if position.isdigit() else None
+        if task_id is None:
+            sys.exit(f'error: task #{position} does not exist in project "{self.project}".')
+
+        if new_prj not in [project for project in self.data.keys()]:
+            sys.exit(f'error: project "{new_prj}" does not exist.')
+
+        if self.args.move_to_sect:
+            if new_sect not in self.data[new_prj]['sections'].keys():
+                sys.exit(f'error: section "{new_sect}" does not exist in project "{new_prj}".')
+
+        # Task exists checks
+        label = self.proj_tasks[str(task_id)]
+        moved_proj_tasks = self.data[new_prj]['tasks']
+        if self.args.move_to_sect:
+            moved_sect_tasks = self.data[new_prj]['sections'][new_sect]
+
+        #   if moving to a project
+        if self.args.move_to_proj and moved_proj_tasks.find(label) is not None:
+            sys.exit(f'error: task #{position} already exists in project "{new_prj}".')
+
+        #   if moving to a section in the same project OR
+        #   if moving to a different section in a different project
+        if self.args.move_to_sect:
+            if (
+                (new_prj == self.project and task_id in moved_sect_tasks)
+                or
+                (new_prj != self.project and moved_proj_tasks.find(label) is not None)
+               ):
+                sys.exit(f'error: task #{position} already exists in section "{new_sect}" of project "{new_prj}".')
+
+        if new_prj == self.project:
+            # Same project: just switch sections
+            sect_name = self.proj_sections.section_of(task_id)
+            if sect_name is not None:
+                self.proj_sections[sect_name].remove(task_id)
+                self.record('remove', [self.project, 'sections', sect_name], task_id)
+            moved_sect_tasks.append(task_id)
+            self.record('append', [self.project, 'sections', new_sect], task_id)
+            self.write()
+            return
+
+        # Remove task
+        self.remove_tasks(self.project, [int(position) - 1])
+
+        # Add (writes to file there)
+        self.add(label, new_prj, new_sect)
+
+    # >>> Section functions
+
+    def section_add(self):
+        """Add a section."""
+        label = self.args.section_add
+        if label in self.proj_sections.keys():
+            sys.exit(f'section "{label}" already exists in project "{self.project}".')
+
+        self.proj_sections[label] = []
+        self.record('set', [self.project, 'sections', label], [])
+        self.write()
+
+    def section_delete(self):
+        """Delete a section."""
+        label = self.args.section_delete
+
+        if label not in self.proj_sections.keys():
+            sys.exit(f'section "{label}" does not exist in project "{self.project}".')
+
+        # delete section tasks and section
+        self.discard_tasks(self.project, set(self.proj_sections[label]))
+        del self.proj_sections[label]
+        self.record('del', [self.project, 'sections', label])
+
+        self.write()
+
+    def unsection(self):
+        "Move tasks out of sections."
+        for task_to_unsect in self.args.unsect:
+            task_id = self.task_id(self.project, task_to_unsect)
+            sect_name = self.proj_sections.section_of(task_id)
+            if sect_name is not None:
+                self.proj_sections[sect_name].remove(task_id)
+                self.record('remove', [self.project, 'sections', sect_name], task_id)
+
+        self.write()
+
+    # >>> Import functions
+
+    def import_records(self, records):
+        """Add the projects, sections, and tasks of records (see read_records()).
+
+        Missing projects and sections are created. Tasks are added to the end
+          of their project, so they keep the order they're read in. Nothing
+          is written until every record has been added.
+
+        Projects created by the import are recorded as a whole once every
+          record has been added, rather than one change per task.
+
+        Args:
+            records: (iterable) (line number, record) tuples.
+        """
+        for line_no, record in records:
+            try:
+                self.import_record(record)
+            except SystemExit as e:
+                sys.exit(f'line {line_no}: {e.code} No changes were made.')
+
+        created, self.untracked = self.untracked, set()
+        for project in created:
+            self.record('set', [project], plain_project(self.data[project]))
+        self.write()
+
+    def import_record(self, record):
+        """Add a single record's project, section, or task.
+
+        Args:
+            record: (dict) A record (see export_records()).
+        """
+        project, section, label = record['project'], record['section'], record['label']
+        if not project:
+            sys.exit('error: record has no project.')
+        if project not in self.data:
+            self.new_project(project)
+            self.untracked.add(project)
+        proj = self.data[project]
+
+        if section and section not in proj['sections']:
+            proj['sections'][section] = []
+            self.record('set', [project, 'sections', section], [])
+
+        if label is None:
+            return
+        if proj['tasks'].find(label) is not None:
+            sys.exit(f'error: task "{label}" already exists in project "{project}".')
+
+        task_id = self.new_task(project, label)
+        proj['order'].append(task_id)
+        self.record('append', [project, 'order'], task_id)
+        if section:
+            proj['sections'][section].append(task_id)
+            self.record('append', [project, 'sections', section], task_id)
+        if record['checked']:
+            proj['check'].append(task_id)
+            self.record('append', [project, 'check'], task_id)
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                 Layout
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+# Foreground and background colors of each project color's 9 roles (see
+#   Menu.init_colors()). -1 is the terminal's default color.
+PALETTE = {'r': ((203, 167), (210, 167), (253, 167), (-1, 131), (253, 131),
+                 (203, 131), (210, 131), (46, 131), (180, 131)),
+           'g': ((76, 71), (119, 71), (253, 71), (-1, 65), (253, 65),
+                 (76, 65), (210, 65), (46, 65), (180, 65)),
+           'b': ((75, 69), (45, 69), (253, 69), (-1, 67), (253, 67),
+                 (75, 67), (210, 67), (46, 67), (180, 67)),
+           'v': ((171, 141), (219, 141), (253, 141), (-1, 97), (253, 97),
+                 (171, 97), (210, 97), (46, 97), (180, 97))}
+
+
+class Line(object):
+    """A line of the TODO list's layout.
+
+    Args:
+        color:    (String) Color of the line's project (e.g., r, g, b), or None
+                             for uncolored lines.
+        segments: (list)   (text, role, bold) tuples. 'role' is the offset of
+                             the segment's color pair from the first pair of
+                             the project's color (see Menu.init_colors()).
+        project:  (String) Name of the project the line belongs to.
+        section:  (String) Name of the section the line belongs to, if any.
+        task_id:  (int)    ID of the task the line belongs to, if any.
+    """
+    __slots__ = ('color', 'segments', 'project', 'section', 'task_id')
+
+    def __init__(self, color, segments, project=None, section=None, task_id=None):
+        """Constructor. See class docstring."""
+        self.color = color
+        self.segments = segments
+        self.project = project
+        self.section = section
+        self.task_id = task_id
+
+    def __repr__(self):
+        """Return attributes."""
+        return (f'Line({self.color}, {self.segments}, {self.project}, '
+                f'{self.section}, {self.task_id})')
+
+    def __eq__(self, other):
+        if not isinstance(other, Line):
+            return NotImplemented
+        return (self.segments == other.segments and self.task_id == other.task_id and
+                self.project == other.project and self.section == other.section and
+                self.color == other.color)
+
+    @property
+    def text(self):
+        """Return the line's text without colors."""
+        return ''.join(text for text, role, bold in self.segments)
+
+    def ansi(self):
+        """Return the line's text colored with ANSI escape sequences."""
+        if not self.color:
+            return self.text
+        out = []
+        for text, role, bold in self.segments:
+            fg, bg = PALETTE[self.color][role]
+            codes = ['39' if fg == -1 else f'38;5;{fg}', f'48;5;{bg}']
+            if bold:
+                codes.append('1')
+            out.append(f'\x1b[{";".join(codes)}m{text}\x1b[0m')
+        return ''.join(out)
+
+
+class WrapCache(object):
+    """Wrapped task labels, kept so that each label is only laid out once.
+
+    Labels are wrapped with textwrap, which is most of the time it takes to
+      lay out a list of long labels. The lines are also kept padded the way
+      they're drawn, so a label that's already been laid out costs a lookup.
+      Once more than 'size' labels are kept, the least recently used ones are
+      dropped.
+
+    Labels are kept per project, since the same label may be in several
+      projects. With a 'path', the wrapped lines are also kept between runs,
+      in one file (in marshal format) per project under that directory. A
+      project's file is loaded the first time one of its labels has to be
+      wrapped, and save() writes the files of the projects whose labels were
+      wrapped, so showing one project only reads and writes that project's
+      labels.
+
+    Args:
+        path: (String) Directory to keep the cache in between runs, if any.
+        size: (int)    Most wrapped labels to keep.
+
+    Attributes:
+        wraps:  (OrderedDict) (project, label, width) tuples (as keys) and
+                                [lines, (indent, fill), padded lines] lists
+                                (as values) of the lines the label wraps into
+                                and how they were last padded, least recently
+                                used first.
+        loaded: (set)         Names of the projects whose files were loaded.
+        dirty:  (set)         Names of the projects whose labels were wrapped
+                                since their files were loaded.
+    """
+    version = 2
+
+    def __init__(self, path=None, size=100000):
+        """Constructor. See class docstring."""
+        from collections import OrderedDict
+        self.path = path
+        self.size = size
+        self.wraps = OrderedDict()
+        self.loaded = set()
+        self.dirty = set()
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'WrapCache({self.path}, {self.size}, {len(self.wraps)})'
+
+    def wrap(self, label, width, project=None, indent='', fill=0):
+        """Return the lines a label wraps into.
+
+        Every line is padded with spaces to 'fill' characters, and the lines
+          after the first are prefixed with 'indent'.
+
+        Args:
+            label:   (String) The label.
+            width:   (int)    Most characters a line can have.
+            project: (String) Name of the label's project.
+            indent:  (String) Prefix of the lines after the first.
+            fill:    (int)    Width to pad each line to.
+        """
+        if len(label) <= width:
+            return (label.ljust(fill),)
+        if self.path and project not in self.loaded:
+            self.load(project)
+
+        key = (project, label, width)
+        entry = self.wraps.get(key)
+        if entry is None:
+            import textwrap
+            entry = self.wraps[key] = [tuple(textwrap.wrap(label, width=width)), None, None]
+            self.dirty.add(project)
+            if len(self.wraps) > self.size:
+                self.wraps.popitem(last=False)
+        else:
+            self.wraps.move_to_end(key)
+
+        # a task's label is drawn the same way until its position or section
+        #   changes, so only the last padding is kept
+        style = (indent, fill)
+        if entry[1] == style:
+            return entry[2]
+        padded = [indent + line.ljust(fill) for line in entry[0]]
+        if padded:
+            padded[0] = padded[0][len(indent):]
+        entry[1] = style
+        entry[2] = padded = tuple(padded)
+        return padded
+
+    def project_file(self, project):
+        """Return the path of the file a project's labels are kept in."""
+        import hashlib
+        return os.path.join(self.path, hashlib.sha1(str(project).encode()).hexdigest()[:16])
+
+    def load(self, project):
+        """Load the labels kept for a project, if they're of this version.
+
+        Args:
+            project: (String) Name of the project.
+        """
+        self.loaded.add(project)
+        try:
+            with open(self.project_file(project), 'rb') as f:
+                version, name, wraps = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        # the name guards against another project's file with the same hash
+        if version != (self.version, sys.version_info[:2]) or name != project:
+            return
+
+        for label, width, lines in wraps:
+            self.wraps.setdefault((project, label, width), [lines, None, None])
+        while len(self.wraps) > self.size:
+            self.wraps.popitem(last=False)
+
+    def save(self):
+        """Write the files of the projects whose labels were wrapped."""
+        if not self.path or not self.dirty:
+            return
+        wraps = {project: [] for project in self.dirty}
+        for (project, label, width), (lines, style, padded) in self.wraps.items():
+            if project in wraps:
+                wraps[project].append((label, width, lines))
+
+        version = (self.version, sys.version_info[:2])
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for project, entries in wraps.items():
+                atomic_write(self.project_file(project),
+                             lambda f: marshal.dump((version, project, tuple(entries)), f),
+                             'wb', fsync=False)
+        except OSError:
+            # the cache is only an optimization
+            return
+        self.dirty = set()
+
+
+WRAP_CACHES = {}
+
+
+def get_wrap_cache(todo_file):
+    """Return the WrapCache to lay out a todo file with.
+
+    The same cache is returned for as long as the process runs, so the
+      daemon only wraps each label once. Setting TODO_CACHE to 1 (see
+      get_storage()) also keeps wrapped labels in '<todo_file>.wrap/' between
+      runs.
+
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+    """
+    path = f'{todo_file}.wrap' if os.environ.get('TODO_CACHE') == '1' else None
+    if (todo_file, path) not in WRAP_CACHES:
+        WRAP_CACHES[todo_file, path] = WrapCache(path)
+    return WRAP_CACHES[todo_file, path]
+
+
+class Layout(object):
+    """Lays out projects, sections, and tasks as lines of colored text.
+
+    Layouts don't depend on curses, so every way of displaying the TODO list
+      draws the same lines. Lines are generated one at a time.
+
+    Args:
+        wraps: (WrapCache) Cache to wrap long task labels with. Defaults to
+                             one that's only kept in memory.
+
+    Attributes:
+        colors: (tuple)  Project colors, assigned to projects in rotation.
+        hash:   (String) Prefix for section names.
+        check:  (String) Prefix for checked tasks.
+        utask:  (String) Prefix for unchecked tasks.
+        width:  (int)    Width of the project box.
+    """
+    colors = ('r', 'g', 'b', 'v')
+    hash   = '  # '
+    check  = '  ✓ '
+    utask  = '  □ '
+    width  = 58
+
+    def __init__(self, wraps=None):
+        """Constructor. See class docstring."""
+        self.wraps = wraps or WrapCache()
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'Layout({self.colors}, {self.width}, {self.wraps})'
+
+    def project_color(self, projects, project):
+        """Return the color of a project, based on its position.
+
+        Args:
+            projects: (dict)   All projects.
+            project:  (String) Name of the project.
+        """
+        for i, name in enumerate(projects):
+            if name == project:
+                return self.colors[i % len(self.colors)]
+
+    def blank(self, color, project=None, section=None):
+        """Return a blank line of the project box."""
+        return Line(color, [(' ' * self.width, 3, False)], project, section)
+
+    def banner(self, color, proj_name):
+        """Return the project's banner.
+
+        The banner includes the "!!!"  prefix, the project's color label (e.g.,
+          r, g, b), and and project's name.
+
+        Args:
+            color:     (String) Color of project (e.g., r, g, b).
+            proj_name: (String) Name of project.
+        """
+        end_banner = '"{}'.format(' ' * (56 - len(proj_name) - 9))
+        return Line(color, [(' !!! ', 0, False),
+                            (f'{color}   ', 1, True),
+                            ('"', 0, False),
+                            (proj_name, 2, True),
+                            (end_banner, 0, False)], proj_name)
+
+    def task(self, color, project, section, task_id, task_num, tname, checked):
+        """Generate the lines of a regular or section task.
+
+        Args:
+            color:    (String)  Color of the task's project.
+            project:  (String)  Name of the task's project.
+            section:  (String)  Name of the task's section, or None for
+                                  regular tasks.
+            task_id:  (int)     The task's ID.
+            task_num: (int)     The task's position.
+            tname:    (String)  Name of task.
+            checked:  (boolean) Indicates whether the task is checked.
+        """
+        tindex = f'  {task_num}'
+        length = 42 if section else 44  # amount of characters a task line can be
+        # 'prefix' is the spacing after index but before □ or ✓. For substrings
+        #   longer than 'length', we have to manually add spaces ('sub_space')
+        #   since we're not drawing the index, which gives 3 or 4 spaces.
+        prefix = ' ' * (9 - len(tindex)) if section else ' ' * (7 - len(tindex))
+        padding = len(prefix) + (5 if task_num < 10 else 6)
+        sub_space = ' ' * 7 if task_num < 10 else ' ' * 8
+        # the lines come padded, and indented after the first
+        substrs = self.wraps.wrap(tname, length, project, prefix + sub_space, 56 - padding)
+
+        for line, substr in enumerate(substrs):
+            if line == 0 and checked:
+                segments = [(tindex, 8, False),
+                            (f'{prefix}{self.check}', 7, False),
+                            (substr, 4, False)]
+            elif line == 0:
+                segments = [(tindex, 8, False),
+                            (f'{prefix}{self.utask}{substr}', 4, False)]
+            else:
+                segments = [(substr, 4, False)]
+            yield Line(color, segments, project, section, task_id)
+
+    def section(self, color, project, proj, positions, sect_name):
+        """Generate the lines of a section and its tasks.
+
+        Section tasks are laid out in the project's task order.
+
+        Args:
+            color:     (String) Color of the section's project.
+            project:   (String) Name of the section's project.
+            proj:      (dict)   The project's sections, tasks, and check list.
+            positions: (dict)   Task IDs (as keys) and their position (as
+                                  values).
+            sect_name: (String) Name of the section.
+        """
+        end_sec = ' ' * (56 - len(sect_name) - 9)
+
+        # Section header
+        yield Line(color, [(f'{" " * 6} {self.hash}', 5, False),
+                           (f'{sect_name}{end_sec}', 6, False)], project, sect_name)
+
+        # Section tasks
+        for task_id in sorted(proj['sections'][sect_name], key=positions.get):
+            yield from self.task(color, project, sect_name, task_id,
+                                 positions[task_id], proj['tasks'][str(task_id)],
+                                 task_id in proj['check'])
+        yield self.blank(color, project, sect_name)
+
+    def project(self, projects, project, section=None):
+        """Generate the lines of a project.
+
+        If a section is specified, only that section is laid out. Otherwise,
+          all sections are, followed by the tasks that aren't in a section.
+
+        Args:
+            projects: (dict)   All projects.
+            project:  (String) Name of the project.
+            section:  (String) Name of the section to lay out, if any.
+        """
+        proj = projects[project]
+        color = self.project_color(projects, project)
+        positions = {task_id: pos for pos, task_id in enumerate(proj['order'], 1)}
+
+        # Banner and pre-body
+        yield self.banner(color, project)
+        yield self.blank(color, project)
+        yield self.blank(color, project)
+
+        # Body
+        if section:
+            yield from self.section(color, project, proj, positions, section)
+            yield self.blank(color, project)
+            yield self.blank(color, project)
+            return
+
+        for sect_name in proj['sections']:
+            yield from self.section(color, project, proj, positions, sect_name)
+        if proj['sections']:
+            yield self.blank(color, project)
+
+        unsectioned = False
+        for task_id in proj['order']:
+            if proj['sections'].section_of(task_id) is None:
+                unsectioned = True
+                yield from self.task(color, project, None, task_id,
+                                     positions[task_id], proj['tasks'][str(task_id)],
+                                     task_id in proj['check'])
+
+        # End lines
+        #   If there are regular tasks, we need to add 3 blank lines,
+        #   otherwise just add 1 since section() adds 2 already (one
+        #   between sections and one right before tasks).
+        for _ in range(3 if unsectioned else 1):
+            yield self.blank(color, project)
+
+    def all(self, projects, start=None):
+        """Generate the lines of all projects, separated by 2 empty lines.
+
+        Args:
+            projects: (dict)   All projects (as keys) and their sections and
+                                 tasks (as values).
+            start:    (String) Name of the first project to lay out, if not
+                                 the first one.
+        """
+        for project in projects:
+            if start is not None and project != start:
+                continue
+            start = None
+            yield from self.project(projects, project)
+            yield Line(None, [], project)
+            yield Line(None, [], project)
+
+
+class LineBuffer(object):
+    """Laid out lines, generated only as far as they've been asked for.
+
+    Scrolling through a long list only lays out the lines that have been
+      shown, plus the ones needed to fill the screen.
+
+    Args:
+        lines: (iterable) Line instances.
+
+    Attributes:
+        buffer: (list)    Lines generated so far.
+        done:   (boolean) Indicates whether all lines have been generated.
+    """
+    def __init__(self, lines):
+        """Constructor. See class docstring."""
+        self.lines = iter(lines)
+        self.buffer = []
+        self.done = False
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'LineBuffer({len(self.buffer)}, {self.done})'
+
+    def __len__(self):
+        """Return the number of lines generated so far."""
+        return len(self.buffer)
+
+    def fill(self, count):
+        """Generate lines until there are 'count' of them (or no more).
+
+        Args:
+            count: (int) Number of lines wanted, or None for all of them.
+        """
+        while not self.done and (count is None or len(self.buffer) < count):
+            try:
+                self.buffer.append(next(self.lines))
+            except StopIteration:
+                self.done = True
+
+    def window(self, top, height):
+        """Return the lines from row 'top' to 'top + height'.
+
+        Args:
+            top:    (int) First row.
+            height: (int) Number of rows.
+        """
+        self.fill(top + height)
+        return self.buffer[top:top + height]
+
+    def splice(self, row, lines):
+        """Replace the lines from 'row' on with lines generated from 'lines'.
+
+        Args:
+            row:   (int)      First row to replace.
+            lines: (iterable) Line instances to generate from 'row' on.
+        """
+        del self.buffer[row:]
+        self.lines = iter(lines)
+        self.done = False
+
+    def project_row(self, row, step):
+        """Return the first row of the next or previous project.
+
+        Args:
+            row:  (int) Current row.
+            step: (int) 1 for the next project, -1 for the previous one (or the
+                          start of the current one, if 'row' isn't its first
+                          row).
+        """
+        def starts_project(r):
+            return r == 0 or self.buffer[r].project != self.buffer[r - 1].project
+
+        if step > 0:
+            row += 1
+            while True:
+                self.fill(row + 1)
+                if row >= len(self.buffer):
+                    return None
+                if starts_project(row):
+                    return row
+                row += 1
+
+        row = min(row, len(self.buffer)) - 1
+        while row > 0 and not starts_project(row):
+            row -= 1
+        return max(row, 0)
+
+    def is_item(self, row):
+        """Return whether a row is a project's banner, a section's header, or
+          the first line of a task.
+
+        Args:
+            row: (int) A row that has been generated.
+        """
+        line = self.buffer[row]
+        prev = self.buffer[row - 1] if row else None
+        if not line.segments:
+            return False
+        if prev is None or prev.project != line.project:
+            return True
+        if line.task_id is not None:
+            return prev.task_id != line.task_id
+        return line.section is not None and prev.section != line.section
+
+    def item_row(self, row, step):
+        """Return the row of the nearest item (see is_item()) from 'row' on.
+
+        Args:
+            row:  (int) Row to start looking at.
+            step: (int) 1 to look downwards, -1 to look upwards.
+
+        Returns:
+            The item's row, or None if there's none in that direction.
+        """
+        if step < 0:
+            self.fill(row + 1)
+            row = min(row, len(self.buffer) - 1)
+        while row >= 0:
+            self.fill(row + 1)
+            if row >= len(self.buffer):
+                return None
+            if self.is_item(row):
+                return row
+            row += step
+        return None
+
+
+def render(lines, color=False):
+    """Generate laid out lines as text, for output without curses.
+
+    Args:
+        lines: (iterable) Line instances.
+        color: (boolean)  Indicates whether to color lines with ANSI escape
+                            sequences. Plain lines have trailing spaces
+                            removed.
+    """
+    for line in lines:
+        yield f'{line.ansi()}\n' if color else f'{line.text.rstrip()}\n'
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                 Curses
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+class Menu(object):
+    """Manager for curses drawings.
+
+    Args:
+        stdscr: (Window) Represents the entire screen.
+        layout: (Layout) Lays out what's drawn. Defaults to a new Layout.
+
+    Attributes:
+        begin_x: (int) Starting x coordinate of the curses window.
+        begin_y: (int) Starting y coordinate of the curses window.
+        height: (int)  Height of curses window.
+        width: (int)   Width of curses window.
+        win: (Window)  A Window object to draw on.    
+        colors: (dict) All current project colors (as keys) and their respective
+                         color pairs initialized in init_colors().
+        layout: (Layout) Lays out what's drawn.
+        shown:  (list)   What each row of the window shows: a (Line, highlighted)
+                           tuple, or None for an empty row.
+    """
+    def __init__(self, stdscr, layout=None):
+        """Constructor. See class docstring."""
+        import curses
+        # Window attributes
+        self.begin_x = 1
+        self.begin_y = 2
+        self.height = curses.LINES - self.begin_y
+        self.width = curses.COLS - self.begin_x
+        self.win = curses.newwin(self.height, self.width, self.begin_y, self.begin_x)
+        self.win.keypad(True)
+        self.shown = [None] * self.height
+
+        # Colors
+        self.colors = {"r": (1, 2, 3, 4, 5, 6, 7, 8, 9),
+                       "g": (10, 11, 12, 13, 14, 15, 16, 17, 18),
+                       "b": (19, 20, 21, 22, 23, 24, 25, 26, 27),
+                       "v": (28, 29, 30, 31, 32, 33, 34, 35, 36)}
+        self.init_colors()
+
+        self.layout = layout or Layout()
+
+    def __repr__(self):
+        """Return attributes.
+
+        We don't really need to return the prefixes do we?
+        """
+        return (f'Menu({self.begin_x}, {self.begin_y}, {self.height}, '
+                f'{self.width}, {self.win}, {self.colors})')
+
+    def init_colors(self):
+        """Initialize custom curses color pairs.
+
+        Color pair mapping:
+
+            Let x = {1, 10, 19, 28},
+
+                x:        ! and double quotes ("")
+                x + 1:    Color letter (e.g., r, g, b)
+                x + 2:    Project name
+                x + 3:    Body background
+                x + 4:    Task
+                x + 5:    Hash
+                x + 6:    Section name
+                x + 7:    Checkmark
+                x + 8:    Index
+
+        The foreground and background of each pair are in PALETTE.
+        """
+        import curses
+        curses.use_default_colors()
+
+        for name, pairs in self.colors.items():
+            for pair, (fg, bg) in zip(pairs, PALETTE[name]):
+                curses.init_pair(pair, fg, bg)
+
+    def attr(self, color, role, bold):
+        """Return the curses attribute of a layout segment.
+
+        Args:
+            color: (String)  Color of the segment's project, or None.
+            role:  (int)     Offset of the segment's color pair.
+            bold:  (boolean) Indicates whether the segment is bold.
+        """
+        import curses
+        attr = curses.color_pair(self.colors[color][role]) if color else 0
+        return attr | curses.A_BOLD if bold else attr
+
+    def draw_lines(self, lines, selected=()):
+        """Draw laid out lines into the window and refresh the screen once.
+
+        Only the rows that show something else than before are written. When
+          lines were inserted or removed (e.g., after scrolling, or when a
+          task's label wraps onto another line), the rows below are first
+          shifted with insdelln() if that leaves fewer rows to write (see
+          plan()). The window is only written to in memory until the single
+          refresh at the end, so the terminal is updated in one go. Lines are
+          cut off at the edge of the window.
+
+        Args:
+            lines:    (iterable) Line instances, from the top of the window.
+            selected: (list)     Rows of the window to highlight.
+        """
+        import curses
+        rows = [(line, row in selected) for row, line in enumerate(lines)][:self.height]
+        rows += [None] * (self.height - len(rows))
+        shown = self.shown
+
+        start, shift = self.plan(shown, rows)
+        if shift:
+            self.win.move(start, 0)
+            self.win.insdelln(shift)
+            if shift > 0:
+                shown = shown[:start] + [None] * shift + shown[start:self.height - shift]
+            else:
+                shown = shown[:start] + shown[start - shift:] + [None] * -shift
+
+        for row in range(start, self.height):
+            if shown[row] != rows[row]:
+                self.draw_row(row, rows[row])
+        self.shown = rows
+        self.win.noutrefresh()
+        curses.doupdate()
+
+    @staticmethod
+    def plan(shown, rows):
+        """Return how to turn what the window shows into new rows.
+
+        Args:
+            shown: (list) What each row shows (see the class docstring).
+            rows:  (list) What each row should show, in the same form.
+
+        Returns:
+            A (start, shift) tuple: rows above 'start' are unchanged, and
+              shifting the rows from 'start' down by 'shift' rows (up, if it's
+              negative) leaves the fewest rows to write.
+        """
+        height = len(rows)
+        start = 0
+        while start < height and shown[start] == rows[start]:
+            start += 1
+
+        def cost(shift):
+            count = 0
+            for row in range(start, height):
+                source = row - shift
+                old = shown[source] if start <= source < height else None
+                if old != rows[row]:
+                    count += 1
+            return count
+
+        best, fewest = 0, cost(0)
+        for distance in range(1, height - start):
+            if fewest <= distance:
+                # shifting by 'distance' rows empties that many, which mostly
+                #   have to be written again
+                break
+            for shift in (distance, -distance):
+                count = cost(shift)
+                if count < fewest:
+                    best, fewest = shift, count
+        return start, best
+
+    def draw_row(self, row, shown):
+        """Write one row of the window.
+
+        Args:
+            row:   (int)   Row of the window.
+            shown: (tuple) (Line, highlighted) tuple, or None for an empty row.
+        """
+        import curses
+        self.win.move(row, 0)
+        self.win.clrtoeol()
+        if shown is None:
+            return
+        line, highlighted = shown
+        room = self.width
+        highlight = curses.A_REVERSE if highlighted else 0
+        for text, role, bold in line.segments:
+            if room <= 0:
+                break
+            try:
+                self.win.addstr(text[:room], self.attr(line.color, role, bold) | highlight)
+            except curses.error:
+                # Writing the bottom-right cell moves the cursor off the
+                #   window, which curses reports even though it's drawn.
+                pass
+            room -= len(text)
+
+    def scroll(self, buffer, top, key):
+        """Return the new top row of the viewport after a key press.
+
+        Keys:
+            j, Down            One line down.
+            k, Up              One line up.
+            f, Space, PgDn     One page down.
+            b, PgUp            One page up.
+            g, Home            Top of the list.
+            G, End             Bottom of the list.
+            n                  Next project.
+            p                  Previous project (or the start of this one).
+
+        Args:
+            buffer: (LineBuffer) Laid out lines.
+            top:    (int)        Current top row.
+            key:    (int)        Key pressed.
+
+        Returns:
+            The new top row, or None if the key doesn't scroll (which closes
+              the list).
+        """
+        import curses
+        page = max(self.height - 1, 1)
+        moves = {ord('j'): 1, curses.KEY_DOWN: 1,
+                 ord('k'): -1, curses.KEY_UP: -1,
+                 ord('f'): page, ord(' '): page, curses.KEY_NPAGE: page,
+                 ord('b'): -page, curses.KEY_PPAGE: -page}
+
+        if key in moves:
+            top += moves[key]
+        elif key in (ord('g'), curses.KEY_HOME):
+            top = 0
+        elif key in (ord('G'), curses.KEY_END):
+            buffer.fill(None)
+            top = len(buffer)
+        elif key == ord('n'):
+            row = buffer.project_row(top, 1)
+            top = top if row is None else row
+        elif key == ord('p'):
+            top = buffer.project_row(top, -1)
+        elif key == curses.KEY_RESIZE:
+            curses.update_lines_cols()
+            self.height = curses.LINES - self.begin_y
+            self.width = curses.COLS - self.begin_x
+            self.win.resize(self.height, self.width)
+            self.win.erase()
+            self.shown = [None] * self.height
+        else:
+            return None
+
+        # Don't scroll past the last screenful
+        buffer.fill(top + self.height)
+        return max(min(top, len(buffer) - self.height), 0)
+
+    def view(self, lines):
+        """Show laid out lines in a scrollable viewport until a key closes it.
+
+        Only the lines that fit in the window are drawn, and lines are only
+          laid out once they've been scrolled to (see LineBuffer).
+
+        Args:
+            lines: (iterable) Line instances.
+        """
+        buffer = LineBuffer(lines)
+        top = 0
+        while top is not None:
+            self.draw_lines(buffer.window(top, self.height))
+            top = self.scroll(buffer, top, self.win.getch())
+
+    def draw_prjsect(self, stdscr, projects, proj_sections, proj_tasks, project, section):
+        """Draw a specific project.
+
+        If a section is specified, draw only the project, the specified section,
+            and its tasks.
+
+        Args:
+            stdscr:        (Window) Represents the entire screen.
+            proj_sections: (dict)   All section names and their tasks.
+            proj_tasks:    (dict)   All tasks and their index for the specified
+                                      project.
+            project:       (String) Name of the specified project.
+            section:       (String) Name of the specified section.
+        """
+        self.view(self.layout.project(projects, project, section))
+
+    def draw_all(self, stdscr, projects):
+        """Draw all projects, sections, and tasks.
+
+        Args:
+            stdscr:        (Window) Represents the entire screen.
+            projects:      (dict)   All projects (as keys) and their sections and
+                                      tasks (as values).
+        """
+        self.view(self.layout.all(projects))
+
+
+class Session(object):
+    """Interactive curses session over the TODO list, used by `todo tui`.
+
+    The list stays laid out in memory while a cursor selects a project,
+      section, or task, and keys modify the selection. Commands run through
+      main() like the daemon's (see serve_request()), against a GroupCommit
+      that holds their saves until the keyboard has been idle for a moment,
+      so key presses never wait for the file to be written. The 'op'
+      durability level is treated as 'fsync' for this reason. Changes made by
+      other processes are picked up while the keyboard is idle.
+
+    After a command, only the projects it changed are laid out again (see
+      reload()), and only the rows of the window that changed are redrawn
+      (see Menu.draw_lines()), so long lists stay responsive.
+
+    Keys:
+        j, Down / k, Up       Next / previous item.
+        f, PgDn / b, PgUp     One page down / up.
+        g, Home / G, End      First / last item.
+        n / p                 Next / previous project.
+        x, Space              Check or uncheck the task.
+        a                     Add a task to the project (or section).
+        d                     Delete the task.
+        m                     Move the task to another project or section.
+        A                     Archive the project's completed tasks.
+        q, Esc                Quit.
+
+    Args:
+        todo_file:  (String)  Absolute path of the .todo configuration file.
+        storage:    (Storage) Backend to load and save 'todo_file' with.
+        project:    (String)  Name of the project to show, or None for all.
+        durability: (String)  Durability level (see get_durability()).
+
+    Attributes:
+        stdscr:  (Window)     Represents the entire screen; its first line is
+                                the status line.
+        layout:  (Layout)     Lays out the list.
+        menu:    (Menu)       Draws the list.
+        data:    (dict)       Contents of the todo file 'buffer' is laid out
+                                from.
+        buffer:  (LineBuffer) Laid out lines.
+        row:     (int)        Row of the selected item.
+        top:     (int)        Row at the top of the window.
+        message: (String)     Shown in the status line until the next key.
+        status:  (String)     What the status line shows, or None if it has
+                                to be drawn.
+    """
+    help = 'x check  a add  d delete  m move  A archive  q quit'
+
+    def __init__(self, todo_file, storage, project=None, durability='op'):
+        """Constructor. See class docstring."""
+        self.todo_file = todo_file
+        self.storage = GroupCommit(storage, 'fsync' if durability == 'op' else durability)
+        self.project = project
+        self.layout = Layout(get_wrap_cache(todo_file))
+        self.stdscr = None
+        self.menu = None
+        self.data = None
+        self.buffer = None
+        self.row = 0
+        self.top = 0
+        self.message = ''
+        self.status = None
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'Session({self.todo_file}, {self.storage}, {self.project}, {self.row}, {self.top})'
+
+    def run(self, stdscr):
+        """Show the list and handle keys until the session is quit.
+
+        Args:
+            stdscr: (Window) Represents the entire screen.
+        """
+        import curses
+
+        self.stdscr = stdscr
+        self.menu = Menu(stdscr, self.layout)
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        self.reload(force=True)
+        try:
+            while True:
+                self.draw()
+                key = self.wait()
+                if key is not None and not self.handle(key):
+                    break
+        finally:
+            self.storage.sync()
+            self.layout.wraps.save()
+
+    def lines(self, start=None):
+        """Generate the lines of the shown project, or of all projects.
+
+        Args:
+            start: (String) Name of the first project to lay out, when all
+                              projects are shown.
+        """
+        if self.project:
+            return self.layout.project(self.data, self.project)
+        return self.layout.all(self.data, start)
+
+    def reload(self, force=False, projects=None):
+        """Lay the list out again if its data changed, keeping the selection.
+
+        When the data is the same (the session's own commands change it in
+          place) and 'projects' are given, the lines before the first of them
+          are kept, and the rest are laid out again as they're shown.
+
+        Args:
+            force:    (boolean) Lay the list out even if the data is the same.
+            projects: (list)    Names of the projects that changed.
+        """
+        try:
+            self.storage.acquire()
+        except SystemExit as e:
+            self.message = str(e.code)
+            return
+        try:
+            data = self.storage.load()
+        finally:
+            self.storage.release()
+        if data is self.data and not force:
+            return
+
+        item = self.selected()
+        if data is self.data and projects and not self.project:
+            # projects that haven't been laid out yet will be as they are now
+            rows = self.buffer.buffer
+            row = next((row for row, line in enumerate(rows) if line.project in projects), None)
+            if row is not None:
+                self.buffer.splice(row, self.lines(rows[row].project))
+        else:
+            if self.project is not None and self.project not in data:
+                self.project = None
+            self.data = data
+            self.buffer = LineBuffer(self.lines())
+        self.select(item)
+
+    def selected(self):
+        """Return the (project, section, task ID) of the selected item, or None.
+
+        Tasks are identified without their section, so they stay selected
+          when they're moved to another section.
+        """
+        if self.buffer is None or self.row >= len(self.buffer):
+            return None
+        line = self.buffer.buffer[self.row]
+        if line.task_id is not None:
+            return line.project, None, line.task_id
+        return line.project, line.section, None
+
+    def select(self, item):
+        """Select an item, or the one nearest the selected row if it's gone.
+
+        Args:
+            item: (tuple) The item's (project, section, task ID), as returned
+                            by selected().
+        """
+        buffer = self.buffer
+        row = None if item is None else self.find(item)
+        if row is None:
+            row = buffer.item_row(self.row, -1)
+        self.row = row if row is not None else buffer.item_row(self.row, 1) or 0
+        self.follow()
+
+    def find(self, item):
+        """Return the row of an item (see selected()), or None if it's gone.
+
+        The selected row is tried first, since commands rarely move the
+          selected item, and then the rows of the item's project.
+
+        Args:
+            item: (tuple) The item's (project, section, task ID).
+        """
+        project, section, task_id = item
+        buffer = self.buffer
+
+        def matches(row):
+            line = buffer.buffer[row]
+            return (line.project == project and line.task_id == task_id and
+                    (task_id is not None or line.section == section) and buffer.is_item(row))
+
+        row, seen = 0, False
+        buffer.fill(self.row + 1)
+        if self.row < len(buffer):
+            if matches(self.row):
+                return self.row
+            if buffer.buffer[self.row].project == project:
+                row = buffer.project_row(self.row + 1, -1)
+        while True:
+            buffer.fill(row + 1)
+            if row >= len(buffer):
+                return None
+            if buffer.buffer[row].project == project:
+                seen = True
+                if matches(row):
+                    return row
+            elif seen:
+                # lines of a project are together, so it isn't further down
+                return None
+            row += 1
+
+    def item_rows(self):
+        """Return the rows of the selected item (tasks can wrap)."""
+        buffer = self.buffer
+        if self.row >= len(buffer):
+            return []
+        line = buffer.buffer[self.row]
+        rows = [self.row]
+        while line.task_id is not None:
+            buffer.fill(rows[-1] + 2)
+            following = rows[-1] + 1
+            if following >= len(buffer) or buffer.is_item(following) or \
+                    buffer.buffer[following].task_id != line.task_id:
+                break
+            rows.append(following)
+        return rows
+
+    def follow(self):
+        """Scroll the window so that the selected item is in it."""
+        height = self.menu.height if self.menu else 1
+        rows = self.item_rows() or [0]
+        if self.top > rows[0]:
+            self.top = rows[0]
+        elif self.top + height <= rows[-1]:
+            self.top = max(rows[-1] - height + 1, 0)
+
+    def draw(self):
+        """Draw the status line and the window, highlighting the selection."""
+        import curses
+
+        status = self.message or self.help
+        if self.storage.ops:
+            status += '  (saving)'
+        if status != self.status:
+            self.stdscr.move(0, 0)
+            self.stdscr.clrtoeol()
+            self.stdscr.addstr(0, 1, status[:max(curses.COLS - 2, 0)])
+            self.stdscr.noutrefresh()
+            self.status = status
+        self.menu.draw_lines(self.buffer.window(self.top, self.menu.height),
+                             [row - self.top for row in self.item_rows()])
+
+    def wait(self):
+        """Return the next key pressed, or None if none was in time.
+
+        While the keyboard is idle, held saves are written once they're due,
+          and other processes' changes are loaded once there are none.
+        """
+        import time
+
+        deadline = self.storage.deadline()
+        if deadline is None:
+            timeout = 1000
+        else:
+            timeout = max(int((deadline - time.monotonic()) * 1000) + 1, 0)
+        self.menu.win.timeout(timeout)
+        key = self.menu.win.getch()
+        if key != -1:
+            return key
+
+        if self.storage.due():
+            self.storage.sync()
+        elif deadline is None:
+            self.reload()
+        return None
+
+    def handle(self, key):
+        """Handle a key press.
+
+        Args:
+            key: (int) Key pressed.
+
+        Returns:
+            False if the key quits the session, True otherwise.
+        """
+        actions = {ord('x'): self.toggle, ord(' '): self.toggle, ord('a'): self.add,
+                   ord('d'): self.delete, ord('m'): self.move, ord('A'): self.archive}
+        self.message = ''
+        if key in (ord('q'), 27):
+            return False
+        elif key in actions:
+            actions[key]()
+        else:
+            self.navigate(key)
+        return True
+
+    def navigate(self, key):
+        """Move the selection (see the class docstring).
+
+        Args:
+            key: (int) Key pressed.
+        """
+        import curses
+
+        buffer = self.buffer
+        page = max(self.menu.height - 1, 1)
+        moves = {ord('j'): 1, curses.KEY_DOWN: 1,
+                 ord('k'): -1, curses.KEY_UP: -1,
+                 ord('f'): page, curses.KEY_NPAGE: page,
+                 ord('b'): -page, curses.KEY_PPAGE: -page}
+
+        if key in moves:
+            step = 1 if moves[key] > 0 else -1
+            if moves[key] == 1:
+                start = self.item_rows()[-1] + 1 if len(buffer) else 0
+            else:
+                start = max(self.row + moves[key], 0)
+            row = buffer.item_row(start, step)
+            if row is None:
+                row = buffer.item_row(start, -step)
+        elif key in (ord('g'), curses.KEY_HOME):
+            row = buffer.item_row(0, 1)
+        elif key in (ord('G'), curses.KEY_END):
+            buffer.fill(None)
+            row = buffer.item_row(len(buffer) - 1, -1)
+        elif key == ord('n'):
+            row = buffer.project_row(self.row, 1)
+        elif key == ord('p'):
+            row = buffer.project_row(self.row, -1)
+        elif key == curses.KEY_RESIZE:
+            self.menu.scroll(buffer, self.top, key)
+            self.status = None
+            row = self.row
+        else:
+            return
+
+        if row is not None:
+            self.row = row
+        self.follow()
+
+    def ask(self, question, answer=''):
+        """Read a line of text in the status line.
+
+        Args:
+            question: (String) Shown before the text.
+            answer:   (String) Initial text.
+
+        Returns:
+            The text, or None if Esc was pressed.
+        """
+        import curses
+
+        self.status = None
+        self.stdscr.keypad(True)
+        try:
+            curses.curs_set(1)
+        except curses.error:
+            pass
+        try:
+            while True:
+                room = max(curses.COLS - 3, 1)
+                self.stdscr.move(0, 0)
+                self.stdscr.clrtoeol()
+                self.stdscr.addstr(0, 1, f'{question}{answer}'[-room:])
+                self.stdscr.refresh()
+                key = self.stdscr.get_wch()
+                if key in ('\n', '\r', curses.KEY_ENTER):
+                    return answer
+                elif key == '\x1b':
+                    return None
+                elif key in ('\x7f', '\b', curses.KEY_BACKSPACE):
+                    answer = answer[:-1]
+                elif isinstance(key, str) and key.isprintable():
+                    answer += key
+        finally:
+            try:
+                curses.curs_set(0)
+            except curses.error:
+                pass
+
+    def confirm(self, question):
+        """Return whether 'y' is pressed after a question in the status line.
+
+        Args:
+            question: (String) Question to ask.
+        """
+        self.status = None
+        self.stdscr.move(0, 0)
+        self.stdscr.clrtoeol()
+        self.stdscr.addstr(0, 1, f'{question} (y/n)')
+        self.stdscr.refresh()
+        return self.stdscr.get_wch() in ('y', 'Y')
+
+    def execute(self, argv, done, projects):
+        """Run a command and lay out the projects it changed again.
+
+        Args:
+            argv:     (list)   Command-line arguments of the command.
+            done:     (String) Message to show if the command succeeds.
+            projects: (list)   Names of the projects the command can change.
+        """
+        reply = serve_request(self.todo_file, self.storage, {'argv': argv, 'cwd': os.getcwd()})
+        if reply['code']:
+            errors = reply['err'].strip().splitlines()
+            self.message = errors[-1] if errors else 'error: the command failed.'
+        else:
+            self.message = done
+        # a failed command reloads the data (see GroupCommit.forget())
+        self.reload(force=True, projects=projects)
+
+    def current(self):
+        """Return the selected line, or None (with a message) if there's none."""
+        if self.row >= len(self.buffer):
+            self.message = 'there are no projects.'
+            return None
+        return self.buffer.buffer[self.row]
+
+    def task(self):
+        """Return the selected line if it's a task's, or None (with a message)."""
+        line = self.current()
+        if line is not None and line.task_id is None:
+            self.message = 'select a task first.'
+            return None
+        return line
+
+    def position(self, line):
+        """Return the position of a line's task in its project.
+
+        Args:
+            line: (Line) A line of the task.
+        """
+        for pos, task_id in enumerate(self.data[line.project]['order'], 1):
+            if task_id == line.task_id:
+                return pos
+
+    def toggle(self):
+        """Check or uncheck the selected task."""
+        line = self.task()
+        if line is None:
+            return
+        pos = self.position(line)
+        if line.task_id in self.data[line.project]['check']:
+            self.execute([line.project, '--uncheck', str(pos)], f'unchecked task #{pos}.',
+                         [line.project])
+        else:
+            self.execute([line.project, '--check', str(pos)], f'checked task #{pos}.',
+                         [line.project])
+
+    def add(self):
+        """Add a task to the selected project, or to the selected section."""
+        line = self.current()
+        if line is None:
+            return
+        label = self.ask('add task: ')
+        if not label:
+            return
+        argv = [line.project, *([line.section] if line.section else []), f'--add={label}']
+        self.execute(argv, f'added "{label}".', [line.project])
+        task_id = self.data[line.project]['tasks'].find(label)
+        if task_id is not None:
+            self.select((line.project, None, task_id))
+
+    def delete(self):
+        """Delete the selected task, once confirmed."""
+        line = self.task()
+        if line is None:
+            return
+        pos = self.position(line)
+        if self.confirm(f'delete task #{pos}?'):
+            self.execute([line.project, '--taskdelete', str(pos)], f'deleted task #{pos}.',
+                         [line.project])
+
+    def move(self):
+        """Move the selected task to the project and section asked for."""
+        line = self.task()
+        if line is None:
+            return
+        pos = self.position(line)
+        project = self.ask('move to project: ', line.project)
+        if not project:
+            return
+        section = self.ask(f'move to section of "{project}" (empty for none): ')
+        if section is None:
+            return
+
+        if section:
+            argv = [line.project, '--move_to_sect', str(pos), project, section]
+        elif project == line.project:
+            argv = [line.project, '--unsect', str(pos)]
+        else:
+            argv = [line.project, '--move_to_proj', str(pos), project]
+        self.execute(argv, f'moved task #{pos} to "{project}".', [line.project, project])
+
+    def archive(self):
+        """Archive the completed tasks of the selected project."""
+        line = self.current()
+        if line is not None:
+            self.execute(['archive', line.project],
+                         f'archived the completed tasks of "{line.project}".', [line.project])
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+               Import/Export
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+RECORD_FORMATS = ('jsonl', 'csv')
+RECORD_FIELDS = ('project', 'section', 'label', 'checked')
+
+
+def export_records(data, projects=None):
+    """Generate records of projects, their sections, and their tasks.
+
+    A record is a dict with the keys in RECORD_FIELDS. Each project has a
+      record with only 'project' set, followed by one with 'section' set for
+      each of its sections, and one with 'label' and 'checked' set for each
+      of its tasks (in order, with 'section' set if the task is in one).
+
+    Args:
+        data:     (dict) Contents of the todo file.
+        projects: (list) Names of the projects to export. Defaults to all.
+    """
+    for project in projects or data:
+        proj = data[project]
+        yield {'project': project, 'section': None, 'label': None, 'checked': False}
+        for sect_name in proj['sections']:
+            yield {'project': project, 'section': sect_name, 'label': None, 'checked': False}
+        for task_id in proj['order']:
+            yield {'project': project,
+                   'section': proj['sections'].section_of(task_id),
+                   'label': proj['tasks'][str(task_id)],
+                   'checked': task_id in proj['check']}
+
+
+def write_records(records, f, fmt):
+    """Write records one line at a time.
+
+    Args:
+        records: (iterable) Records (see export_records()).
+        f:       (file)     File to write to.
+        fmt:     (String)   'jsonl' for one JSON object per line, or 'csv'
+                              for a header line and one row per record.
+    """
+    if fmt == 'jsonl':
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        return
+
+    import csv
+    writer = csv.writer(f, lineterminator='\n')
+    writer.writerow(RECORD_FIELDS)
+    for record in records:
+        writer.writerow([record['project'],
+                         record['section'] or '',
+                         record['label'] if record['label'] is not None else '',
+                         int(record['checked']) if record['label'] is not None else ''])
+
+
+def read_records(f, fmt):
+    """Generate the records in a file, one line at a time.
+
+    Empty fields are read as missing ones.
+
+    Args:
+        f:   (file)   File to read from.
+        fmt: (String) 'jsonl' or 'csv' (see write_records()).
+
+    Yields:
+        (line number, record) tuples.
+    """
+    if fmt == 'jsonl':
+        rows = ((line_no, line) for line_no, line in enumerate(f, 1) if line.strip())
+    else:
+        import csv
+        reader = csv.DictReader(f)
+        if 'project' not in (reader.fieldnames or ()):
+            sys.exit('line 1: error: missing "project" column. No changes were made.')
+        rows = ((reader.line_num, row) for row in reader)
+
+    for line_no, row in rows:
+        if fmt == 'jsonl':
+            try:
+                row = json.loads(row)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict):
+                sys.exit(f'line {line_no}: error: invalid record. No changes were made.')
+        checked = row.get('checked')
+        if isinstance(checked, str):
+            checked = checked.strip().lower() in ('1', 'true', 'yes', 'x')
+        yield line_no, {'project': row.get('project') or None,
+                        'section': row.get('section') or None,
+                        'label': row.get('label') if row.get('label') != '' else None,
+                        'checked': bool(checked)}
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                   Daemon
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+# Environment variables that select how the todo file is stored. Commands are
+#   only served by a daemon that was started with the same values.
+STORAGE_ENV = ('TODO_STORAGE', 'TODO_CACHE', 'TODO_DURABILITY')
+
+
+def socket_path(todo_file):
+    """Return the path of the Unix socket of the daemon serving 'todo_file'."""
+    return f'{todo_file}.sock'
+
+
+def serve(todo_file, storage):
+    """Serve commands for 'todo_file' over a Unix socket until stopped.
+
+    The daemon keeps 'storage', and with it the parsed todo file, in memory
+      between commands, so a command only costs the client's startup and a
+      round trip. Commands are run one at a time, with the same lock as
+      in-process commands, and changes made by other processes are picked up
+      through storage.load() as usual.
+
+    Each connection carries one request, a JSON object with the command's
+      "argv", the client's working directory ("cwd"), its storage variables
+      ("env", see STORAGE_ENV), and its standard input if the command reads it
+      ("stdin"). The reply holds the command's "out", "err", and exit "code",
+      or "local": true if the client should run the command itself.
+
+    Saves are coalesced according to TODO_DURABILITY (see GroupCommit); the
+      held saves are written while the daemon waits for the next connection.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+    """
+    import signal
+    import socket
+    import time
+
+    storage = GroupCommit(storage, get_durability(), sys.stderr)
+    path = socket_path(todo_file)
+    if request_daemon(path, {'argv': ['daemon'], 'ping': True}) is not None:
+        sys.exit('error: a daemon is already running for this todo file.')
+    if os.path.exists(path):
+        # left behind by a daemon that was killed
+        os.remove(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o077)
+    try:
+        server.bind(path)
+    except OSError as e:
+        sys.exit(f'error: can\'t listen on "{path}": {e.strerror}.')
+    finally:
+        os.umask(umask)
+    server.listen()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    env = {name: os.environ.get(name) for name in STORAGE_ENV}
+    try:
+        while True:
+            deadline = storage.deadline()
+            server.settimeout(None if deadline is None else max(deadline - time.monotonic(), 0))
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                storage.sync()
+                continue
+
+            conn.settimeout(None)
+            argv = None
+            with conn:
+                try:
+                    request = json.loads(receive(conn))
+                    argv = request['argv']
+                    if request.get('ping'):
+                        reply = {'code': 0}
+                    elif argv[:1] == ['daemon']:
+                        reply = daemon_reply(storage, argv)
+                    elif request.get('env') != env:
+                        reply = {'local': True}
+                    else:
+                        reply = serve_request(todo_file, storage, request)
+                    conn.sendall(json.dumps(reply).encode())
+                except (ValueError, KeyError, TypeError, AttributeError, OSError) as e:
+                    # a malformed request or a client that went away only
+                    #   fails its own connection
+                    argv = None
+                    reply = {'out': '', 'err': f'error: invalid request ({e!r}).\n', 'code': 1}
+                    try:
+                        conn.sendall(json.dumps(reply).encode())
+                    except OSError:
+                        pass
+            if argv == ['daemon', '--stop']:
+                break
+    finally:
+        server.close()
+        os.remove(path)
+        storage.sync()
+
+
+def daemon_reply(storage, argv):
+    """Return the reply to a daemon-mode command sent to a running daemon.
+
+    Args:
+        storage: (GroupCommit) The daemon's storage.
+        argv:    (list)        The command's arguments.
+    """
+    if argv in (['daemon', '--stop'], ['daemon', '--sync']):
+        ops = storage.sync()
+        return {'out': f'synced {ops} operation{"" if ops == 1 else "s"}\n', 'err': '', 'code': 0}
+    return {'out': '', 'err': 'error: a daemon is already running for this todo file.\n',
+            'code': 1}
+
+
+def serve_request(todo_file, storage, request):
+    """Run one command in the daemon and return its output and exit code.
+
+    The standard streams and working directory are the client's for the
+      duration of the command. If the command fails, it may have changed the
+      in-memory data without saving it, so the data is loaded again next time.
+      Saves that are due (always, with the 'op' durability level) are written
+      before returning, so write errors are the command's errors.
+
+    Args:
+        todo_file: (String)      Absolute path of the .todo configuration file.
+        storage:   (GroupCommit) Backend to load and save 'todo_file' with.
+        request:   (dict)        The client's request (see serve()).
+    """
+    import io
+    import traceback
+
+    streams = sys.stdin, sys.stdout, sys.stderr
+    cwd = os.getcwd()
+    sys.stdin = io.StringIO(request.get('stdin') or '')
+    sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+    code = 0
+    try:
+        os.chdir(request['cwd'])
+        try:
+            main(todo_file, request['argv'], storage)
+        except SystemExit as e:
+            if e.code:
+                raise
+        if storage.due():
+            storage.sync()
+    except SystemExit as e:
+        code = e.code
+    except Exception:
+        traceback.print_exc()
+        code = 1
+    finally:
+        out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+        sys.stdin, sys.stdout, sys.stderr = streams
+        os.chdir(cwd)
+
+    if isinstance(code, str):
+        err += code + '\n'
+        code = 1
+    if code:
+        storage.forget()
+    return {'out': out, 'err': err, 'code': code or 0}
+
+
+def receive(conn):
+    """Return everything sent over a connection until the sender's EOF."""
+    chunks = []
+    while True:
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            return b''.join(chunks).decode()
+        chunks.append(chunk)
+
+
+def request_daemon(path, request):
+    """Send a request to the daemon listening on 'path' and return its reply.
+
+    Returns None if no daemon is listening.
+
+    Args:
+        path:    (String) Path of the daemon's socket.
+        request: (dict)   The request (see serve()).
+    """
+    import socket
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError:
+        conn.close()
+        return None
+    with conn:
+        conn.sendall(json.dumps(request).encode())
+        conn.shutdown(socket.SHUT_WR)
+        return json.loads(receive(conn))
+
+
+def forward(todo_file, argv):
+    """Run a command in the daemon serving 'todo_file', if one is running.
+
+    Commands that draw the list with curses need the client's terminal, and
+      the HTTP API and interactive sessions run in a process of their own, so
+      they're never forwarded.
+
+    Args:
+        todo_file: (String) Absolute path of the .todo configuration file.
+        argv:      (list)   Command-line arguments, without the program name.
+
+    Returns:
+        The command's exit code, or None if it has to be run in-process.
+    """
+    path = socket_path(todo_file)
+    if not os.path.exists(path) or (draws(argv) and sys.stdout.isatty()) or \
+            argv[:1] in (['serve'], ['tui']):
+        return None
+
+    reply = request_daemon(path, {
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': {name: os.environ.get(name) for name in STORAGE_ENV},
+        'stdin': sys.stdin.read() if reads_stdin(argv) else None,
+    })
+    if reply is None or reply.get('local'):
+        return None
+
+    sys.stdout.write(reply['out'])
+    sys.stderr.write(reply['err'])
+    return reply['code']
+
+
+def draws(argv):
+    """Return whether a command displays the list (see Todo.show()).
+
+    Args:
+        argv: (list) Command-line arguments, without the program name.
+    """
+    if '--plain' in argv or '--color' in argv:
+        return False
+    return not argv or (argv[0] not in MODES and
+                        not any(arg.startswith('-') for arg in argv[1:]))
+
+
+def reads_stdin(argv):
+    """Return whether a command reads its input from stdin (see batch()).
+
+    Args:
+        argv: (list) Command-line arguments, without the program name.
+    """
+    if argv[:1] not in (['batch'], ['import']):
+        return False
+    args = iter(argv[1:])
+    files = []
+    for arg in args:
+        if arg in ('-f', '--format'):
+            next(args, None)
+        elif arg == '-' or not arg.startswith('-'):
+            files.append(arg)
+    return files in ([], ['-'])
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                  HTTP API
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+class ApiError(Exception):
+    """A request the API can't carry out.
+
+    Args:
+        status:  (int)    HTTP status code of the response.
+        message: (String) Description of the problem.
+    """
+    def __init__(self, status, message):
+        """Constructor. See class docstring."""
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'ApiError({self.status}, {self.message})'
+
+
+class Api(object):
+    """JSON API over the todo file, used by `todo serve`.
+
+    Modifying requests are translated into command-line arguments and run
+      through main() like commands sent to the daemon (see serve_request()),
+      so they're validated, recorded, and written the same way as commands
+      run from the shell. Projects are shown with their tasks in order, and
+      tasks are referred to by their position ("id"), as on the command line.
+
+    Routes:
+        GET    /projects                          List project names.
+        POST   /projects                {name}    Create a project.
+        GET    /projects/P[?section=S]            Show a project.
+        DELETE /projects/P                        Delete a project.
+        POST   /projects/P/rename       {name}    Rename a project.
+        POST   /projects/P/tasks        {label, [section], [position]}
+                                                  Add or insert a task.
+        POST   /projects/P/tasks/delete {ids}     Delete tasks.
+        POST   /projects/P/check        {ids}     Check tasks.
+        POST   /projects/P/uncheck      {ids}     Uncheck tasks.
+        POST   /projects/P/move         {id, project, [section]}
+                                                  Move a task.
+        POST   /projects/P/unsection    {ids}     Move tasks out of sections.
+        POST   /projects/P/sections     {name}    Add a section.
+        DELETE /projects/P/sections/S             Delete a section.
+        POST   /projects/P/sections/S/rename {name}
+                                                  Rename a section.
+        POST   /archive                 {[project], [section]}
+                                                  Archive completed tasks.
+        POST   /sync                              Write held changes now.
+
+    Saves are coalesced according to 'durability' (see GroupCommit).
+
+    Args:
+        todo_file:  (String)  Absolute path of the .todo configuration file.
+        storage:    (Storage) Backend to load and save 'todo_file' with.
+        durability: (String)  Durability level (see get_durability()).
+        log:        (file)    Where to report each write, if anywhere.
+    """
+    routes = [
+        ('GET', ('projects',), 'list_projects'),
+        ('POST', ('projects',), 'create_project'),
+        ('GET', ('projects', None), 'show_project'),
+        ('DELETE', ('projects', None), 'delete_project'),
+        ('POST', ('projects', None, 'rename'), 'rename_project'),
+        ('POST', ('projects', None, 'tasks'), 'add_task'),
+        ('POST', ('projects', None, 'tasks', 'delete'), 'delete_tasks'),
+        ('POST', ('projects', None, 'check'), 'check_tasks'),
+        ('POST', ('projects', None, 'uncheck'), 'uncheck_tasks'),
+        ('POST', ('projects', None, 'move'), 'move_task'),
+        ('POST', ('projects', None, 'unsection'), 'unsection_tasks'),
+        ('POST', ('projects', None, 'sections'), 'add_section'),
+        ('DELETE', ('projects', None, 'sections', None), 'delete_section'),
+        ('POST', ('projects', None, 'sections', None, 'rename'), 'rename_section'),
+        ('POST', ('archive',), 'archive'),
+        ('POST', ('sync',), 'sync'),
+    ]
+
+    def __init__(self, todo_file, storage, durability='op', log=None):
+        """Constructor. See class docstring."""
+        self.todo_file = todo_file
+        self.storage = GroupCommit(storage, durability, log)
+
+    def __repr__(self):
+        """Return attributes."""
+        return f'Api({self.todo_file}, {self.storage})'
+
+    def dispatch(self, method, target, body):
+        """Handle a request and return its status code and JSON reply.
+
+        Args:
+            method: (String) HTTP method.
+            target: (String) Request target (path and query).
+            body:   (bytes)  Request body, a JSON object if not empty.
+        """
+        from urllib.parse import parse_qs, unquote, urlsplit
+
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            try:
+                params = json.loads(body) if body else {}
+            except ValueError:
+                raise ApiError(400, 'request body is not valid JSON.')
+            if not isinstance(params, dict):
+                raise ApiError(400, 'request body must be a JSON object.')
+
+            allowed = []
+            for route_method, pattern, handler in self.routes:
+                if len(pattern) != len(parts) or any(
+                        name and part != name for part, name in zip(parts, pattern)):
+                    continue
+                if route_method == method:
+                    names = [part for part, name in zip(parts, pattern) if not name]
+                    return 200, getattr(self, handler)(*names, params=params, query=query)
+                allowed.append(route_method)
+            if allowed:
+                raise ApiError(405, f'{url.path} only supports {", ".join(allowed)}.')
+            raise ApiError(404, f'no route for {url.path}.')
+        except ApiError as e:
+            return e.status, {'error': e.message}
+
+    def run(self, argv):
+        """Run a command, raising an ApiError if it fails.
+
+        Args:
+            argv: (list) Command-line arguments, without the program name.
+        """
+        reply = serve_request(self.todo_file, self.storage, {'argv': argv, 'cwd': os.getcwd()})
+        if reply['code']:
+            lines = reply['err'].strip().splitlines() or ['command failed.']
+            raise ApiError(400, lines[-1])
+
+    @staticmethod
+    def param(params, name, kind=str):
+        """Return a required parameter of a request.
+
+        Args:
+            params: (dict) Parameters of the request.
+            name:   (String) Name of the parameter.
+            kind:   (type)   Type the parameter must have.
+        """
+        value = params.get(name)
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise ApiError(400, f'"{name}" must be given as a {kind.__name__}.')
+        return value
+
+    def ids(self, params):
+        """Return the "ids" parameter as command-line arguments."""
+        ids = self.param(params, 'ids', list)
+        if not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            raise ApiError(400, '"ids" must be a list of task positions.')
+        return [str(i) for i in ids]
+
+    def project_view(self, project, section=None):
+        """Return a project with its sections and tasks.
+
+        Args:
+            project: (String) Name of the project.
+            section: (String) Only include the tasks of this section.
+        """
+        self.storage.lock.acquire()
+        try:
+            data = self.storage.load()
+            if project not in data:
+                raise ApiError(404, f'project "{project}" does not exist.')
+            proj = data[project]
+            if section is not None and section not in proj['sections']:
+                raise ApiError(404, f'section "{section}" of project "{project}" does not exist.')
+
+            tasks = []
+            for position, task_id in enumerate(proj['order'], 1):
+                task_section = proj['sections'].section_of(task_id)
+                if section is None or task_section == section:
+                    tasks.append({'id': position,
+                                  'label': proj['tasks'][str(task_id)],
+                                  'section': task_section,
+                                  'checked': task_id in proj['check']})
+            return {'name': project, 'sections': list(proj['sections']), 'tasks': tasks}
+        finally:
+            self.storage.lock.release()
+
+    def list_projects(self, params, query):
+        """Return the names of all projects."""
+        self.storage.lock.acquire()
+        try:
+            return {'projects': list(self.storage.load())}
+        finally:
+            self.storage.lock.release()
+
+    def create_project(self, params, query):
+        """Create a project."""
+        name = self.param(params, 'name')
+        self.run(['create', name])
+        return self.project_view(name)
+
+    def show_project(self, project, params, query):
+        """Return a project, or only one of its sections."""
+        return self.project_view(project, query.get('section'))
+
+    def delete_project(self, project, params, query):
+        """Delete a project."""
+        self.run(['delete', project])
+        return self.list_projects(params, query)
+
+    def rename_project(self, project, params, query):
+        """Rename a project."""
+        name = self.param(params, 'name')
+        self.run([project, f'--rename={name}'])
+        return self.project_view(name)
+
+    def add_task(self, project, params, query):
+        """Add a task, or insert it at a position."""
+        label = self.param(params, 'label')
+        section = [self.param(params, 'section')] if params.get('section') is not None else []
+        if params.get('position') is None:
+            self.run([project, *section, f'--add={label}'])
+        else:
+            position = str(self.param(params, 'position', int))
+            self.run([project, *section, '--insert', position, label])
+        return self.project_view(project)
+
+    def delete_tasks(self, project, params, query):
+        """Delete tasks."""
+        self.run([project, '--taskdelete', *self.ids(params)])
+        return self.project_view(project)
+
+    def check_tasks(self, project, params, query):
+        """Mark tasks as complete."""
+        self.run([project, '--check', *self.ids(params)])
+        return self.project_view(project)
+
+    def uncheck_tasks(self, project, params, query):
+        """Mark tasks as incomplete."""
+        self.run([project, '--uncheck', *self.ids(params)])
+        return self.project_view(project)
+
+    def move_task(self, project, params, query):
+        """Move a task to a different project or section."""
+        task = str(self.param(params, 'id', int))
+        target = self.param(params, 'project')
+        if params.get('section') is None:
+            self.run([project, '--move_to_proj', task, target])
+        else:
+            self.run([project, '--move_to_sect', task, target, self.param(params, 'section')])
+        return self.project_view(project)
+
+    def unsection_tasks(self, project, params, query):
+        """Move tasks out of their sections."""
+        self.run([project, '--unsect', *self.ids(params)])
+        return self.project_view(project)
+
+    def add_section(self, project, params, query):
+        """Add a section."""
+        self.run([project, f'--sectionadd={self.param(params, "name")}'])
+        return self.project_view(project)
+
+    def delete_section(self, project, section, params, query):
+        """Delete a section."""
+        self.run([project, f'--sectiondelete={section}'])
+        return self.project_view(project)
+
+    def rename_section(self, project, section, params, query):
+        """Rename a section."""
+        self.run([project, section, f'--rename={self.param(params, "name")}'])
+        return self.project_view(project)
+
+    def archive(self, params, query):
+        """Archive completed tasks of all projects, a project, or a section."""
+        argv = ['archive']
+        for name in ('project', 'section'):
+            if params.get(name) is not None:
+                argv.append(self.param(params, name))
+        self.run(argv)
+        return self.list_projects(params, query)
+
+    def sync(self, params, query):
+        """Write held changes and return how many saves the write covered."""
+        return {'ops': self.storage.sync()}
+
+
+def serve_http(todo_file, storage, host, port):
+    """Serve the JSON API (see Api) over HTTP until interrupted.
+
+    Connections are handled on an asyncio event loop, so any number of
+      clients can stay connected while their changes are applied in order to
+      one in-memory copy of the todo file. Requests are run one at a time in
+      a worker thread, since they may wait for the file lock, which would
+      otherwise stall every connection. Connections are kept alive between
+      requests unless the client asks otherwise. Held saves (see
+      GroupCommit) are written by a timer once they're due.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+        host:      (String)  Address to listen on.
+        port:      (int)     Port to listen on.
+    """
+    import asyncio
+    import signal
+    import time
+    from http import HTTPStatus
+
+    api = Api(todo_file, storage, get_durability(), sys.stderr)
+    lock = None
+    timer = None
+    syncing = set()
+
+    async def run(function, *args):
+        async with lock:
+            return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    def sync():
+        # keep a reference so the task isn't collected before it's done
+        task = asyncio.ensure_future(run(api.storage.sync))
+        syncing.add(task)
+        task.add_done_callback(syncing.discard)
+
+    def schedule_sync():
+        nonlocal timer
+        if timer:
+            timer.cancel()
+            timer = None
+        deadline = api.storage.deadline()
+        if deadline is not None:
+            timer = asyncio.get_running_loop().call_later(
+                max(deadline - time.monotonic(), 0), sync)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+
+                status, reply = await run(api.dispatch, method, target, body)
+                schedule_sync()
+                payload = json.dumps(reply).encode()
+                keep_alive = (version == 'HTTP/1.1' and
+                              headers.get('connection', '').lower() != 'close')
+                writer.write(f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n'
+                             'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                             '\r\n'.encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def listen():
+        nonlocal lock
+        lock = asyncio.Lock()
+        try:
+            server = await asyncio.start_server(handle, host, port)
+        except OSError as e:
+            sys.exit(f'error: can\'t listen on {host}:{port}: {e.strerror}.')
+        print(f'Serving on http://{host}:{port}', flush=True)
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                # stopped by SIGTERM
+                pass
+
+    try:
+        asyncio.run(listen())
+    finally:
+        api.storage.sync()
+
+
+"""
+[+++++++++++++++++++++++++++++++++++++++++++++]
+                   Main
+[+++++++++++++++++++++++++++++++++++++++++++++]
+"""
+
+
+def batch(todo_file, storage, path):
+    """Run commands from a file, one per line, and write the result once.
+
+    Lines use the same syntax as the command line, without the program name
+      (e.g., `proj -a "New task"`). Empty lines and lines starting with # are
+      skipped. Commands run against one in-memory copy of the todo file. If
+      any of them fails, the batch stops and nothing is written.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+        path:      (String)  File to read commands from, or - for stdin.
+    """
+    import shlex
+
+    storage = BatchStorage(storage)
+    try:
+        f = sys.stdin if path == '-' else open(path)
+    except OSError as e:
+        sys.exit(f'error: can\'t read "{path}": {e.strerror}.')
+    try:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            try:
+                args = create_parser(None, todo_file, storage, shlex.split(line))
+                if args.batch:
+                    sys.exit('error: batches can\'t be nested.')
+                todo = Todo(None, args, todo_file, storage)
+                command = todo.command()
+                if command == todo.show:
+                    sys.exit('error: batches can\'t display projects.')
+                command()
+            except (SystemExit, ValueError) as e:
+                storage.forget()
+                message = e.code if isinstance(e, SystemExit) else f'error: {e}.'
+                if not isinstance(message, str):
+                    message = 'error: command can\'t be run in a batch.'
+                sys.exit(f'line {line_no}: {message} No changes were made.')
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    storage.commit()
+
+
+def export(storage, project, fmt):
+    """Write a project, or all projects, to stdout as records.
+
+    Args:
+        storage: (Storage) Backend to load the todo file with.
+        project: (String)  Name of the project to export, or None for all.
+        fmt:     (String)  Format of the records (see write_records()).
+    """
+    data = storage.load()
+    if project and project not in data:
+        sys.exit(f'error: project "{project}" does not exist.')
+
+    try:
+        write_records(export_records(data, [project] if project else None), sys.stdout, fmt)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader (e.g., head) went away; don't complain on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def import_file(todo_file, storage, args):
+    """Add the records in a file (or stdin) to the todo file in one write.
+
+    The format is taken from the file's extension (.csv or anything else for
+      JSONL) unless it's given.
+
+    Args:
+        todo_file: (String)    Absolute path of the .todo configuration file.
+        storage:   (Storage)   Backend to load and save 'todo_file' with.
+        args:      (Namespace) Parsed arguments of import mode.
+    """
+    fmt = args.format or ('csv' if args.file.endswith('.csv') else 'jsonl')
+    try:
+        f = sys.stdin if args.file == '-' else open(args.file, newline='')
+    except OSError as e:
+        sys.exit(f'error: can\'t read "{args.file}": {e.strerror}.')
+
+    try:
+        Todo(None, args, todo_file, storage).import_records(read_records(f, fmt))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def history(todo_file, args):
+    """Write archived tasks to stdout (see ArchiveStore).
+
+    Args:
+        todo_file: (String)    Absolute path of the .todo configuration file.
+        args:      (Namespace) Parsed arguments of history mode.
+    """
+    records = ArchiveStore(todo_file).read(args.project, args.section,
+                                           args.since, args.until)
+    try:
+        for record in records:
+            if args.format == 'jsonl':
+                sys.stdout.write(json.dumps(record) + '\n')
+                continue
+            place = record['project']
+            if record['section']:
+                place += f'/{record["section"]}'
+            sys.stdout.write(f'{record["archived"].replace("T", " ")}  {place}  {record["label"]}\n')
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader (e.g., head) went away; don't complain on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def search(todo_file, storage, args):
+    """Write the tasks and sections matching the search terms to stdout.
+
+    Every term has to match the beginning of a word in the task's label (or
+      the section's name), ignoring case. Results are listed in project order,
+      with sections before tasks, and tasks by position. The search index is
+      built the first time (see SearchIndex).
+
+    Args:
+        todo_file: (String)    Absolute path of the .todo configuration file.
+        storage:   (Storage)   Backend to load 'todo_file' with.
+        args:      (Namespace) Parsed arguments of search mode.
+    """
+    query = ' '.join(args.terms)
+    if not SearchIndex.terms(query):
+        sys.exit('error: no words to search for.')
+
+    data = storage.load()
+    index = SearchIndex(todo_file)
+    if args.rebuild or not index.exists():
+        index.rebuild(data)
+
+    hits = {}
+    for project, task_id, name in index.search(query):
+        hits.setdefault(project, []).append((task_id, name))
+
+    results = []
+    for rank, project in enumerate(data):
+        if project not in hits:
+            continue
+        proj = data[project]
+        positions = None
+        for task_id, name in hits[project]:
+            if task_id is None:
+                if name in proj['sections']:
+                    results.append((rank, 0, list(proj['sections']).index(name), {
+                        'project': project, 'section': name, 'id': None, 'label': None}))
+                continue
+            if proj['tasks'].get(str(task_id)) != name:
+                # changed without the index (e.g., by hand); --rebuild fixes it
+                continue
+            if positions is None:
+                positions = {tid: position for position, tid in enumerate(proj['order'], 1)}
+            results.append((rank, 1, positions[task_id], {
+                'project': project, 'section': proj['sections'].section_of(task_id),
+                'id': positions[task_id], 'label': name}))
+
+    try:
+        for *_, result in sorted(results, key=lambda result: result[:3]):
+            if args.format == 'jsonl':
+                sys.stdout.write(json.dumps(result) + '\n')
+                continue
+            place = result['project']
+            if result['section']:
+                place += f'/{result["section"]}'
+            if result['label'] is None:
+                sys.stdout.write(f'{place}\n')
+            else:
+                sys.stdout.write(f'{place}  {result["id"]}  {result["label"]}\n')
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader (e.g., head) went away; don't complain on exit.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def tui(todo_file, storage, project):
+    """Browse and edit the TODO list in an interactive session (see Session).
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+        project:   (String)  Name of the project to show, or None for all.
+    """
+    import curses
+
+    if project and project not in storage.load():
+        sys.exit(f'error: project "{project}" does not exist.')
+    if not sys.stdout.isatty():
+        sys.exit('error: the interactive mode needs a terminal.')
+
+    # the session takes the lock for each command it runs
+    storage.lock.release()
+    # Esc cancels prompts; don't wait long for an escape sequence after it
+    os.environ.setdefault('ESCDELAY', '25')
+    try:
+        curses.wrapper(Session(todo_file, storage, project, get_durability()).run)
+    except curses.error:
+        sys.exit('error: terminal window is not large enough.')
+
+
+def main(todo_file, argv=None, storage=None):
+    """Main program, used when ran as a script.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        argv:      (list)    Command-line arguments, without the program name.
+                               Defaults to sys.argv[1:].
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+                               Defaults to the one chosen by get_storage().
+    """
+    # checked before the lock is taken, as it's created next to 'todo_file'
+    if not isinstance(todo_file, (str, os.PathLike)):
+        sys.exit(f'error: todo file must be a path, not {todo_file!r}.')
+    storage = storage or get_storage(todo_file)
+    # held from the first load to the last save; show() releases it early
+    storage.lock.acquire()
+    try:
+        run(todo_file, storage, argv)
+    finally:
+        storage.lock.release()
+
+
+def run(todo_file, storage, argv):
+    """Parse the arguments and run the command they select.
+
+    Args:
+        todo_file: (String)  Absolute path of the .todo configuration file.
+        storage:   (Storage) Backend to load and save 'todo_file' with.
+        argv:      (list)    Command-line arguments, without the program name.
+    """
+    parser = create_parser(None, todo_file, storage, argv)
+    if parser.batch:
+        batch(todo_file, storage, parser.file)
+        return
+    elif parser.export:
+        export(storage, parser.project, parser.format)
+        return
+    elif parser.import_:
+        import_file(todo_file, storage, parser)
+        return
+    elif parser.history:
+        history(todo_file, parser)
+        return
+    elif parser.search:
+        search(todo_file, storage, parser)
+        return
+    elif parser.daemon:
+        if parser.stop:
+            sys.exit('error: no daemon is running for this todo file.')
+        elif parser.sync:
+            # without a daemon, every command has already been written
+            return
+        # the daemon takes the lock for each command it serves
+        storage.lock.release()
+        serve(todo_file, storage)
+        return
+    elif parser.serve:
+        # the API takes the lock for each request it handles
+        storage.lock.release()
+        serve_http(todo_file, storage, parser.host, parser.port)
+        return
+    elif parser.tui:
+        tui(todo_file, storage, parser.project)
+        return
+
+    todo = Todo(None, parser, todo_file, storage)
+    todo.command()()
 
 if __name__ == '__main__':
     todo_dir = os.path.dirname(os.path.realpath(__file__))
-    todo_file = os.path.join(todo_dir, '.todo')
+    todo_file = os.environ.get('TODO_FILE') or os.path.join(todo_dir, '.todo')
     try:
+        code = forward(todo_file, sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
         main(todo_file=todo_file)
     except KeyboardInterrupt as e:
         sys.exit('keyboard interrupt: exiting')